@@ -0,0 +1,151 @@
+"""
+Autoescala dos processos consumidores pela profundidade da fila
+
+A cada ``intervalo`` segundos o Autoescalador lê da memória compartilhada o
+número de pendentes e o histograma de espera na fila (só as amostras desde a
+leitura anterior) e decide:
+
+- subir um consumidor quando há mais de ``pendentes_subida`` pendentes por
+  consumidor ativo ou o p95 da espera passa de ``espera_p95_max``;
+- retirar um consumidor quando há menos de ``pendentes_descida`` pendentes
+  por consumidor e o p95 da espera está abaixo da metade do limite.
+
+Os limiares de subida e descida são distantes (histerese), a condição precisa
+se repetir por ``ciclos_subida``/``ciclos_descida`` leituras seguidas e cada
+mudança respeita um intervalo mínimo desde a anterior (cooldown, maior para
+descer). O consumidor retirado é drenado: para de retirar pedidos, termina os
+que tem em preparo e sai sozinho.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from shared_memory_manager import percentis_histograma
+
+SUBIR = 1
+MANTER = 0
+DESCER = -1
+
+
+@dataclass
+class ConfiguracaoAutoescala:
+    min_consumidores: int = 1
+    max_consumidores: int = 10
+    # Pendentes por consumidor ativo acima/abaixo dos quais escalar
+    pendentes_subida: float = 4.0
+    pendentes_descida: float = 0.5
+    # p95 da espera na fila (segundos) que também dispara a subida
+    espera_p95_max: float = 10.0
+    # Leituras seguidas exigidas para subir/descer
+    ciclos_subida: int = 2
+    ciclos_descida: int = 5
+    # Intervalo mínimo (segundos) desde a última mudança
+    cooldown_subida: float = 5.0
+    cooldown_descida: float = 15.0
+    intervalo: float = 1.0
+
+
+class Autoescalador:
+    def __init__(self, sistema, configuracao: ConfiguracaoAutoescala,
+                 ao_mudar: Optional[Callable[[str], None]] = None):
+        self.sistema = sistema
+        self.configuracao = configuracao
+        # Recebe uma mensagem a cada subida/descida (ex.: log da interface)
+        self.ao_mudar = ao_mudar
+        self.ciclos_acima = 0
+        self.ciclos_abaixo = 0
+        self.ultima_mudanca = None
+        self._baldes_anteriores = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    def espera_p95_recente(self, histograma: dict) -> Optional[float]:
+        """p95 da espera só com as amostras desde a leitura anterior; None se não houver"""
+        baldes = histograma['baldes']
+        anteriores = self._baldes_anteriores
+        self._baldes_anteriores = baldes
+        if anteriores is None:
+            # Primeira leitura: só a referência para a próxima janela
+            return None
+        # Contagens menores que as anteriores: histogramas zerados por limpar()
+        recentes = [max(0, atual - anterior) for atual, anterior in zip(baldes, anteriores)]
+        amostras = sum(recentes)
+        if amostras <= 0:
+            return None
+        janela = {'amostras': amostras, 'soma': 0, 'maximo': histograma['maximo'], 'baldes': recentes}
+        return percentis_histograma(janela, (95,))['p95']
+
+    def avaliar(self, pendentes: int, espera_p95: Optional[float], ativos: int,
+                agora: Optional[float] = None) -> int:
+        """Decide SUBIR, DESCER ou MANTER a partir de uma leitura"""
+        cfg = self.configuracao
+        agora = time.monotonic() if agora is None else agora
+        if ativos < cfg.min_consumidores:
+            return SUBIR
+        if ativos > cfg.max_consumidores:
+            return DESCER
+
+        por_consumidor = pendentes / max(1, ativos)
+        sobrecarga = por_consumidor > cfg.pendentes_subida or \
+            (espera_p95 is not None and espera_p95 > cfg.espera_p95_max)
+        ocioso = por_consumidor < cfg.pendentes_descida and \
+            (espera_p95 is None or espera_p95 < cfg.espera_p95_max / 2)
+        self.ciclos_acima = self.ciclos_acima + 1 if sobrecarga else 0
+        self.ciclos_abaixo = self.ciclos_abaixo + 1 if ocioso else 0
+
+        desde_mudanca = float('inf') if self.ultima_mudanca is None else agora - self.ultima_mudanca
+        if self.ciclos_acima >= cfg.ciclos_subida and ativos < cfg.max_consumidores and \
+                desde_mudanca >= cfg.cooldown_subida:
+            return SUBIR
+        if self.ciclos_abaixo >= cfg.ciclos_descida and ativos > cfg.min_consumidores and \
+                desde_mudanca >= cfg.cooldown_descida:
+            return DESCER
+        return MANTER
+
+    def passo(self):
+        """Uma leitura da memória compartilhada e, se for o caso, uma mudança"""
+        sistema = self.sistema
+        sistema.recolher_consumidores_drenados()
+        ativos = len(sistema.consumidores_ativos())
+        estatisticas = sistema.shm_manager.obter_estatisticas()
+        espera_p95 = self.espera_p95_recente(sistema.shm_manager.obter_histogramas()['espera'])
+
+        decisao = self.avaliar(estatisticas.get('em_fila', 0), espera_p95, ativos)
+        if decisao == MANTER:
+            return
+        self.ultima_mudanca = time.monotonic()
+        self.ciclos_acima = self.ciclos_abaixo = 0
+        if decisao == SUBIR:
+            consumidor_id = sistema.adicionar_consumidor()
+            mensagem = f"📈 Autoescala: consumidor {consumidor_id} adicionado " \
+                       f"({estatisticas.get('em_fila', 0)} pendentes, {ativos + 1} ativos)"
+        else:
+            consumidor_id = sistema.drenar_consumidor()
+            if consumidor_id is None:
+                return
+            mensagem = f"📉 Autoescala: drenando consumidor {consumidor_id} " \
+                       f"({estatisticas.get('em_fila', 0)} pendentes, {ativos - 1} ativos)"
+        print(mensagem)
+        if self.ao_mudar:
+            self.ao_mudar(mensagem)
+
+    def _executar(self):
+        while not self._parar.wait(self.configuracao.intervalo):
+            try:
+                self.passo()
+            except Exception as e:
+                print(f"Erro na autoescala: {e}")
+
+    def iniciar(self):
+        self._parar.clear()
+        self._baldes_anteriores = None
+        self.ciclos_acima = self.ciclos_abaixo = 0
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
@@ -0,0 +1,6 @@
+"""Benchmarks da memória compartilhada (executar a partir da raiz do repositório)
+
+    python -m benchmarks.operacoes        microbenchmarks por operação
+    python -m benchmarks.ponta_a_ponta    produtores -> fila -> consumidores
+    python -m benchmarks.comparar A B     compara dois resultados JSON
+"""
@@ -0,0 +1,87 @@
+"""
+Compara dois resultados JSON de benchmark (base e candidato)
+
+Imprime, métrica a métrica, a razão candidato/base e marca regressões acima do
+limiar: vazão menor ou latência maior. Sai com código 1 se houver regressão,
+para uso em scripts de integração.
+
+Uso: python -m benchmarks.comparar base.json candidato.json [--limiar 10]
+"""
+import argparse
+import json
+import sys
+
+# Campos que identificam uma medição dentro da lista de resultados
+CAMPOS_IDENTIFICACAO = ('residentes', 'politica', 'produtores', 'consumidores', 'cozinheiros', 'lote_item')
+
+
+def _metricas(no, caminho=()):
+    """Achata o JSON em {caminho: valor} só com vazões e latências"""
+    if isinstance(no, dict):
+        for chave, valor in no.items():
+            if chave not in CAMPOS_IDENTIFICACAO:
+                yield from _metricas(valor, caminho + (chave,))
+    elif isinstance(no, (int, float)) and not isinstance(no, bool):
+        if caminho[-1] == 'ops_por_segundo' or any(parte.startswith('latencia') for parte in caminho):
+            yield caminho, float(no)
+
+
+def carregar(caminho_arquivo: str) -> dict:
+    with open(caminho_arquivo, encoding='utf-8') as arquivo:
+        dados = json.load(arquivo)
+
+    metricas = {}
+    for resultado in dados.get('resultados', []):
+        identificacao = ' '.join(f"{campo}={resultado[campo]}" for campo in CAMPOS_IDENTIFICACAO
+                                 if campo in resultado)
+        for caminho, valor in _metricas(resultado):
+            metricas[(identificacao,) + caminho] = valor
+    return dados, metricas
+
+
+def comparar(base: dict, candidato: dict, limiar: float):
+    """Lista (métrica, base, candidato, razão, regrediu) das métricas em comum"""
+    linhas = []
+    for chave in sorted(base.keys() & candidato.keys()):
+        valor_base, valor_candidato = base[chave], candidato[chave]
+        if not valor_base:
+            continue
+        razao = valor_candidato / valor_base
+        if chave[-1] == 'ops_por_segundo':
+            regrediu = razao < 1 - limiar / 100
+        else:
+            regrediu = razao > 1 + limiar / 100
+        linhas.append((' '.join(chave), valor_base, valor_candidato, razao, regrediu))
+    return linhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dois resultados de benchmark")
+    parser.add_argument('base')
+    parser.add_argument('candidato')
+    parser.add_argument('--limiar', type=float, default=10.0,
+                        help="variação percentual tolerada antes de acusar regressão (padrão: 10)")
+    args = parser.parse_args()
+
+    dados_base, base = carregar(args.base)
+    dados_candidato, candidato = carregar(args.candidato)
+    if dados_base.get('benchmark') != dados_candidato.get('benchmark'):
+        print(f"Benchmarks diferentes: {dados_base.get('benchmark')} x {dados_candidato.get('benchmark')}")
+        return 2
+
+    print(f"base:      {dados_base['ambiente'].get('commit')} ({dados_base['ambiente'].get('data')})")
+    print(f"candidato: {dados_candidato['ambiente'].get('commit')} ({dados_candidato['ambiente'].get('data')})\n")
+
+    linhas = comparar(base, candidato, args.limiar)
+    largura = max((len(metrica) for metrica, *_ in linhas), default=0)
+    for metrica, valor_base, valor_candidato, razao, regrediu in linhas:
+        marca = '  REGRESSÃO' if regrediu else ''
+        print(f"{metrica:<{largura}}  {valor_base:>12.2f}  {valor_candidato:>12.2f}  {razao:>6.2f}x{marca}")
+
+    regressoes = sum(1 for *_, regrediu in linhas if regrediu)
+    print(f"\n{len(linhas)} métricas comparadas, {regressoes} regressões (limiar {args.limiar:g}%)")
+    return 1 if regressoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
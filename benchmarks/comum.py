@@ -0,0 +1,59 @@
+"""Utilitários compartilhados pelos benchmarks: percentis, ambiente e saída JSON"""
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+DIRETORIO_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resultados')
+
+
+def percentis(valores, pontos=(50, 99, 99.9)) -> dict:
+    """Percentis por posição mais próxima; chaves 'p50', 'p99', 'p999', ..."""
+    ordenados = sorted(valores)
+    resultado = {}
+    for ponto in pontos:
+        chave = 'p' + f"{ponto:g}".replace('.', '')
+        if not ordenados:
+            resultado[chave] = None
+            continue
+        posicao = max(0, math.ceil(ponto / 100 * len(ordenados)) - 1)
+        resultado[chave] = ordenados[posicao]
+    return resultado
+
+
+def ambiente() -> dict:
+    """Dados da máquina e da versão do código, para comparar execuções"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, timeout=5,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'python': sys.version.split()[0],
+        'plataforma': platform.platform(),
+        'processador': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'commit': commit,
+        'data': datetime.now().isoformat(timespec='seconds')
+    }
+
+
+def salvar_resultados(nome: str, parametros: dict, resultados: list, saida=None) -> str:
+    """Grava o JSON do benchmark; retorna o caminho do arquivo"""
+    if saida is None:
+        os.makedirs(DIRETORIO_RESULTADOS, exist_ok=True)
+        carimbo = datetime.now().strftime("%Y%m%d_%H%M%S")
+        saida = os.path.join(DIRETORIO_RESULTADOS, f"{nome}_{carimbo}.json")
+
+    with open(saida, 'w', encoding='utf-8') as arquivo:
+        json.dump({
+            'benchmark': nome,
+            'ambiente': ambiente(),
+            'parametros': parametros,
+            'resultados': resultados
+        }, arquivo, indent=2, ensure_ascii=False)
+    return saida
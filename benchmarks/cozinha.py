@@ -0,0 +1,130 @@
+"""
+Benchmark da cozinha: pedidos por segundo por cozinheiro com e sem lotes
+
+Os pedidos (itens sorteados do cardápio) são todos enfileirados antes da
+largada; os cozinheiros os retiram um a um ou em lotes do mesmo item e
+dormem o tempo de preparo do modelo de ``consumer.tempo_preparo``, com tempos
+em milissegundos. Mede a vazão total, a vazão por cozinheiro e o tempo da
+largada até a conclusão de cada pedido, para cada tamanho de lote.
+
+Uso: python -m benchmarks.cozinha [--lotes 1,2,4,8] [--cozinheiros 1,2,4]
+"""
+import argparse
+import random
+import time
+
+from shared_memory_manager import Pedido, PedidoStatus
+from sharded_memory_manager import abrir_memoria_compartilhada
+from producer import Produtor
+from consumer import tempo_preparo
+from supervisor import Supervisor, aguardar_largada
+from benchmarks.comum import percentis, salvar_resultados
+
+NOME_SEGMENTO = 'bench_cozinha'
+TIMEOUT_COZINHEIRO = 0.1
+
+
+def cozinheiro(indice: int, lote_item: int, espera_max: float, tempo_min: float, tempo_max: float,
+               fim_producao, largada=None):
+    m = abrir_memoria_compartilhada(name=NOME_SEGMENTO)
+    try:
+        aguardar_largada(largada)
+        while True:
+            if lote_item > 1:
+                pedidos = m.aguardar_lote_mesmo_item(indice, lote_item, espera_max, timeout=TIMEOUT_COZINHEIRO)
+            else:
+                pedidos = m.aguardar_pedidos(indice, 1, timeout=TIMEOUT_COZINHEIRO)
+            if pedidos:
+                time.sleep(tempo_preparo(pedidos[0].item, len(pedidos), tempo_min, tempo_max))
+                m.finalizar_pedidos([pedido.id for pedido in pedidos], indice)
+            elif fim_producao.is_set():
+                break
+    finally:
+        m.close()
+
+
+def medir(cozinheiros: int, lote_item: int, pedidos: int, espera_max: float,
+          tempo_min: float, tempo_max: float, semente: int) -> dict:
+    m = abrir_memoria_compartilhada(name=NOME_SEGMENTO, create=True,
+                                    capacidade_inicial=pedidos, capacidade_maxima=pedidos * 2)
+    supervisor = Supervisor()
+    fim_producao = supervisor.contexto.Event()
+    try:
+        sorteio = random.Random(semente)
+        agora = time.time()
+        m.adicionar_pedidos([Pedido(i, i % 20 + 1, sorteio.choice(Produtor.ITENS_MENU), agora,
+                                    PedidoStatus.PENDENTE.value, 1) for i in range(1, pedidos + 1)])
+        fim_producao.set()
+
+        processos = supervisor.iniciar([(cozinheiro, (i, lote_item, espera_max, tempo_min, tempo_max,
+                                                      fim_producao), {})
+                                        for i in range(1, cozinheiros + 1)])
+        inicio = supervisor.inicio_execucao
+        for processo in processos:
+            processo.join()
+
+        latencias = []
+        ultima_conclusao = inicio
+        for registro in m.arquivo.iterar():
+            latencias.append((registro.concluido_em - inicio) * 1000)
+            ultima_conclusao = max(ultima_conclusao, registro.concluido_em)
+        duracao = ultima_conclusao - inicio
+        vazao = len(latencias) / duracao if duracao > 0 else None
+
+        return {
+            'cozinheiros': cozinheiros,
+            'lote_item': lote_item,
+            'pedidos': len(latencias),
+            'duracao': duracao,
+            'ops_por_segundo': vazao,
+            'ops_por_segundo_por_cozinheiro': vazao / cozinheiros if vazao else None,
+            'latencia_ms': {**percentis(latencias), 'max': max(latencias) if latencias else None}
+        }
+    finally:
+        m.unlink()
+        m.close()
+        m.arquivo.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de preparo em lotes do mesmo item")
+    parser.add_argument('--lotes', default='1,2,4,8', help="tamanhos de lote a varrer (padrão: 1,2,4,8)")
+    parser.add_argument('--cozinheiros', default='1,2,4', help="quantidades a varrer (padrão: 1,2,4)")
+    parser.add_argument('--pedidos', type=int, default=400, help="pedidos por combinação (padrão: 400)")
+    parser.add_argument('--tempo-min', type=float, default=0.002, help="preparo mínimo em segundos")
+    parser.add_argument('--tempo-max', type=float, default=0.006, help="preparo máximo em segundos")
+    parser.add_argument('--espera-max', type=float, default=1.0,
+                        help="limite de espera do pedido mais antigo, em segundos (padrão: 1.0)")
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', default=None, help="arquivo JSON (padrão: benchmarks/resultados/)")
+    args = parser.parse_args()
+
+    lista_lotes = [int(valor) for valor in args.lotes.split(',') if valor.strip()]
+    lista_cozinheiros = [int(valor) for valor in args.cozinheiros.split(',') if valor.strip()]
+
+    resultados = []
+    for cozinheiros in lista_cozinheiros:
+        for lote_item in lista_lotes:
+            resultado = medir(cozinheiros, lote_item, args.pedidos, args.espera_max,
+                              args.tempo_min, args.tempo_max, args.semente)
+            resultados.append(resultado)
+            latencia = resultado['latencia_ms']
+            print(f"{cozinheiros:>3} cozinheiros  lote {lote_item:>3}  "
+                  f"{resultado['ops_por_segundo']:>8.0f} pedidos/s  "
+                  f"{resultado['ops_por_segundo_por_cozinheiro']:>8.0f} por cozinheiro   "
+                  f"p50 {latencia['p50']:>8.1f} ms   p99 {latencia['p99']:>8.1f} ms")
+
+    caminho = salvar_resultados('cozinha', {
+        'lotes': lista_lotes,
+        'cozinheiros': lista_cozinheiros,
+        'pedidos': args.pedidos,
+        'tempo_min': args.tempo_min,
+        'tempo_max': args.tempo_max,
+        'espera_max': args.espera_max,
+        'semente': args.semente
+    }, resultados, args.saida)
+    print(f"\nResultados gravados em {caminho}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Microbenchmarks das operações do SharedMemoryManager
+
+Para cada quantidade de pedidos residentes (pendentes na arena), cria uma
+arena nova já dimensionada (o crescimento não entra na medida), preenche-a
+e mede, uma chamada por vez:
+
+    adicionar_pedido       N pedidos novos
+    obter_proximo_pedido   N retiradas
+    finalizar_pedido       os N pedidos retirados (vão para o arquivo em disco)
+    obter_todos_pedidos    arena + arquivo (menos repetições: custa O(n))
+    obter_estatisticas     N leituras
+
+Uso: python -m benchmarks.operacoes [--residentes 0,1000,10000] [--politica edf]
+"""
+import argparse
+import time
+
+from shared_memory_manager import SharedMemoryManager, Pedido, PedidoStatus, PoliticaDespacho
+from benchmarks.comum import percentis, salvar_resultados
+
+RESIDENTES_PADRAO = '0,1000,10000,50000'
+NOME_SEGMENTO = 'bench_operacoes'
+
+
+def _pedido(pedido_id: int, agora: float) -> Pedido:
+    # Prioridades e prazos variados para que PRIORIDADE/EDF exercitem o heap
+    return Pedido(pedido_id, pedido_id % 20 + 1, 'Pizza Margherita', agora,
+                  PedidoStatus.PENDENTE.value, 1,
+                  prioridade=pedido_id % 5, deadline=agora + 60 + pedido_id % 97)
+
+
+def _medir(operacao, argumentos) -> dict:
+    """Executa a operação para cada argumento; vazão total e latência por chamada"""
+    duracoes = []
+    inicio = time.perf_counter()
+    for argumento in argumentos:
+        antes = time.perf_counter_ns()
+        operacao(argumento)
+        duracoes.append(time.perf_counter_ns() - antes)
+    total = time.perf_counter() - inicio
+
+    latencias = percentis(duracoes)
+    return {
+        'operacoes': len(duracoes),
+        'ops_por_segundo': len(duracoes) / total if total > 0 else None,
+        'latencia_us': {chave: valor / 1000 for chave, valor in latencias.items() if valor is not None}
+    }
+
+
+def medir(residentes: int, repeticoes: int, repeticoes_leitura: int, politica: PoliticaDespacho) -> dict:
+    capacidade = residentes + repeticoes + SharedMemoryManager.SLOTS_POR_SEGMENTO
+    # Folga para o limiar de crescimento não disparar durante a medida
+    capacidade = int(capacidade / SharedMemoryManager.LIMIAR_CRESCIMENTO) + 1
+    m = SharedMemoryManager(NOME_SEGMENTO, create=True, capacidade_inicial=capacidade,
+                            capacidade_maxima=capacidade, politica=politica)
+    try:
+        agora = time.time()
+        for inicio in range(0, residentes, 1000):
+            m.adicionar_pedidos([_pedido(i, agora) for i in range(inicio, min(inicio + 1000, residentes))])
+
+        novos = [_pedido(residentes + i, agora) for i in range(repeticoes)]
+        retirados = []
+        operacoes = {
+            'adicionar_pedido': _medir(m.adicionar_pedido, novos),
+            'obter_proximo_pedido': _medir(lambda _: retirados.append(m.obter_proximo_pedido(1)),
+                                           range(repeticoes)),
+        }
+        operacoes['finalizar_pedido'] = _medir(m.finalizar_pedido,
+                                               [pedido.id for pedido in retirados if pedido])
+        operacoes['obter_todos_pedidos'] = _medir(lambda _: m.obter_todos_pedidos(), range(repeticoes_leitura))
+        operacoes['obter_estatisticas'] = _medir(lambda _: m.obter_estatisticas(), range(repeticoes))
+        return {'residentes': residentes, 'politica': politica.value, 'operacoes': operacoes}
+    finally:
+        m.unlink()
+        m.close()
+        m.arquivo.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks do SharedMemoryManager")
+    parser.add_argument('--residentes', default=RESIDENTES_PADRAO,
+                        help=f"quantidades de pedidos residentes, separadas por vírgula (padrão: {RESIDENTES_PADRAO})")
+    parser.add_argument('--repeticoes', type=int, default=2000)
+    parser.add_argument('--repeticoes-leitura', type=int, default=20,
+                        help="repetições de obter_todos_pedidos (padrão: 20)")
+    parser.add_argument('--politica', choices=[p.value for p in PoliticaDespacho] + ['todas'],
+                        default=PoliticaDespacho.FIFO.value)
+    parser.add_argument('--saida', default=None, help="arquivo JSON (padrão: benchmarks/resultados/)")
+    args = parser.parse_args()
+
+    residentes = [int(valor) for valor in args.residentes.split(',') if valor.strip()]
+    politicas = list(PoliticaDespacho) if args.politica == 'todas' else [PoliticaDespacho(args.politica)]
+
+    resultados = []
+    for politica in politicas:
+        for quantidade in residentes:
+            resultado = medir(quantidade, args.repeticoes, args.repeticoes_leitura, politica)
+            resultados.append(resultado)
+            for nome, medida in resultado['operacoes'].items():
+                print(f"{politica.value:>10} {quantidade:>7} residentes  {nome:<22}"
+                      f"{medida['ops_por_segundo']:>12.0f} ops/s   "
+                      f"p50 {medida['latencia_us']['p50']:>9.1f} us   "
+                      f"p99 {medida['latencia_us']['p99']:>9.1f} us")
+
+    caminho = salvar_resultados('operacoes', {
+        'residentes': residentes,
+        'repeticoes': args.repeticoes,
+        'repeticoes_leitura': args.repeticoes_leitura,
+        'politicas': [politica.value for politica in politicas]
+    }, resultados, args.saida)
+    print(f"\nResultados gravados em {caminho}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark de ponta a ponta: produtores -> memória compartilhada -> consumidores
+
+Para cada combinação de produtores e consumidores, os produtores enviam o
+total de pedidos o mais rápido possível (laço fechado, em lotes) e os
+consumidores os retiram e finalizam sem tempo de preparo. A latência de cada
+pedido (criação até conclusão) e a vazão vêm do arquivo de concluídos,
+gravado pelo próprio SharedMemoryManager.
+
+Uso: python -m benchmarks.ponta_a_ponta [--produtores 1,2,4] [--consumidores 1,2,4]
+"""
+import argparse
+import time
+
+from shared_memory_manager import Pedido, PedidoStatus, PoliticaDespacho
+from sharded_memory_manager import abrir_memoria_compartilhada
+from supervisor import Supervisor, aguardar_largada
+from benchmarks.comum import percentis, salvar_resultados
+
+NOME_SEGMENTO = 'bench_ponta_a_ponta'
+# Faixa de ids por produtor
+IDS_POR_PRODUTOR = 10 ** 9
+# Espera quando a fila está cheia ou vazia
+PAUSA_FILA_CHEIA = 0.001
+TIMEOUT_CONSUMIDOR = 0.1
+
+
+def produtor(indice: int, num_fragmentos: int, pedidos: int, lote: int, largada=None):
+    m = abrir_memoria_compartilhada(num_fragmentos, name=NOME_SEGMENTO)
+    try:
+        aguardar_largada(largada)
+        base = indice * IDS_POR_PRODUTOR
+        for inicio in range(0, pedidos, lote):
+            agora = time.time()
+            pendentes = [Pedido(base + i, i % 20 + 1, 'Pizza Margherita', agora,
+                                PedidoStatus.PENDENTE.value, indice)
+                         for i in range(inicio, min(inicio + lote, pedidos))]
+            while pendentes:
+                enviados = m.adicionar_pedidos(pendentes)
+                pendentes = pendentes[enviados:]
+                if pendentes:
+                    time.sleep(PAUSA_FILA_CHEIA)
+    finally:
+        m.close()
+
+
+def consumidor(indice: int, num_fragmentos: int, lote: int, fim_producao, largada=None):
+    m = abrir_memoria_compartilhada(num_fragmentos, name=NOME_SEGMENTO)
+    try:
+        aguardar_largada(largada)
+        while True:
+            pedidos = m.aguardar_pedidos(indice, lote, timeout=TIMEOUT_CONSUMIDOR)
+            if pedidos:
+                m.finalizar_pedidos([pedido.id for pedido in pedidos])
+            elif fim_producao.is_set():
+                # Nada em nenhum fragmento e nada mais a chegar
+                break
+    finally:
+        m.close()
+
+
+def _registros_concluidos(m):
+    """Registros do arquivo de concluídos de todos os fragmentos"""
+    for fragmento in getattr(m, 'fragmentos', [m]):
+        yield from fragmento.arquivo.iterar()
+
+
+def medir(produtores: int, consumidores: int, pedidos: int, lote: int,
+          num_fragmentos: int, politica: PoliticaDespacho) -> dict:
+    m = abrir_memoria_compartilhada(num_fragmentos, name=NOME_SEGMENTO, create=True, politica=politica)
+    supervisor = Supervisor()
+    fim_producao = supervisor.contexto.Event()
+    try:
+        por_produtor = [pedidos // produtores + (1 if i < pedidos % produtores else 0)
+                        for i in range(produtores)]
+        trabalhadores = [(consumidor, (i, num_fragmentos, lote, fim_producao), {})
+                         for i in range(1, consumidores + 1)]
+        trabalhadores += [(produtor, (i + 1, num_fragmentos, quantidade, lote), {})
+                          for i, quantidade in enumerate(por_produtor)]
+
+        # Só retorna com todos os processos anexados: o relógio começa na largada
+        processos = supervisor.iniciar(trabalhadores)
+        inicio = supervisor.inicio_execucao
+        processos_consumidores, processos_produtores = processos[:consumidores], processos[consumidores:]
+        for processo in processos_produtores:
+            processo.join()
+        fim_producao.set()
+        for processo in processos_consumidores:
+            processo.join()
+
+        latencias = []
+        ultima_conclusao = inicio
+        for registro in _registros_concluidos(m):
+            latencias.append((registro.concluido_em - registro.timestamp) * 1000)
+            ultima_conclusao = max(ultima_conclusao, registro.concluido_em)
+        duracao = ultima_conclusao - inicio
+
+        return {
+            'produtores': produtores,
+            'consumidores': consumidores,
+            'pedidos': len(latencias),
+            'duracao': duracao,
+            'ops_por_segundo': len(latencias) / duracao if duracao > 0 else None,
+            'latencia_ms': {**percentis(latencias), 'max': max(latencias) if latencias else None}
+        }
+    finally:
+        m.unlink()
+        m.close()
+        for fragmento in getattr(m, 'fragmentos', [m]):
+            fragmento.arquivo.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ponta a ponta da fila de pedidos")
+    parser.add_argument('--produtores', default='1,2,4', help="quantidades a varrer (padrão: 1,2,4)")
+    parser.add_argument('--consumidores', default='1,2,4', help="quantidades a varrer (padrão: 1,2,4)")
+    parser.add_argument('--pedidos', type=int, default=20000, help="pedidos por combinação (padrão: 20000)")
+    parser.add_argument('--lote', type=int, default=1, help="pedidos por envio/retirada (padrão: 1)")
+    parser.add_argument('--fragmentos', type=int, default=1)
+    parser.add_argument('--politica', choices=[p.value for p in PoliticaDespacho],
+                        default=PoliticaDespacho.FIFO.value)
+    parser.add_argument('--saida', default=None, help="arquivo JSON (padrão: benchmarks/resultados/)")
+    args = parser.parse_args()
+
+    lista_produtores = [int(valor) for valor in args.produtores.split(',') if valor.strip()]
+    lista_consumidores = [int(valor) for valor in args.consumidores.split(',') if valor.strip()]
+    politica = PoliticaDespacho(args.politica)
+
+    resultados = []
+    for produtores in lista_produtores:
+        for consumidores in lista_consumidores:
+            resultado = medir(produtores, consumidores, args.pedidos, args.lote, args.fragmentos, politica)
+            resultados.append(resultado)
+            latencia = resultado['latencia_ms']
+            print(f"{produtores:>3} produtores {consumidores:>3} consumidores  "
+                  f"{resultado['ops_por_segundo']:>9.0f} pedidos/s   "
+                  f"p50 {latencia['p50']:>8.2f} ms   p99 {latencia['p99']:>8.2f} ms   "
+                  f"p999 {latencia['p999']:>8.2f} ms")
+
+    caminho = salvar_resultados('ponta_a_ponta', {
+        'produtores': lista_produtores,
+        'consumidores': lista_consumidores,
+        'pedidos': args.pedidos,
+        'lote': args.lote,
+        'fragmentos': args.fragmentos,
+        'politica': politica.value
+    }, resultados, args.saida)
+    print(f"\nResultados gravados em {caminho}")
+
+
+if __name__ == "__main__":
+    main()
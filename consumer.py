@@ -1,39 +1,230 @@
+import asyncio
 import os
 import sys
 import time
 import random
-from shared_memory_manager import SharedMemoryManager, PedidoStatus
+from concurrent.futures import ThreadPoolExecutor
+from shared_memory_manager import PedidoStatus
+from sharded_memory_manager import abrir_memoria_compartilhada
+from supervisor import aguardar_largada
+
+# Custo de preparo de cada item, relativo ao tempo sorteado entre mínimo e máximo
+CUSTO_RELATIVO_ITENS = {
+    "Pizza Margherita": 1.0,
+    "Hambúrguer Artesanal": 0.8,
+    "Salada Caesar": 0.4,
+    "Spaghetti Carbonara": 0.9,
+    "Risoto de Cogumelos": 1.3,
+    "Filé Mignon": 1.2,
+    "Sushi Variado": 1.1,
+    "Lasanha Bolonhesa": 1.4,
+    "Frango Grelhado": 0.9,
+    "Peixe Assado": 1.0
+}
+# Preparar n unidades iguais juntas custa n ** EXPOENTE_LOTE vezes uma unidade
+EXPOENTE_LOTE = 0.5
+# Quanto o pedido mais antigo pode ser preterido por um item com lote maior (segundos)
+ESPERA_MAXIMA_LOTE = 10.0
+
+def tempo_preparo(item: str, quantidade: int, tempo_min: float, tempo_max: float) -> float:
+    """Tempo para preparar juntas `quantidade` unidades do item"""
+    return random.uniform(tempo_min, tempo_max) * CUSTO_RELATIVO_ITENS.get(item, 1.0) * quantidade ** EXPOENTE_LOTE
 
 class Consumidor:
 
-    def __init__(self, consumidor_id: int, tempo_preparo_min=2, tempo_preparo_max=6):
+    # Intervalo máximo bloqueado esperando pedido antes de reavaliar self.ativo
+    TIMEOUT_ESPERA = 1.0
+
+    def __init__(self, consumidor_id: int, tempo_preparo_min=2, tempo_preparo_max=6, pedidos_por_vez=1,
+                 num_fragmentos=1, largada=None, drenar=None, lote_item=1, espera_max_lote=ESPERA_MAXIMA_LOTE):
         self.consumidor_id = consumidor_id
         self.tempo_preparo_min = tempo_preparo_min
         self.tempo_preparo_max = tempo_preparo_max
+        # Quantos pedidos retirar por acesso à memória compartilhada
+        self.pedidos_por_vez = pedidos_por_vez
+        self.num_fragmentos = num_fragmentos
         self.pedidos_processados = 0
         self.ativo = True
+        # Barreira de largada do supervisor (None = começar assim que anexar)
+        self.largada = largada
+        # Evento de drenagem: quando ligado, terminar os pedidos em mãos e sair
+        self.drenar = drenar
+        # Acima de 1: retirar até lote_item pedidos do mesmo item e prepará-los juntos
+        self.lote_item = lote_item
+        self.espera_max_lote = espera_max_lote
+        self.shm_manager = None
+
+    def drenando(self) -> bool:
+        # Drenagem só deste consumidor (autoescala) ou do sistema inteiro (estado compartilhado)
+        return (self.drenar is not None and self.drenar.is_set()) or \
+            (self.shm_manager is not None and self.shm_manager.em_encerramento)
+
+    def retirar(self, shm_manager):
+        if self.lote_item > 1:
+            return shm_manager.aguardar_lote_mesmo_item(self.consumidor_id, self.lote_item, self.espera_max_lote,
+                                                        timeout=self.TIMEOUT_ESPERA)
+        return shm_manager.aguardar_pedidos(self.consumidor_id, self.pedidos_por_vez,
+                                            timeout=self.TIMEOUT_ESPERA)
+
+    def concluir(self, shm_manager, pedidos):
+        """Finaliza os pedidos e conta só os aceitos (os de lease vencido já voltaram à fila)"""
+        finalizados = shm_manager.finalizar_pedidos([pedido.id for pedido in pedidos], self.consumidor_id)
+        if finalizados < len(pedidos):
+            print(f"[Consumidor {self.consumidor_id}] {len(pedidos) - finalizados} "
+                  f"pedido(s) com lease vencido voltaram à fila")
+        if finalizados:
+            self.pedidos_processados += finalizados
+            concluidos = ", ".join(f"#{pedido.id}" for pedido in pedidos) if finalizados == len(pedidos) \
+                else f"{finalizados} de {len(pedidos)} pedidos"
+            print(f"[Consumidor {self.consumidor_id}] {concluidos} concluído(s)! (Total: {self.pedidos_processados})")
+        return finalizados
 
     def executar(self):
         print(f"[Consumidor {self.consumidor_id}] Iniciado (PID: {os.getpid()})")
 
-        shm_manager = SharedMemoryManager(create=False)
+        shm_manager = self.shm_manager = abrir_memoria_compartilhada(self.num_fragmentos)
+        # Batimentos mantêm os leases dos pedidos em preparo enquanto o processo vive
+        shm_manager.manter_batimentos(self.consumidor_id)
+        aguardar_largada(self.largada)
 
         try:
-            while self.ativo:
-                pedido = shm_manager.obter_proximo_pedido(self.consumidor_id)
+            while self.ativo and not self.drenando():
+                pedidos = self.retirar(shm_manager)
 
-                if pedido:
-                    print(f"[Consumidor {self.consumidor_id}] Preparando pedido #{pedido.id}: {pedido.item}")
+                if self.lote_item > 1 and pedidos:
+                    # Lote do mesmo item: um único preparo para todos
+                    print(f"[Consumidor {self.consumidor_id}] Preparando {len(pedidos)}x {pedidos[0].item}: "
+                          + ", ".join(f"#{pedido.id}" for pedido in pedidos))
+                    time.sleep(tempo_preparo(pedidos[0].item, len(pedidos),
+                                             self.tempo_preparo_min, self.tempo_preparo_max))
+                    self.concluir(shm_manager, pedidos)
+                else:
+                    # Retirada em lote, preparo um a um: cada pedido é finalizado ao ficar pronto,
+                    # para a conclusão registrada não incluir o preparo dos seguintes
+                    for pedido in pedidos:
+                        print(f"[Consumidor {self.consumidor_id}] Preparando pedido #{pedido.id}: {pedido.item}")
+                        time.sleep(tempo_preparo(pedido.item, 1, self.tempo_preparo_min, self.tempo_preparo_max))
+                        self.concluir(shm_manager, [pedido])
 
-                    tempo_preparo = random.uniform(self.tempo_preparo_min, self.tempo_preparo_max)
-                    time.sleep(tempo_preparo)
+                if pedidos:
+                    shm_manager.marcar_ocioso(self.consumidor_id)
 
-                    shm_manager.finalizar_pedido(pedido.id)
-                    self.pedidos_processados += 1
+            if self.drenando():
+                shm_manager.confirmar_drenagem(self.consumidor_id)
+                print(f"[Consumidor {self.consumidor_id}] Drenado")
 
-                    print(f"[Consumidor {self.consumidor_id}] Pedido #{pedido.id} concluído! (Total: {self.pedidos_processados})")
+        except KeyboardInterrupt:
+            print(f"[Consumidor {self.consumidor_id}] Interrompido pelo usuário")
+
+        finally:
+            shm_manager.close()
+            print(f"[Consumidor {self.consumidor_id}] Encerrado")
+
+class ConsumidorAsync:
+    """Vários cozinheiros (corrotinas) em um único processo
+
+    Um despachante retira de uma vez tantos pedidos quantos cozinheiros livres
+    houver, em uma thread auxiliar (a espera por pedidos bloqueia), e entrega
+    cada pedido a uma corrotina que aguarda o tempo de preparo e o finaliza,
+    também fora do laço de eventos (finalizar toma o lock e pode gravar no
+    arquivo de concluídos).
+    Com ``lote_item`` acima de 1, cada cozinheiro livre recebe um lote de
+    pedidos do mesmo item, preparados juntos. Todos os cozinheiros do processo
+    usam o mesmo consumidor_id.
+    """
+
+    TIMEOUT_ESPERA = 1.0
+
+    def __init__(self, consumidor_id: int, cozinheiros=10, tempo_preparo_min=2, tempo_preparo_max=6,
+                 num_fragmentos=1, largada=None, drenar=None, lote_item=1, espera_max_lote=ESPERA_MAXIMA_LOTE):
+        self.consumidor_id = consumidor_id
+        self.cozinheiros = cozinheiros
+        self.tempo_preparo_min = tempo_preparo_min
+        self.tempo_preparo_max = tempo_preparo_max
+        self.num_fragmentos = num_fragmentos
+        self.pedidos_processados = 0
+        self.ativo = True
+        self.largada = largada
+        self.drenar = drenar
+        self.lote_item = lote_item
+        self.espera_max_lote = espera_max_lote
+        self.shm_manager = None
+        # Cozinheiros com pedidos em mãos (contados ao receber o lote)
+        self.ocupados = 0
+
+    def drenando(self) -> bool:
+        return (self.drenar is not None and self.drenar.is_set()) or \
+            (self.shm_manager is not None and self.shm_manager.em_encerramento)
+
+    async def preparar(self, shm_manager, pedidos, executor):
+        """Um cozinheiro prepara os pedidos (um só, ou um lote do mesmo item) e os finaliza no executor"""
+        print(f"[Consumidor {self.consumidor_id}] Preparando "
+              + ", ".join(f"#{pedido.id}" for pedido in pedidos) + f": {pedidos[0].item}")
+
+        try:
+            await asyncio.sleep(tempo_preparo(pedidos[0].item, len(pedidos),
+                                              self.tempo_preparo_min, self.tempo_preparo_max))
+        finally:
+            self.ocupados -= 1
+
+        finalizados = await asyncio.get_running_loop().run_in_executor(
+            executor, shm_manager.finalizar_pedidos, [pedido.id for pedido in pedidos], self.consumidor_id)
+        if self.ocupados == 0:
+            # Nenhum cozinheiro do processo no fogo (retirar de novo volta a marcar ocupado)
+            shm_manager.marcar_ocioso(self.consumidor_id)
+        if finalizados:
+            self.pedidos_processados += finalizados
+            print(f"[Consumidor {self.consumidor_id}] " + ", ".join(f"#{pedido.id}" for pedido in pedidos)
+                  + f" concluído(s)! (Total: {self.pedidos_processados})")
+
+    def retirar(self, shm_manager, livres: int):
+        """Lotes a entregar aos cozinheiros livres (bloqueia até TIMEOUT_ESPERA)"""
+        if self.lote_item > 1:
+            lote = shm_manager.aguardar_lote_mesmo_item(self.consumidor_id, self.lote_item,
+                                                        self.espera_max_lote, self.TIMEOUT_ESPERA)
+            return [lote] if lote else []
+        return [[pedido] for pedido in shm_manager.aguardar_pedidos(self.consumidor_id, livres,
+                                                                    self.TIMEOUT_ESPERA)]
+
+    async def despachar(self, shm_manager):
+        loop = asyncio.get_running_loop()
+        # Duas threads: a espera do despachante por pedidos (até TIMEOUT_ESPERA) não atrasa as finalizações
+        espera = ThreadPoolExecutor(max_workers=2)
+        em_preparo = set()
+        try:
+            while self.ativo and not self.drenando():
+                livres = self.cozinheiros - len(em_preparo)
+                if livres == 0:
+                    await asyncio.wait(em_preparo, return_when=asyncio.FIRST_COMPLETED)
                 else:
-                    time.sleep(0.5)
+                    lotes = await loop.run_in_executor(espera, self.retirar, shm_manager, livres)
+                    for pedidos in lotes:
+                        self.ocupados += 1
+                        tarefa = asyncio.create_task(self.preparar(shm_manager, pedidos, espera))
+                        em_preparo.add(tarefa)
+                        tarefa.add_done_callback(em_preparo.discard)
+
+            # Drenagem: nenhum pedido novo, mas os que estão no fogo terminam
+            if em_preparo:
+                await asyncio.wait(set(em_preparo))
+            if self.drenando():
+                shm_manager.confirmar_drenagem(self.consumidor_id)
+                print(f"[Consumidor {self.consumidor_id}] Drenado")
+        finally:
+            for tarefa in em_preparo:
+                tarefa.cancel()
+            espera.shutdown(wait=False)
+
+    def executar(self):
+        print(f"[Consumidor {self.consumidor_id}] Iniciado com {self.cozinheiros} cozinheiros (PID: {os.getpid()})")
+
+        shm_manager = self.shm_manager = abrir_memoria_compartilhada(self.num_fragmentos)
+        # Batimentos mantêm os leases dos pedidos em preparo enquanto o processo vive
+        shm_manager.manter_batimentos(self.consumidor_id)
+        aguardar_largada(self.largada)
+
+        try:
+            asyncio.run(self.despachar(shm_manager))
 
         except KeyboardInterrupt:
             print(f"[Consumidor {self.consumidor_id}] Interrompido pelo usuário")
@@ -42,8 +233,18 @@ class Consumidor:
             shm_manager.close()
             print(f"[Consumidor {self.consumidor_id}] Encerrado")
 
-def iniciar_consumidor(consumidor_id: int, tempo_preparo_min=2, tempo_preparo_max=6):
-    consumidor = Consumidor(consumidor_id, tempo_preparo_min, tempo_preparo_max)
+def iniciar_consumidor(consumidor_id: int, tempo_preparo_min=2, tempo_preparo_max=6, pedidos_por_vez=1,
+                       num_fragmentos=1, largada=None, drenar=None, lote_item=1,
+                       espera_max_lote=ESPERA_MAXIMA_LOTE):
+    consumidor = Consumidor(consumidor_id, tempo_preparo_min, tempo_preparo_max, pedidos_por_vez,
+                            num_fragmentos, largada, drenar, lote_item, espera_max_lote)
+    consumidor.executar()
+
+def iniciar_consumidor_async(consumidor_id: int, cozinheiros=10, tempo_preparo_min=2, tempo_preparo_max=6,
+                             num_fragmentos=1, largada=None, drenar=None, lote_item=1,
+                             espera_max_lote=ESPERA_MAXIMA_LOTE):
+    consumidor = ConsumidorAsync(consumidor_id, cozinheiros, tempo_preparo_min, tempo_preparo_max,
+                                 num_fragmentos, largada, drenar, lote_item, espera_max_lote)
     consumidor.executar()
 
 if __name__ == "__main__":
@@ -52,4 +253,8 @@ if __name__ == "__main__":
     else:
         consumidor_id = 1
 
-    iniciar_consumidor(consumidor_id)
+    # Segundo argumento opcional: número de cozinheiros assíncronos no processo
+    if len(sys.argv) > 2 and int(sys.argv[2]) > 1:
+        iniciar_consumidor_async(consumidor_id, int(sys.argv[2]))
+    else:
+        iniciar_consumidor(consumidor_id)
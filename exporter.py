@@ -0,0 +1,367 @@
+"""
+Exportação dos pedidos em segundo plano, em fluxo e com memória limitada
+
+O Exportador roda em uma thread própria e percorre os pedidos uma única vez,
+entregando cada um a todos os formatos pedidos:
+
+- ``csv``: parâmetros, estatísticas e latências no topo, depois uma linha por
+  pedido (o mesmo layout da exportação anterior);
+- ``jsonl``: JSON Lines; a primeira linha é o resumo (parâmetros,
+  estatísticas e latências) e cada linha seguinte é um pedido;
+- ``colunar``: binário compacto com um array tipado por campo, gravado em
+  blocos de até LOTE linhas, e dicionários de item e status no final. Carrega
+  com ``carregar_colunar`` direto para ``array.array``, sem interpretar texto.
+
+Os concluídos são lidos do arquivo em disco em lotes (na ordem de
+conclusão), por leitores próprios da exportação abertos no mesmo caminho,
+sem disputar o mapeamento com as threads da interface; os em andamento vêm
+de uma cópia da arena, que é limitada pela capacidade dela. Com origem
+``arquivo``, só os concluídos. O progresso (pedidos escritos, total) é
+publicado em uma ``queue.Queue``.
+
+Uso: python exporter.py [--formatos csv,jsonl,colunar] [--origem tudo|arquivo] [--fragmentos N]
+"""
+import argparse
+import csv
+import itertools
+import json
+import queue
+import struct
+import sys
+import threading
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from order_archive import ArquivoPedidos
+from shared_memory_manager import Pedido, PedidoStatus, iterar_pedidos_arquivados
+from sharded_memory_manager import abrir_memoria_compartilhada
+
+FORMATOS = ('csv', 'jsonl', 'colunar')
+EXTENSOES = {'csv': 'csv', 'jsonl': 'jsonl', 'colunar': 'pedcol'}
+# tudo = arquivo de concluídos + pedidos em andamento na memória; arquivo = só concluídos
+ORIGENS = ('tudo', 'arquivo')
+
+# Campo e typecode de cada coluna do formato colunar; item e status são códigos de dicionário
+COLUNAS = (('id', 'q'), ('mesa', 'i'), ('item', 'H'), ('status', 'B'), ('produtor_id', 'i'),
+           ('consumidor_id', 'i'), ('timestamp', 'd'), ('prioridade', 'i'), ('deadline', 'd'),
+           ('retirado_em', 'd'), ('concluido_em', 'd'))
+STATUS = tuple(status.value for status in PedidoStatus)
+
+_MAGIC_COLUNAR = b'PDCL'
+_VERSAO_COLUNAR = 1
+_CABECALHO_COLUNAR = struct.Struct('<4sHH')
+_COLUNA = struct.Struct('<16sc')
+_U16 = struct.Struct('<H')
+_U32 = struct.Struct('<I')
+# Os arrays são gravados em little-endian
+_INVERTER_BYTES = sys.byteorder == 'big'
+
+
+def _data(timestamp: float, formato: str = "%d/%m/%Y %H:%M:%S") -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).strftime(formato) if timestamp > 0 else None
+
+
+class _EscritorCsv:
+    def __init__(self, caminho: str, resumo: dict):
+        self.arquivo = open(caminho, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.arquivo)
+        parametros, stats, latencias = resumo['parametros'], resumo['estatisticas'], resumo['latencias_segundos']
+
+        self.writer.writerow(['PARÂMETROS DO SISTEMA'])
+        self.writer.writerow(['Número de Produtores', parametros['num_produtores']])
+        self.writer.writerow(['Número de Consumidores', parametros['num_consumidores']])
+        self.writer.writerow(['Duração (segundos)', 'Ilimitada' if parametros['duracao_segundos'] == 'ilimitada'
+                              else parametros['duracao_segundos']])
+        self.writer.writerow(['Data/Hora Exportação', datetime.now().strftime("%d/%m/%Y %H:%M:%S")])
+        self.writer.writerow(['Origem', parametros['origem']])
+        self.writer.writerow([])
+
+        self.writer.writerow(['ESTATÍSTICAS'])
+        for chave, titulo in (('total_criados', 'Total Criados'), ('total_processados', 'Total Processados'),
+                              ('em_fila', 'Em Fila'), ('em_preparo', 'Em Preparo'),
+                              ('concluidos_com_prazo', 'Concluídos com Prazo'),
+                              ('prazos_perdidos', 'Prazos Perdidos'),
+                              ('pedidos_recuperados', 'Recuperados de Consumidores Parados'),
+                              ('falhas_arquivo', 'Falhas ao Arquivar')):
+            self.writer.writerow([titulo, stats.get(chave, 0)])
+        self.writer.writerow([])
+
+        self.writer.writerow(['LATÊNCIAS (segundos)'])
+        self.writer.writerow(['Etapa', 'Amostras', 'Média', 'p50', 'p95', 'p99', 'Máximo'])
+        for etapa, titulo in (('espera', 'Espera na Fila'), ('preparo', 'Preparo'), ('total', 'Total')):
+            percentis = latencias.get(etapa, {})
+            self.writer.writerow([titulo, percentis.get('amostras', 0)] +
+                                 [f"{percentis[chave]:.6f}" if percentis.get(chave) is not None else 'N/A'
+                                  for chave in ('media', 'p50', 'p95', 'p99', 'max')])
+        self.writer.writerow([])
+
+        self.writer.writerow(['FILA DE PEDIDOS'])
+        self.writer.writerow(['ID', 'Mesa', 'Item', 'Status', 'Produtor', 'Consumidor', 'Timestamp',
+                              'Prioridade', 'Prazo', 'Retirado', 'Concluído'])
+
+    def escrever(self, pedidos: List[Pedido]):
+        self.writer.writerows([
+            pedido.id, pedido.mesa, pedido.item, pedido.status, pedido.produtor_id,
+            str(pedido.consumidor_id) if pedido.consumidor_id != -1 else 'N/A',
+            _data(pedido.timestamp), pedido.prioridade, _data(pedido.deadline) or 'N/A',
+            _data(pedido.retirado_em, "%d/%m/%Y %H:%M:%S.%f") or 'N/A',
+            _data(pedido.concluido_em, "%d/%m/%Y %H:%M:%S.%f") or 'N/A'
+        ] for pedido in pedidos)
+
+    def fechar(self):
+        self.arquivo.close()
+
+
+class _EscritorJsonl:
+    def __init__(self, caminho: str, resumo: dict):
+        self.arquivo = open(caminho, 'w', encoding='utf-8')
+        self.arquivo.write(json.dumps(resumo, ensure_ascii=False) + '\n')
+
+    def escrever(self, pedidos: List[Pedido]):
+        self.arquivo.writelines(json.dumps({
+            'id': pedido.id,
+            'mesa': pedido.mesa,
+            'item': pedido.item,
+            'status': pedido.status,
+            'produtor_id': pedido.produtor_id,
+            'consumidor_id': pedido.consumidor_id if pedido.consumidor_id != -1 else None,
+            'timestamp': datetime.fromtimestamp(pedido.timestamp).isoformat(),
+            'prioridade': pedido.prioridade,
+            'deadline': datetime.fromtimestamp(pedido.deadline).isoformat() if pedido.deadline > 0 else None,
+            'retirado_em': datetime.fromtimestamp(pedido.retirado_em).isoformat() if pedido.retirado_em > 0 else None,
+            'concluido_em': datetime.fromtimestamp(pedido.concluido_em).isoformat() if pedido.concluido_em > 0 else None
+        }, ensure_ascii=False) + '\n' for pedido in pedidos)
+
+    def fechar(self):
+        self.arquivo.close()
+
+
+class _EscritorColunar:
+    """Cabeçalho (colunas), blocos [n, coluna 1, ..., coluna k], bloco vazio, dicionários"""
+
+    def __init__(self, caminho: str, resumo: dict):
+        self.arquivo = open(caminho, 'wb')
+        self.arquivo.write(_CABECALHO_COLUNAR.pack(_MAGIC_COLUNAR, _VERSAO_COLUNAR, len(COLUNAS)))
+        for nome, typecode in COLUNAS:
+            self.arquivo.write(_COLUNA.pack(nome.encode('ascii'), typecode.encode('ascii')))
+        self.itens: Dict[str, int] = {}
+        self.codigos_status = {status: codigo for codigo, status in enumerate(STATUS)}
+
+    def _codigo_item(self, item: str) -> int:
+        codigo = self.itens.get(item)
+        if codigo is None:
+            codigo = self.itens[item] = len(self.itens)
+        return codigo
+
+    def escrever(self, pedidos: List[Pedido]):
+        if not pedidos:
+            return
+        colunas = {nome: array(typecode) for nome, typecode in COLUNAS}
+        for pedido in pedidos:
+            colunas['id'].append(pedido.id)
+            colunas['mesa'].append(pedido.mesa)
+            colunas['item'].append(self._codigo_item(pedido.item))
+            colunas['status'].append(self.codigos_status[pedido.status])
+            colunas['produtor_id'].append(pedido.produtor_id)
+            colunas['consumidor_id'].append(pedido.consumidor_id)
+            colunas['timestamp'].append(pedido.timestamp)
+            colunas['prioridade'].append(pedido.prioridade)
+            colunas['deadline'].append(pedido.deadline)
+            colunas['retirado_em'].append(pedido.retirado_em)
+            colunas['concluido_em'].append(pedido.concluido_em)
+        self.arquivo.write(_U32.pack(len(pedidos)))
+        for nome, _ in COLUNAS:
+            coluna = colunas[nome]
+            if _INVERTER_BYTES:
+                coluna.byteswap()
+            coluna.tofile(self.arquivo)
+
+    def fechar(self):
+        self.arquivo.write(_U32.pack(0))
+        dicionarios = (('item', list(self.itens)), ('status', list(STATUS)))
+        self.arquivo.write(_U16.pack(len(dicionarios)))
+        for nome, valores in dicionarios:
+            self.arquivo.write(_COLUNA.pack(nome.encode('ascii'), b's') + _U32.pack(len(valores)))
+            for valor in valores:
+                dados = valor.encode('utf-8')
+                self.arquivo.write(_U16.pack(len(dados)) + dados)
+        self.arquivo.close()
+
+
+_ESCRITORES = {'csv': _EscritorCsv, 'jsonl': _EscritorJsonl, 'colunar': _EscritorColunar}
+
+
+def carregar_colunar(caminho: str) -> Tuple[Dict[str, array], Dict[str, List[str]]]:
+    """Lê um arquivo colunar: (coluna -> array, dicionário -> valores)
+
+    ``item`` e ``status`` são índices nos dicionários de mesmo nome.
+    """
+    with open(caminho, 'rb') as arquivo:
+        magic, versao, num_colunas = _CABECALHO_COLUNAR.unpack(arquivo.read(_CABECALHO_COLUNAR.size))
+        if magic != _MAGIC_COLUNAR or versao != _VERSAO_COLUNAR:
+            raise ValueError(f"Arquivo colunar inválido: {caminho}")
+        esquema = [_COLUNA.unpack(arquivo.read(_COLUNA.size)) for _ in range(num_colunas)]
+        colunas = {nome.rstrip(b'\0').decode('ascii'): array(typecode.decode('ascii'))
+                   for nome, typecode in esquema}
+        while True:
+            num_linhas = _U32.unpack(arquivo.read(_U32.size))[0]
+            if num_linhas == 0:
+                break
+            for coluna in colunas.values():
+                coluna.fromfile(arquivo, num_linhas)
+
+        dicionarios = {}
+        for _ in range(_U16.unpack(arquivo.read(_U16.size))[0]):
+            nome = _COLUNA.unpack(arquivo.read(_COLUNA.size))[0].rstrip(b'\0').decode('ascii')
+            valores = []
+            for _ in range(_U32.unpack(arquivo.read(_U32.size))[0]):
+                tamanho = _U16.unpack(arquivo.read(_U16.size))[0]
+                valores.append(arquivo.read(tamanho).decode('utf-8'))
+            dicionarios[nome] = valores
+    if _INVERTER_BYTES:
+        for coluna in colunas.values():
+            coluna.byteswap()
+    return colunas, dicionarios
+
+
+class Exportador:
+    LOTE = 4096
+
+    def __init__(self, shm_manager, prefixo: str, formatos=FORMATOS, origem: str = 'tudo',
+                 parametros: Optional[dict] = None):
+        for formato in formatos:
+            if formato not in _ESCRITORES:
+                raise ValueError(f"Formato desconhecido: {formato}")
+        if origem not in ORIGENS:
+            raise ValueError(f"origem deve ser uma de {ORIGENS}")
+        self.shm_manager = shm_manager
+        self.formatos = tuple(formatos)
+        self.origem = origem
+        # Parâmetros da execução lidos da interface (produtores, consumidores, duração)
+        self.parametros = parametros or {}
+        self.caminhos = {formato: f"{prefixo}.{EXTENSOES[formato]}" for formato in self.formatos}
+        # ('progresso', escritos, total) | ('concluido', escritos, caminhos) | ('erro', mensagem)
+        self.fila = queue.Queue()
+        self._cancelar = threading.Event()
+        self._thread = None
+
+    def _fontes(self, arquivos: List[ArquivoPedidos]) -> Tuple[list, int]:
+        """Por fragmento: (arquivo, registros a exportar, pedidos em andamento); e o total
+
+        Um pedido arquivado entre a leitura do tamanho do arquivo e a cópia da
+        arena aparece nos dois: vale o arquivo.
+        """
+        fontes, total = [], 0
+        for fragmento, arquivo in zip(self._fragmentos(), arquivos):
+            arquivados_antes = len(arquivo)
+            ativos = fragmento.obter_pedidos_ativos() if self.origem == 'tudo' else []
+            arquivados = len(arquivo)
+            if ativos and arquivados > arquivados_antes:
+                recentes = {registro.id for registro in arquivo.ler(arquivados_antes, arquivados)}
+                ativos = [pedido for pedido in ativos if pedido.id not in recentes]
+            fontes.append((arquivo, arquivados, ativos))
+            total += arquivados + len(ativos)
+        return fontes, total
+
+    def _fragmentos(self) -> list:
+        return getattr(self.shm_manager, 'fragmentos', [self.shm_manager])
+
+    def _lotes(self, fontes):
+        for arquivo, arquivados, ativos in fontes:
+            pedidos = iterar_pedidos_arquivados(arquivo, 0, arquivados, self.LOTE)
+            for _ in range(0, arquivados, self.LOTE):
+                yield list(itertools.islice(pedidos, self.LOTE))
+            for inicio in range(0, len(ativos), self.LOTE):
+                yield ativos[inicio:inicio + self.LOTE]
+
+    def _resumo(self) -> dict:
+        stats = self.shm_manager.obter_estatisticas()
+        return {
+            'parametros': {
+                'num_produtores': self.parametros.get('num_produtores', 0),
+                'num_consumidores': self.parametros.get('num_consumidores', 0),
+                'duracao_segundos': self.parametros.get('duracao', 0) or 'ilimitada',
+                'origem': self.origem,
+                'data_exportacao': datetime.now().isoformat()
+            },
+            'estatisticas': {chave: stats.get(chave, 0) for chave in (
+                'total_criados', 'total_processados', 'em_fila', 'em_preparo', 'concluidos_com_prazo',
+                'prazos_perdidos', 'pedidos_recuperados', 'falhas_arquivo')},
+            'latencias_segundos': self.shm_manager.obter_percentis()
+        }
+
+    def exportar(self) -> int:
+        """Escreve todos os formatos em uma passagem; retorna quantos pedidos foram exportados"""
+        # Leitores próprios: o mapeamento do arquivo do manager é da interface
+        arquivos = []
+        escritores = []
+        try:
+            for fragmento in self._fragmentos():
+                arquivos.append(ArquivoPedidos(fragmento.arquivo.caminho))
+            fontes, total = self._fontes(arquivos)
+            resumo = self._resumo()
+            for formato in self.formatos:
+                escritores.append(_ESCRITORES[formato](self.caminhos[formato], resumo))
+            escritos = 0
+            self.fila.put(('progresso', 0, total))
+            for pedidos in self._lotes(fontes):
+                if self._cancelar.is_set():
+                    break
+                for escritor in escritores:
+                    escritor.escrever(pedidos)
+                escritos += len(pedidos)
+                self.fila.put(('progresso', escritos, total))
+        finally:
+            for escritor in escritores:
+                escritor.fechar()
+            for arquivo in arquivos:
+                arquivo.close()
+        return escritos
+
+    def _executar(self):
+        try:
+            escritos = self.exportar()
+            if self._cancelar.is_set():
+                self.fila.put(('erro', "Exportação cancelada"))
+            else:
+                self.fila.put(('concluido', escritos, dict(self.caminhos)))
+        except Exception as e:
+            self.fila.put(('erro', str(e)))
+
+    def iniciar(self):
+        self._cancelar.clear()
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+        self._thread.start()
+
+    def cancelar(self):
+        self._cancelar.set()
+
+    def em_andamento(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta os pedidos da memória compartilhada e do arquivo")
+    parser.add_argument('--formatos', default='csv,jsonl', help=f"entre {','.join(FORMATOS)} (padrão: csv,jsonl)")
+    parser.add_argument('--origem', choices=ORIGENS, default='tudo',
+                        help="tudo (padrão) ou só o arquivo de concluídos")
+    parser.add_argument('--fragmentos', type=int, default=1, help="fragmentos da memória compartilhada")
+    parser.add_argument('--prefixo', default=None, help="caminho sem extensão (padrão: pedidos_<data>)")
+    args = parser.parse_args()
+
+    shm_manager = abrir_memoria_compartilhada(max(1, args.fragmentos))
+    try:
+        exportador = Exportador(shm_manager, args.prefixo or f"pedidos_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                                [formato.strip() for formato in args.formatos.split(',') if formato.strip()],
+                                args.origem)
+        escritos = exportador.exportar()
+        print(f"{escritos} pedidos exportados:")
+        for caminho in exportador.caminhos.values():
+            print(f"  {caminho}")
+    finally:
+        shm_manager.close()
+
+
+if __name__ == "__main__":
+    main()
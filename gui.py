@@ -1,12 +1,264 @@
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
+import queue
 import time
-import psutil
 from threading import Thread, Timer
-from shared_memory_manager import SharedMemoryManager, PedidoStatus
+from typing import NamedTuple, Optional
+from shared_memory_manager import PedidoStatus, EstadoExecucao
+from sharded_memory_manager import abrir_memoria_compartilhada
+from order_archive import ORDENS
+from producer import Produtor
+from process_metrics import AmostradorMetricas
+from exporter import Exportador, FORMATOS
 from datetime import datetime
-import csv
-import json
+
+
+class InstantaneoInterface(NamedTuple):
+    """Tudo o que a tela precisa de uma leitura da memória, já pronto para desenhar
+
+    Montado pela thread de leitura e não mais alterado depois de entrar na fila.
+    ``alteracoes`` traz operações (ação, iid, valores, tag) sobre a tabela de
+    pedidos, a aplicar na ordem; ``linhas``, quando presente, substitui a
+    tabela inteira (ressincronização) antes delas.
+    """
+    estatisticas: dict
+    percentis: dict
+    trabalhadores: dict
+    alteracoes: tuple
+    linhas: Optional[tuple] = None
+
+
+class NavegadorPedidos:
+    """Janela de consulta a todos os pedidos, ativos e arquivados, com filtros
+
+    A tabela tem altura fixa e só contém as linhas visíveis: a barra de
+    rolagem é virtual (posição = início da janela / total) e cada rolagem pede
+    a ``consultar_pedidos`` só a nova janela. As consultas rodam em uma thread
+    própria, que atende sempre a mais recente e descarta as que ficaram para
+    trás; as respostas voltam por uma fila esvaziada em callbacks after().
+    """
+
+    LINHAS = 25
+    INTERVALO_RESPOSTAS_MS = 30
+    # Reconsulta periódica da janela visível, para acompanhar os pedidos em andamento
+    INTERVALO_RECONSULTA_MS = 1000
+
+    def __init__(self, gui, shm_manager):
+        self.gui = gui
+        self.shm_manager = shm_manager
+        self.inicio = 0
+        self.total = 0
+        self.fila_consultas = queue.Queue()
+        self.fila_respostas = queue.Queue()
+        # Número da última consulta pedida; respostas mais antigas são ignoradas
+        self.ultima_consulta = 0
+        self.ultima_reconsulta = time.monotonic()
+        self.id_respostas = None
+
+        self.janela = tk.Toplevel(gui.root)
+        self.janela.title("Consulta de Pedidos")
+        self.janela.geometry("900x640")
+        self.janela.configure(bg=gui.cor_bg)
+        self.janela.protocol("WM_DELETE_WINDOW", self.fechar)
+        self.criar_filtros()
+        self.criar_tabela()
+
+        Thread(target=self._atender_consultas, daemon=True).start()
+        self.consultar()
+        self.id_respostas = self.janela.after(self.INTERVALO_RESPOSTAS_MS, self.drenar_respostas)
+
+    def criar_filtros(self):
+        frame = tk.LabelFrame(self.janela, text="🔎 Filtros", font=("Arial", 11, "bold"),
+                              bg=self.gui.cor_frame, padx=10, pady=10)
+        frame.pack(fill=tk.X, padx=10, pady=(10, 0))
+
+        tk.Label(frame, text="Status:", bg=self.gui.cor_frame).grid(row=0, column=0, padx=5, pady=3, sticky='e')
+        self.combo_status = ttk.Combobox(frame, values=['Todos'] + [status.value for status in PedidoStatus],
+                                         state='readonly', width=12)
+        self.combo_status.set('Todos')
+        self.combo_status.grid(row=0, column=1, padx=5, pady=3, sticky='w')
+
+        tk.Label(frame, text="Item:", bg=self.gui.cor_frame).grid(row=0, column=2, padx=5, pady=3, sticky='e')
+        self.combo_item = ttk.Combobox(frame, values=['Todos'] + list(Produtor.ITENS_MENU), width=18)
+        self.combo_item.set('Todos')
+        self.combo_item.grid(row=0, column=3, padx=5, pady=3, sticky='w')
+
+        tk.Label(frame, text="Ordem:", bg=self.gui.cor_frame).grid(row=0, column=4, padx=5, pady=3, sticky='e')
+        self.combo_ordem = ttk.Combobox(frame, values=list(ORDENS), state='readonly', width=8)
+        self.combo_ordem.set(ORDENS[0])
+        self.combo_ordem.grid(row=0, column=5, padx=5, pady=3, sticky='w')
+
+        self.var_decrescente = tk.BooleanVar(value=True)
+        tk.Checkbutton(frame, text="Mais recentes primeiro", variable=self.var_decrescente,
+                       bg=self.gui.cor_frame, command=self.aplicar_filtros).grid(row=0, column=6, padx=5, pady=3)
+
+        self.entradas = {}
+        for col, (campo, titulo) in enumerate((('mesa', "Mesa:"), ('produtor_id', "Produtor:"),
+                                               ('consumidor_id', "Consumidor:"))):
+            tk.Label(frame, text=titulo, bg=self.gui.cor_frame).grid(row=1, column=col * 2, padx=5, pady=3, sticky='e')
+            entrada = ttk.Entry(frame, width=8)
+            entrada.grid(row=1, column=col * 2 + 1, padx=5, pady=3, sticky='w')
+            entrada.bind('<Return>', lambda event: self.aplicar_filtros())
+            self.entradas[campo] = entrada
+
+        tk.Button(frame, text="Aplicar", command=self.aplicar_filtros, cursor='hand2',
+                  bg='#3498db', fg='white', padx=10).grid(row=1, column=6, padx=5, pady=3)
+        for combo in (self.combo_status, self.combo_item, self.combo_ordem):
+            combo.bind('<<ComboboxSelected>>', lambda event: self.aplicar_filtros())
+        self.combo_item.bind('<Return>', lambda event: self.aplicar_filtros())
+
+    def criar_tabela(self):
+        frame = tk.Frame(self.janela, bg=self.gui.cor_frame)
+        frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        self.label_total = tk.Label(frame, text="Consultando...", font=("Arial", 10),
+                                    bg=self.gui.cor_frame, anchor='w')
+        self.label_total.pack(fill=tk.X)
+
+        columns = ('ID', 'Mesa', 'Item', 'Status', 'Produtor', 'Consumidor', 'Criado')
+        self.tree = ttk.Treeview(frame, columns=columns, show='headings', height=self.LINHAS)
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=150 if col in ('Item', 'Criado') else 80)
+        self.tree.tag_configure('pendente', background='#fff3cd')
+        self.tree.tag_configure('preparo', background='#cfe2ff')
+        self.tree.tag_configure('concluido', background='#d1e7dd')
+
+        # Barra virtual: não rola a tabela, move a janela consultada
+        self.scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.rolar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        for evento in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.tree.bind(evento, self.roda_mouse)
+        for tecla, passo in (('<Prior>', -self.LINHAS), ('<Next>', self.LINHAS), ('<Up>', -1), ('<Down>', 1)):
+            self.tree.bind(tecla, lambda event, passo=passo: self.mover(passo) or 'break')
+
+    def _parametros(self) -> Optional[dict]:
+        """Filtros da tela como argumentos de consultar_pedidos; None se algum for inválido"""
+        filtros = {}
+        for campo, entrada in self.entradas.items():
+            texto = entrada.get().strip()
+            if texto:
+                try:
+                    filtros[campo] = int(texto)
+                except ValueError:
+                    self.label_total.config(text=f"Valor inválido para {campo}: {texto}")
+                    return None
+        item = self.combo_item.get().strip()
+        if item and item != 'Todos':
+            filtros['item'] = item
+        status = self.combo_status.get()
+        return {'filtros': filtros, 'status': None if status == 'Todos' else status,
+                'ordem': self.combo_ordem.get(), 'decrescente': self.var_decrescente.get()}
+
+    def aplicar_filtros(self):
+        self.inicio = 0
+        self.consultar()
+
+    def consultar(self):
+        """Pede em segundo plano a janela a partir de self.inicio com os filtros da tela"""
+        parametros = self._parametros()
+        if parametros is None:
+            return
+        self.ultima_consulta += 1
+        self.ultima_reconsulta = time.monotonic()
+        self.fila_consultas.put((self.ultima_consulta, self.inicio, parametros))
+
+    def _atender_consultas(self):
+        try:
+            self.fila_respostas.put(('itens', self.shm_manager.obter_itens()))
+        except Exception as e:
+            print(f"Erro ao listar itens: {e}")
+        while True:
+            consulta = self.fila_consultas.get()
+            # Só a mais recente interessa
+            try:
+                while consulta is not None:
+                    consulta = self.fila_consultas.get_nowait()
+            except queue.Empty:
+                pass
+            if consulta is None:
+                break
+            numero, inicio, parametros = consulta
+            try:
+                total, pedidos = self.shm_manager.consultar_pedidos(inicio=inicio, quantidade=self.LINHAS,
+                                                                    **parametros)
+                linhas = tuple(SistemaGUI._linha_pedido(pedido.id, pedido.mesa, pedido.item, pedido.status,
+                                                        pedido.produtor_id, pedido.consumidor_id) +
+                               (datetime.fromtimestamp(pedido.timestamp).strftime("%d/%m/%Y %H:%M:%S"),)
+                               for pedido in pedidos)
+                self.fila_respostas.put(('pedidos', (numero, inicio, total, linhas)))
+            except Exception as e:
+                self.fila_respostas.put(('erro', (numero, str(e))))
+
+    def drenar_respostas(self):
+        """Callback after(): mostra a resposta da consulta mais recente e se reagenda"""
+        try:
+            while True:
+                tipo, dados = self.fila_respostas.get_nowait()
+                if tipo == 'itens':
+                    self.combo_item.config(values=['Todos'] + sorted(set(Produtor.ITENS_MENU) | set(dados)))
+                elif dados[0] == self.ultima_consulta:
+                    if tipo == 'erro':
+                        self.label_total.config(text=f"Erro na consulta: {dados[1]}")
+                    else:
+                        self.mostrar(*dados[1:])
+        except queue.Empty:
+            pass
+        except Exception as e:
+            print(f"Erro ao mostrar consulta: {e}")
+        if time.monotonic() - self.ultima_reconsulta >= self.INTERVALO_RECONSULTA_MS / 1000:
+            self.consultar()
+        self.id_respostas = self.janela.after(self.INTERVALO_RESPOSTAS_MS, self.drenar_respostas)
+
+    def mostrar(self, inicio, total, linhas):
+        self.total = total
+        if not linhas and inicio > 0 and total > 0:
+            # A janela saiu do fim (pedidos cancelados ou dados limpos): voltar ao último trecho
+            self.inicio = max(0, total - self.LINHAS)
+            self.consultar()
+            return
+        self.tree.delete(*self.tree.get_children())
+        for iid, valores, tag, criado in linhas:
+            self.tree.insert('', 'end', iid=iid, values=valores + (criado,), tags=(tag,))
+        if total:
+            self.scrollbar.set(inicio / total, min(1.0, (inicio + len(linhas)) / total))
+            self.label_total.config(text=f"Pedidos {inicio + 1}–{inicio + len(linhas)} de {total}")
+        else:
+            self.scrollbar.set(0.0, 1.0)
+            self.label_total.config(text="Nenhum pedido encontrado")
+
+    def _ir_para(self, inicio: int):
+        inicio = max(0, min(int(inicio), self.total - self.LINHAS))
+        if inicio != self.inicio:
+            self.inicio = inicio
+            self.consultar()
+
+    def mover(self, linhas: int):
+        self._ir_para(self.inicio + linhas)
+
+    def rolar(self, acao, *args):
+        """Comando da barra de rolagem: moveto fração | scroll n units|pages"""
+        if acao == 'moveto':
+            self._ir_para(float(args[0]) * self.total)
+        elif acao == 'scroll':
+            self.mover(int(args[0]) * (self.LINHAS if args[1] == 'pages' else 1))
+
+    def roda_mouse(self, event):
+        if event.num == 4 or getattr(event, 'delta', 0) > 0:
+            self.mover(-3)
+        else:
+            self.mover(3)
+        return 'break'
+
+    def fechar(self):
+        self.fila_consultas.put(None)
+        if self.id_respostas is not None:
+            self.janela.after_cancel(self.id_respostas)
+            self.id_respostas = None
+        self.janela.destroy()
+        self.gui.navegador = None
+
 
 class SistemaGUI:
     def __init__(self, sistema):
@@ -25,6 +277,23 @@ class SistemaGUI:
         self.cor_concluido = '#27ae60'
 
         self.shm_manager = None
+        # Posição no feed de mudanças já lida pela thread de leitura (None = redesenhar)
+        self.cursor_mudancas = None
+        # Instantâneos montados fora da thread da interface, esvaziados em callbacks after()
+        self.fila_instantaneos = queue.Queue()
+        self.id_drenagem = None
+        # Último erro registrado ao aplicar instantâneos (evita repetir a cada ciclo)
+        self.ultimo_erro_atualizacao = None
+        # Falhas ao arquivar concluídos já registradas no log
+        self.falhas_arquivo_registradas = 0
+        self.trabalhadores = {}
+        # Métricas dos processos lidas em segundo plano; a última amostra recebida
+        self.amostrador = None
+        self.metricas = {}
+        # Janela de consulta de pedidos aberta (NavegadorPedidos)
+        self.navegador = None
+        # Exportação em segundo plano (a última iniciada)
+        self.exportador = None
         self.rodando = False
         self.sistema_iniciado = False
         self.timer_parada = None
@@ -95,6 +364,26 @@ class SistemaGUI:
         tk.Label(grid_frame, text="(0 = ilimitado)", font=("Arial", 8, "italic"),
                 bg=self.cor_frame, fg='gray').grid(row=0, column=6, padx=5, pady=5, sticky='w')
 
+        # Exportação: formatos e origem dos pedidos
+        tk.Label(grid_frame, text="Exportar:", font=("Arial", 10),
+                bg=self.cor_frame).grid(row=1, column=0, padx=5, pady=5, sticky='e')
+
+        self.combo_formato = ttk.Combobox(grid_frame, values=list(self.FORMATOS_EXPORTACAO),
+                                          state='readonly', width=18)
+        self.combo_formato.set('CSV + JSONL')
+        self.combo_formato.grid(row=1, column=1, padx=5, pady=5, sticky='w')
+
+        tk.Label(grid_frame, text="Origem:", font=("Arial", 10),
+                bg=self.cor_frame).grid(row=1, column=2, padx=5, pady=5, sticky='e')
+
+        self.combo_origem = ttk.Combobox(grid_frame, values=list(self.ORIGENS_EXPORTACAO),
+                                         state='readonly', width=22)
+        self.combo_origem.set('Memória + arquivo')
+        self.combo_origem.grid(row=1, column=3, padx=5, pady=5, sticky='w')
+
+        self.progresso_exportacao = ttk.Progressbar(grid_frame, length=150, maximum=100)
+        self.progresso_exportacao.grid(row=1, column=4, columnspan=2, padx=5, pady=5, sticky='w')
+
         # Linha 2: Botões de ação
         btn_frame = tk.Frame(frame, bg=self.cor_frame)
         btn_frame.pack(fill=tk.X, pady=(10, 0))
@@ -123,6 +412,12 @@ class SistemaGUI:
                                       padx=20, pady=10, cursor='hand2')
         self.btn_exportar.pack(side=tk.LEFT, padx=5)
 
+        self.btn_consultar = tk.Button(btn_frame, text="🔎 CONSULTAR PEDIDOS",
+                                       font=("Arial", 12), bg='#8e44ad',
+                                       fg='white', command=self.abrir_consulta,
+                                       padx=20, pady=10, cursor='hand2')
+        self.btn_consultar.pack(side=tk.LEFT, padx=5)
+
         # Label de status
         self.label_status = tk.Label(btn_frame, text="● Sistema Parado",
                                      font=("Arial", 12, "bold"), bg=self.cor_frame,
@@ -142,6 +437,36 @@ class SistemaGUI:
         self.label_em_fila = self.criar_stat_label(stats_grid, "Em Fila", "0", self.cor_pendente, 1, 0)
         self.label_em_preparo = self.criar_stat_label(stats_grid, "Em Preparo", "0", self.cor_preparo, 1, 1)
 
+        # Percentis de latência (histogramas mantidos na memória compartilhada)
+        latencias_grid = tk.Frame(frame, bg=self.cor_frame)
+        latencias_grid.pack(fill=tk.X, pady=(5, 0))
+        for col, titulo in enumerate(("", "p50", "p95", "p99")):
+            tk.Label(latencias_grid, text=titulo, font=("Arial", 9, "bold"),
+                     bg=self.cor_frame).grid(row=0, column=col, sticky='ew')
+            latencias_grid.grid_columnconfigure(col, weight=1)
+
+        self.labels_latencia = {}
+        for row, (chave, titulo) in enumerate((('espera', "Espera na fila"), ('preparo', "Preparo"),
+                                               ('total', "Total")), start=1):
+            tk.Label(latencias_grid, text=titulo, font=("Arial", 9), bg=self.cor_frame,
+                     anchor='w').grid(row=row, column=0, sticky='ew')
+            for col, ponto in enumerate(('p50', 'p95', 'p99'), start=1):
+                label = tk.Label(latencias_grid, text="-", font=("Arial", 9), bg=self.cor_frame)
+                label.grid(row=row, column=col, sticky='ew')
+                self.labels_latencia[(chave, ponto)] = label
+
+    @staticmethod
+    def formatar_duracao(segundos):
+        if segundos is None:
+            return "-"
+        if segundos < 1:
+            return f"{segundos * 1000:.0f} ms"
+        return f"{segundos:.1f} s"
+
+    def atualizar_latencias(self, percentis):
+        for (chave, ponto), label in self.labels_latencia.items():
+            label.config(text=self.formatar_duracao(percentis.get(chave, {}).get(ponto)))
+
     def criar_stat_label(self, parent, texto, valor, cor, row, col):
         container = tk.Frame(parent, bg=cor, relief=tk.RAISED, borderwidth=2)
         container.grid(row=row, column=col, padx=5, pady=5, sticky='ew')
@@ -157,12 +482,12 @@ class SistemaGUI:
                              font=("Arial", 12, "bold"), bg=self.cor_frame, padx=10, pady=10)
         frame.pack(fill=tk.BOTH, expand=True)
 
-        columns = ('Tipo', 'ID', 'PID', 'Status', 'CPU%', 'MEM (MB)')
+        columns = ('Tipo', 'ID', 'PID', 'Status', 'CPU%', 'MEM (MB)', 'Threads', 'Trocas/s')
         self.tree_processos = ttk.Treeview(frame, columns=columns, show='headings', height=8)
 
         for col in columns:
             self.tree_processos.heading(col, text=col)
-            self.tree_processos.column(col, width=100 if col == 'Tipo' else 80)
+            self.tree_processos.column(col, width=100 if col == 'Tipo' else 80 if col != 'ID' else 40)
 
         scrollbar = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.tree_processos.yview)
         self.tree_processos.configure(yscroll=scrollbar.set)
@@ -219,9 +544,8 @@ class SistemaGUI:
                 messagebox.showerror("Erro", "Número de consumidores deve estar entre 1 e 10")
                 return
 
-            # Resetar flag de encerramento
-            if self.shm_manager:
-                self.shm_manager.em_encerramento = False
+            # Estado compartilhado de volta a EXECUTANDO antes de criar os processos
+            self.sistema.shm_manager.resetar_encerramento()
 
             # Desabilitar controles
             self.spin_produtores.config(state='disabled')
@@ -244,6 +568,13 @@ class SistemaGUI:
             # Criar processos
             self.sistema.criar_processos(num_produtores, num_consumidores)
 
+            # Consumidores acompanhando a fila, se configurado
+            if self.sistema.iniciar_autoescala(
+                    ao_mudar=lambda mensagem: self.root.after(0, self.adicionar_log, mensagem)):
+                autoescala = self.sistema.autoescala
+                self.adicionar_log(f"Autoescala ativa: {autoescala.min_consumidores} a "
+                                   f"{autoescala.max_consumidores} consumidores")
+
             self.sistema_iniciado = True
             self.rodando = True
 
@@ -285,6 +616,7 @@ class SistemaGUI:
 
         # Parar atualização
         self.rodando = False
+        self.parar_amostrador()
 
         # Encerrar processos
         self.sistema.encerrar_processos()
@@ -302,126 +634,98 @@ class SistemaGUI:
         self.sistema_iniciado = False
         self.adicionar_log("✓ Sistema parado com sucesso")
 
+    # Tempo máximo esperando os pedidos em preparo e a saída de cada grupo de processos
+    TIMEOUT_DRENAGEM = 60
+    TIMEOUT_SAIDA_PROCESSOS = 2.0
+
+    def _aguardar_saida(self, tipo):
+        """Espera os processos do tipo saírem sozinhos; terminate/kill só para os que não saírem
+
+        Bloqueia: roda na thread de encerramento, nunca na do Tk.
+        """
+        limite = time.monotonic() + self.TIMEOUT_SAIDA_PROCESSOS
+        forcados = 0
+        for proc_info in self.sistema.listar_processos(tipo):
+            proc = proc_info['process']
+            proc.join(timeout=max(0.0, limite - time.monotonic()))
+            if proc.is_alive():
+                forcados += 1
+                proc.terminate()
+                proc.join(timeout=1)
+                if proc.is_alive():
+                    proc.kill()
+                    proc.join()
+        if forcados:
+            self.root.after(0, self.adicionar_log,
+                            f"⚠️ {forcados} {tipo}(es) não saíram sozinhos e foram terminados")
+
     def parar_sistema_graceful(self):
-        """Parada graceful: cancela pendentes e aguarda em preparo"""
+        """Parada graceful: drena pelo estado compartilhado, cancela pendentes e aguarda em preparo
+
+        As esperas (saída dos processos, pedidos em preparo) ficam na thread
+        de encerramento; a janela continua respondendo durante a parada.
+        """
+        shm_manager = self.sistema.shm_manager
         try:
             # Mudar status visual
             self.label_status.config(text="⏳ Finalizando...", fg='#f39c12')
             self.btn_parar.config(state=tk.DISABLED)
 
-            # 1. MARCAR SISTEMA EM ENCERRAMENTO (impede consumidores pegarem novos pedidos)
-            if self.shm_manager:
-                self.shm_manager.marcar_encerramento()
-                self.adicionar_log("🚫 Sistema marcado para encerramento")
+            # Sem novas subidas/descidas durante a parada
+            self.sistema.parar_autoescala()
 
-            # 2. Encerrar produtores
-            self.adicionar_log("🛑 Encerrando produtores...")
-            for proc_info in self.sistema.processos.get('produtor', []):
-                proc = proc_info['process']
-                if proc.is_alive():
-                    proc.terminate()
-                    proc.join(timeout=1)
-                    if proc.is_alive():
-                        proc.kill()
+            # 1. DRENANDO: produtores param de gerar e consumidores de retirar, todos acordados já
+            shm_manager.marcar_encerramento()
+            self.adicionar_log(f"🚫 Sistema em drenagem (época {shm_manager.obter_epoca_drenagem()})")
+        except Exception as e:
+            self.adicionar_log(f"❌ Erro durante parada: {e}")
 
-            # Aguardar produtores pararem
-            import time
-            time.sleep(0.5)
+        def ao_mudar(n, em_preparo):
+            self.root.after(0, lambda: self.label_status.config(
+                text=f"⏳ Aguardando {n} pedidos..." if n > 0 else "⏳ Finalizando...", fg='#f39c12'))
+            if n != em_preparo:
+                self.root.after(0, self.adicionar_log, f"📉 Restam {n} pedidos em preparo")
 
-            # 3. Cancelar pedidos pendentes
-            if self.shm_manager:
-                pendentes = self.shm_manager.cancelar_pedidos_pendentes()
+        def aguardar_conclusao():
+            try:
+                # 2. Produtores saem sozinhos ao ver o estado
+                self.root.after(0, self.adicionar_log, "🛑 Encerrando produtores...")
+                self._aguardar_saida('produtor')
+
+                # 3. Cancelar pedidos pendentes
+                pendentes = shm_manager.cancelar_pedidos_pendentes()
                 if pendentes > 0:
-                    self.adicionar_log(f"❌ {pendentes} pedidos pendentes cancelados")
+                    self.root.after(0, self.adicionar_log, f"❌ {pendentes} pedidos pendentes cancelados")
 
-            # 4. Aguardar pedidos em preparo
-            if self.shm_manager:
-                em_preparo = self.shm_manager.obter_pedidos_em_preparo()
+                # 4. Aguardar pedidos em preparo
+                em_preparo = shm_manager.obter_pedidos_em_preparo()
                 if em_preparo > 0:
-                    self.adicionar_log(f"⏳ Aguardando {em_preparo} pedidos em preparo...")
-                    self.label_status.config(
-                        text=f"⏳ Aguardando {em_preparo} pedidos...",
-                        fg='#f39c12'
-                    )
-
-                    def aguardar_conclusao():
-                        import time
-                        timeout = 60
-                        tempo_inicio = time.time()
-                        ultima_contagem = em_preparo
-                        tempo_sem_mudanca = 0
-
-                        while True:
-                            if not self.shm_manager:
-                                break
-
-                            em_preparo_atual = self.shm_manager.obter_pedidos_em_preparo()
-
-                            # Log de progresso quando contador muda
-                            if em_preparo_atual != ultima_contagem:
-                                ultima_contagem = em_preparo_atual
-                                tempo_sem_mudanca = 0
-                                self.root.after(0, lambda n=em_preparo_atual: self.adicionar_log(
-                                    f"📉 Restam {n} pedidos em preparo"
-                                ))
-                            else:
-                                tempo_sem_mudanca += 1
-
-                            # Atualizar label
-                            self.root.after(0, lambda n=em_preparo_atual:
-                            self.label_status.config(
-                                text=f"⏳ Aguardando {n} pedidos..." if n > 0
-                                else "⏳ Finalizando...",
-                                fg='#f39c12'
-                            ))
-
-                            if em_preparo_atual == 0:
-                                self.root.after(0, lambda: self.adicionar_log(
-                                    "✓ Todos os pedidos em preparo foram concluídos"
-                                ))
-                                break
-
-                            # Timeout geral (60s)
-                            if time.time() - tempo_inicio > timeout:
-                                self.root.after(0, lambda n=em_preparo_atual: self.adicionar_log(
-                                    f"⚠️ Timeout: Forçando encerramento ({n} pedidos não finalizados)"
-                                ))
-                                break
-
-                            # Timeout por inatividade (15s sem mudança)
-                            if tempo_sem_mudanca > 15:
-                                self.root.after(0, lambda n=em_preparo_atual: self.adicionar_log(
-                                    f"⚠️ Timeout por inatividade ({n} pedidos travados)"
-                                ))
-                                break
-
-                            time.sleep(1)
-
-                        self.root.after(0, self.finalizar_encerramento)
-
-                    from threading import Thread
-                    Thread(target=aguardar_conclusao, daemon=True).start()
-                else:
-                    self.finalizar_encerramento()
-            else:
-                self.finalizar_encerramento()
-
-        except Exception as e:
-            self.adicionar_log(f"❌ Erro durante parada: {e}")
-            self.finalizar_encerramento()
+                    self.root.after(0, self.adicionar_log, f"⏳ Aguardando {em_preparo} pedidos em preparo...")
+                    # Acorda a cada conclusão; leases vencidos (consumidor morto) voltam à fila
+                    if shm_manager.aguardar_drenagem(self.TIMEOUT_DRENAGEM, lambda n: ao_mudar(n, em_preparo)):
+                        self.root.after(0, self.adicionar_log, "✓ Todos os pedidos em preparo foram concluídos")
+                    else:
+                        n = shm_manager.obter_pedidos_em_preparo()
+                        self.root.after(0, self.adicionar_log,
+                                        f"⚠️ Timeout: Forçando encerramento ({n} pedidos não finalizados)")
+                    recuperados = shm_manager.cancelar_pedidos_pendentes()
+                    if recuperados > 0:
+                        self.root.after(0, self.adicionar_log,
+                                        f"💀 {recuperados} pedidos de consumidores parados cancelados")
+            except Exception as e:
+                self.root.after(0, self.adicionar_log, f"❌ Erro durante parada: {e}")
+
+            # 5. Consumidores ociosos já viram a drenagem e estão saindo
+            self.root.after(0, self.adicionar_log, "🛑 Encerrando consumidores...")
+            self._aguardar_saida('consumidor')
+            self.root.after(0, self.finalizar_encerramento)
+
+        Thread(target=aguardar_conclusao, daemon=True).start()
 
     def finalizar_encerramento(self):
-        """Finaliza o encerramento do sistema"""
+        """Finaliza o encerramento do sistema (na thread do Tk, com os processos já encerrados)"""
         try:
-            # Encerrar consumidores
-            self.adicionar_log("🛑 Encerrando consumidores...")
-            for proc_info in self.sistema.processos.get('consumidor', []):
-                proc = proc_info['process']
-                if proc.is_alive():
-                    proc.terminate()
-                    proc.join(timeout=1)
-                    if proc.is_alive():
-                        proc.kill()
+            self.sistema.shm_manager.definir_estado(EstadoExecucao.PARADO)
 
             # Cancelar timer se existir
             if self.timer_parada:
@@ -429,9 +733,10 @@ class SistemaGUI:
 
             # Parar atualização
             self.rodando = False
+            self.parar_amostrador()
 
             # Limpar lista de processos
-            self.sistema.processos = {'produtor': [], 'consumidor': []}
+            self.sistema.descartar_processos()
 
             # Reabilitar controles
             self.spin_produtores.config(state='normal')
@@ -457,6 +762,17 @@ class SistemaGUI:
             self.label_status.config(text="● Sistema Parado", fg='#e74c3c')
             self.sistema_iniciado = False
 
+    def abrir_consulta(self):
+        """Abre (ou traz para a frente) a janela de consulta de pedidos"""
+        if self.navegador is not None:
+            self.navegador.janela.lift()
+            return
+        shm_manager = self.shm_manager or self.sistema.shm_manager
+        if shm_manager is None:
+            messagebox.showwarning("Aviso", "Memória compartilhada não inicializada!")
+            return
+        self.navegador = NavegadorPedidos(self, shm_manager)
+
     def limpar_dados(self):
         """Limpa os dados da memória compartilhada"""
         if self.sistema_iniciado:
@@ -469,63 +785,187 @@ class SistemaGUI:
 
             # Limpar interface
             self.tree_pedidos.delete(*self.tree_pedidos.get_children())
+            self.cursor_mudancas = None
             self.label_total_criados.config(text="0")
             self.label_total_processados.config(text="0")
             self.label_em_fila.config(text="0")
             self.label_em_preparo.config(text="0")
+            self.atualizar_latencias({})
+
+    # Pedidos mais recentes mostrados na tabela
+    LIMITE_TABELA_PEDIDOS = 30
+    # Intervalo entre esvaziamentos da fila de instantâneos na thread da interface
+    INTERVALO_DRENAGEM_MS = 50
+
+    @staticmethod
+    def _linha_pedido(pedido_id, mesa, item, status, produtor_id, consumidor_id):
+        """(iid, valores, tag) da linha de um pedido na tabela"""
+        consumidor_str = str(consumidor_id) if consumidor_id != -1 else '-'
+        tag = 'pendente' if status == PedidoStatus.PENDENTE.value else \
+              'preparo' if status == PedidoStatus.EM_PREPARO.value else 'concluido'
+        return str(pedido_id), (pedido_id, mesa, item, status, produtor_id, consumidor_str), tag
+
+    def montar_instantaneo(self) -> InstantaneoInterface:
+        """Lê a memória e monta o próximo instantâneo (thread de leitura, nunca a da interface)
+
+        Da tabela de pedidos só vão as mudanças desde a leitura anterior:
+        criação insere no topo, mudança de status atualiza a linha se ela
+        estiver visível e remoção da arena (cancelamento) apaga. Sem cursor
+        válido (primeira leitura, dados limpos ou atraso maior que o anel de
+        mudanças), vão as linhas completas dos pedidos mais recentes.
+        """
+        shm_manager = self.shm_manager
+        cursor, mudancas = shm_manager.obter_mudancas(self.cursor_mudancas)
+        linhas = None
+        alteracoes = []
+        if mudancas is None:
+            # Mudanças entre o cursor e o instantâneo serão reaplicadas, sem efeito
+            _, pedidos = shm_manager.obter_instantaneo(recentes=self.LIMITE_TABELA_PEDIDOS)
+            linhas = tuple(self._linha_pedido(pedido.id, pedido.mesa, pedido.item, pedido.status,
+                                              pedido.produtor_id, pedido.consumidor_id)
+                           for pedido in reversed(pedidos[-self.LIMITE_TABELA_PEDIDOS:]))
+        else:
+            for mudanca in mudancas:
+                if mudanca.status is None:
+                    alteracoes.append(('remover', str(mudanca.pedido_id), None, None))
+                    continue
+                iid, valores, tag = self._linha_pedido(mudanca.pedido_id, mudanca.mesa, mudanca.item,
+                                                       mudanca.status, mudanca.produtor_id,
+                                                       mudanca.consumidor_id)
+                alteracoes.append(('inserir' if mudanca.anterior is None else 'atualizar', iid, valores, tag))
+        self.cursor_mudancas = cursor
 
-    def atualizar_interface(self):
-        """Atualiza a interface com dados da memória"""
         try:
-            if not self.shm_manager:
-                self.shm_manager = SharedMemoryManager(create=False)
-
-            stats = self.shm_manager.obter_estatisticas()
-            self.label_total_criados.config(text=str(stats.get('total_criados', 0)))
-            self.label_total_processados.config(text=str(stats.get('total_processados', 0)))
-
-            pedidos = self.shm_manager.obter_todos_pedidos()
-            em_fila = sum(1 for p in pedidos if p.status == PedidoStatus.PENDENTE.value)
-            em_preparo = sum(1 for p in pedidos if p.status == PedidoStatus.EM_PREPARO.value)
-
-            self.label_em_fila.config(text=str(em_fila))
-            self.label_em_preparo.config(text=str(em_preparo))
-
-            self.tree_pedidos.delete(*self.tree_pedidos.get_children())
-            for pedido in reversed(pedidos[-30:]):
-                consumidor_str = str(pedido.consumidor_id) if pedido.consumidor_id != -1 else '-'
-                tag = 'pendente' if pedido.status == PedidoStatus.PENDENTE.value else \
-                      'preparo' if pedido.status == PedidoStatus.EM_PREPARO.value else 'concluido'
-                self.tree_pedidos.insert('', 'end', values=(
-                    pedido.id, pedido.mesa, pedido.item, pedido.status, pedido.produtor_id, consumidor_str
-                ), tags=(tag,))
-
+            trabalhadores = {trabalhador['consumidor_id']: trabalhador
+                             for trabalhador in shm_manager.obter_trabalhadores()}
+        except Exception:
+            trabalhadores = {}
+        return InstantaneoInterface(shm_manager.obter_estatisticas(), shm_manager.obter_percentis(),
+                                    trabalhadores, tuple(alteracoes), linhas)
+
+    def aplicar_pedidos(self, instantaneo: InstantaneoInterface):
+        """Aplica à tabela de pedidos as alterações de um instantâneo"""
+        tree = self.tree_pedidos
+        if instantaneo.linhas is not None:
+            tree.delete(*tree.get_children())
+            for iid, valores, tag in instantaneo.linhas:
+                tree.insert('', 'end', iid=iid, values=valores, tags=(tag,))
+        for acao, iid, valores, tag in instantaneo.alteracoes:
+            if acao == 'remover':
+                if tree.exists(iid):
+                    tree.delete(iid)
+            elif tree.exists(iid):
+                tree.item(iid, values=valores, tags=(tag,))
+            elif acao == 'inserir':
+                # Só a criação insere; as demais só atualizam linhas visíveis
+                tree.insert('', 0, iid=iid, values=valores, tags=(tag,))
+        excedentes = tree.get_children()[self.LIMITE_TABELA_PEDIDOS:]
+        if excedentes:
+            tree.delete(*excedentes)
+
+    def aplicar_instantaneo(self, instantaneo: InstantaneoInterface):
+        """Contadores, latências e painel de processos do instantâneo mais recente"""
+        stats = instantaneo.estatisticas
+        self.label_total_criados.config(text=str(stats.get('total_criados', 0)))
+        self.label_total_processados.config(text=str(stats.get('total_processados', 0)))
+        self.label_em_fila.config(text=str(stats.get('em_fila', 0)))
+        self.label_em_preparo.config(text=str(stats.get('em_preparo', 0)))
+        falhas = stats.get('falhas_arquivo', 0)
+        if falhas > self.falhas_arquivo_registradas:
+            self.adicionar_log(f"❌ {falhas - self.falhas_arquivo_registradas} pedidos concluídos não puderam "
+                               f"ser arquivados (mantidos na memória)")
+        self.falhas_arquivo_registradas = falhas
+        self.atualizar_latencias(instantaneo.percentis)
+        self.trabalhadores = instantaneo.trabalhadores
+
+    def drenar_instantaneos(self):
+        """Callback after(): aplica os instantâneos na fila sem bloquear e se reagenda"""
+        ultimo = None
+        try:
+            while True:
+                instantaneo = self.fila_instantaneos.get_nowait()
+                # As alterações de cada instantâneo valem em sequência; o resto só do último
+                self.aplicar_pedidos(instantaneo)
+                ultimo = instantaneo
+        except queue.Empty:
+            pass
+        except Exception as e:
+            print(f"Erro ao aplicar instantâneo: {e}")
+        try:
+            if ultimo is not None:
+                self.aplicar_instantaneo(ultimo)
             self.atualizar_processos()
         except Exception as e:
-            pass
+            # Registrar uma vez por erro distinto, não a cada ciclo
+            mensagem = f"❌ Erro ao atualizar a interface: {e}"
+            if mensagem != self.ultimo_erro_atualizacao:
+                self.adicionar_log(mensagem)
+            self.ultimo_erro_atualizacao = mensagem
+        else:
+            self.ultimo_erro_atualizacao = None
+        self.id_drenagem = None
+        if self.rodando or not self.fila_instantaneos.empty():
+            self.id_drenagem = self.root.after(self.INTERVALO_DRENAGEM_MS, self.drenar_instantaneos)
+
+    def pids_trabalhadores(self):
+        """Chave da linha -> pid de cada processo listado (chamado na thread do amostrador)"""
+        return {f"{tipo}-{proc_info['id']}": proc_info['process'].pid
+                for tipo in ('produtor', 'consumidor')
+                for proc_info in self.sistema.listar_processos(tipo)
+                if proc_info['process'].pid is not None}
+
+    def iniciar_amostrador(self):
+        self.parar_amostrador()
+        self.metricas = {}
+        self.amostrador = AmostradorMetricas(self.pids_trabalhadores, self.INTERVALO_MAXIMO_ATUALIZACAO,
+                                             detalhado=True)
+        self.amostrador.iniciar()
+
+    def parar_amostrador(self):
+        if self.amostrador is not None:
+            self.amostrador.parar()
+            self.amostrador = None
 
     def atualizar_processos(self):
-        """Atualiza informações dos processos"""
-        self.tree_processos.delete(*self.tree_processos.get_children())
-        for tipo, lista_processos in self.sistema.processos.items():
-            for proc_info in lista_processos:
+        """Atualiza informações dos processos, uma linha por processo mantida entre atualizações
+
+        CPU, memória, threads e trocas de contexto vêm da última amostra do
+        AmostradorMetricas; nada aqui espera pelo psutil.
+        """
+        amostra = self.amostrador.ultima_amostra() if self.amostrador is not None else None
+        if amostra is not None:
+            self.metricas = amostra
+        # Ocupado/ocioso dos consumidores, do último instantâneo
+        trabalhadores = self.trabalhadores
+        visiveis = set()
+        for tipo in ('produtor', 'consumidor'):
+            for proc_info in self.sistema.listar_processos(tipo):
                 proc = proc_info['process']
+                iid = f"{tipo}-{proc_info['id']}"
                 try:
+                    metricas = self.metricas.get(iid, {})
                     if proc.is_alive():
-                        processo = psutil.Process(proc.pid)
-                        cpu = processo.cpu_percent(interval=0.1)
-                        mem = processo.memory_info().rss / 1024 / 1024
-                        status = "Ativo"
+                        status = "Drenando" if proc_info.get('drenando') else "Ativo"
+                        trabalhador = trabalhadores.get(proc_info['id']) if tipo == 'consumidor' else None
+                        if trabalhador is not None and trabalhador['pid'] == proc.pid:
+                            status += " (ocupado)" if trabalhador['ocupado'] else " (ocioso)"
                     else:
-                        cpu, mem, status = 0, 0, "Inativo"
-
-                    self.tree_processos.insert('', 'end', values=(
-                        tipo.capitalize(), proc_info['id'],
-                        proc.pid if proc.is_alive() else '-',
-                        status, f"{cpu:.1f}", f"{mem:.1f}"
-                    ))
+                        metricas, status = {}, "Inativo"
+
+                    valores = (tipo.capitalize(), proc_info['id'],
+                               proc.pid if proc.is_alive() else '-', status,
+                               f"{metricas.get('cpu', 0):.1f}", f"{metricas.get('memoria_mb', 0):.1f}",
+                               metricas.get('threads', '-'), f"{metricas.get('trocas_por_segundo', 0):.0f}")
+                    if self.tree_processos.exists(iid):
+                        self.tree_processos.item(iid, values=valores)
+                    else:
+                        self.tree_processos.insert('', 'end', iid=iid, values=valores)
+                    visiveis.add(iid)
                 except:
                     pass
+        removidos = [iid for iid in self.tree_processos.get_children() if iid not in visiveis]
+        if removidos:
+            self.tree_processos.delete(*removidos)
 
     def adicionar_log(self, mensagem):
         """Adiciona mensagem ao log"""
@@ -533,17 +973,54 @@ class SistemaGUI:
         self.text_logs.insert(tk.END, f"[{timestamp}] {mensagem}\n")
         self.text_logs.see(tk.END)
 
+    # Intervalo mínimo entre redesenhos e máximo sem nenhuma atualização (painel de processos)
+    INTERVALO_MINIMO_ATUALIZACAO = 0.1
+    INTERVALO_MAXIMO_ATUALIZACAO = 1.0
+
     def iniciar_atualizacao(self):
-        """Inicia thread de atualização"""
+        """Inicia a thread de leitura, acordada pelas mutações na memória compartilhada
+
+        A thread monta instantâneos (leitura da memória, contadores e linhas da
+        tabela) e os põe na fila; a thread da interface só os aplica, em
+        callbacks after(). Uma leitura lenta sob disputa pelo lock nunca trava
+        a tela.
+        """
+        self.iniciar_amostrador()
+        canal = None
+        try:
+            if not self.shm_manager:
+                self.shm_manager = abrir_memoria_compartilhada(getattr(self.sistema, 'num_fragmentos', 1))
+            canal = self.shm_manager.assinar()
+        except Exception as e:
+            # Sem canal de notificação: atualizar em intervalos fixos
+            self.adicionar_log(f"⚠️ Notificações indisponíveis ({e}), atualizando a cada segundo")
+
         def loop_atualizacao():
-            while self.rodando:
-                try:
-                    self.root.after(0, self.atualizar_interface)
-                    time.sleep(1)
-                except:
-                    break
+            try:
+                while self.rodando:
+                    try:
+                        try:
+                            self.fila_instantaneos.put(self.montar_instantaneo())
+                        except Exception as e:
+                            print(f"Erro ao ler a memória para a interface: {e}")
+                        if canal is None:
+                            time.sleep(self.INTERVALO_MAXIMO_ATUALIZACAO)
+                            continue
+                        # Agrupar rajadas de mutações em um único redesenho
+                        time.sleep(self.INTERVALO_MINIMO_ATUALIZACAO)
+                        if canal.esperar(self.INTERVALO_MAXIMO_ATUALIZACAO):
+                            canal.consumir()
+                    except:
+                        break
+            finally:
+                if canal is not None:
+                    canal.cancelar()
 
         Thread(target=loop_atualizacao, daemon=True).start()
+        # Um único ciclo de esvaziamento, mesmo reiniciando antes do anterior terminar
+        if self.id_drenagem is not None:
+            self.root.after_cancel(self.id_drenagem)
+        self.id_drenagem = self.root.after(self.INTERVALO_DRENAGEM_MS, self.drenar_instantaneos)
         self.adicionar_log("Sistema monitorando em tempo real")
 
     def executar(self):
@@ -555,114 +1032,79 @@ class SistemaGUI:
             self.root.mainloop()
         finally:
             self.rodando = False
+            self.parar_amostrador()
             if self.shm_manager:
                 self.shm_manager.close()
 
-    def exportar_dados(self):
-        """Exporta dados para arquivo CSV e JSON"""
-        try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    # Rótulos da interface -> formatos do Exportador
+    FORMATOS_EXPORTACAO = {
+        'CSV + JSONL': ('csv', 'jsonl'),
+        'CSV': ('csv',),
+        'JSONL': ('jsonl',),
+        'Colunar (binário)': ('colunar',),
+        'Todos': FORMATOS
+    }
+    ORIGENS_EXPORTACAO = {'Memória + arquivo': 'tudo', 'Só concluídos (arquivo)': 'arquivo'}
+    INTERVALO_EXPORTACAO_MS = 100
 
-            # Obter dados atuais
-            stats = self.shm_manager.obter_estatisticas() if self.shm_manager else {
-                'total_criados': 0, 'total_processados': 0, 'em_fila': 0
-            }
-            pedidos = self.shm_manager.obter_todos_pedidos() if self.shm_manager else []
+    def exportar_dados(self):
+        """Inicia a exportação em segundo plano; o progresso é acompanhado por after()"""
+        if self.exportador is not None and self.exportador.em_andamento():
+            messagebox.showwarning("Aviso", "Já existe uma exportação em andamento!")
+            return
+        shm_manager = self.shm_manager or self.sistema.shm_manager
+        if shm_manager is None:
+            messagebox.showwarning("Aviso", "Memória compartilhada não inicializada!")
+            return
 
-            # Obter parâmetros da configuração
-            try:
-                num_produtores = int(self.spin_produtores.get())
-                num_consumidores = int(self.spin_consumidores.get())
-                duracao = int(self.spin_duracao.get())
-            except:
-                num_produtores = len(self.sistema.processos.get('produtor', []))
-                num_consumidores = len(self.sistema.processos.get('consumidor', []))
-                duracao = 0
-
-            # Exportar para CSV
-            csv_filename = f'pedidos_{timestamp}.csv'
-            with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-
-                # Cabeçalho com parâmetros
-                writer.writerow(['PARÂMETROS DO SISTEMA'])
-                writer.writerow(['Número de Produtores', num_produtores])
-                writer.writerow(['Número de Consumidores', num_consumidores])
-                writer.writerow(['Duração (segundos)', duracao if duracao > 0 else 'Ilimitada'])
-                writer.writerow(['Data/Hora Exportação', datetime.now().strftime("%d/%m/%Y %H:%M:%S")])
-                writer.writerow([])
-
-                # Estatísticas
-                writer.writerow(['ESTATÍSTICAS'])
-                writer.writerow(['Total Criados', stats.get('total_criados', 0)])
-                writer.writerow(['Total Processados', stats.get('total_processados', 0)])
-                writer.writerow(['Em Fila', stats.get('em_fila', 0)])
-                em_preparo = len([p for p in pedidos if p.status == 'Em Preparo'])
-                writer.writerow(['Em Preparo', em_preparo])
-                writer.writerow([])
-
-                # Pedidos
-                writer.writerow(['FILA DE PEDIDOS'])
-                writer.writerow(['ID', 'Mesa', 'Item', 'Status', 'Produtor', 'Consumidor', 'Timestamp'])
-
-                for pedido in pedidos:
-                    timestamp_pedido = datetime.fromtimestamp(pedido.timestamp).strftime("%d/%m/%Y %H:%M:%S")
-                    consumidor_str = str(pedido.consumidor_id) if pedido.consumidor_id != -1 else 'N/A'
-                    writer.writerow([
-                        pedido.id,
-                        pedido.mesa,
-                        pedido.item,
-                        pedido.status,
-                        pedido.produtor_id,
-                        consumidor_str,
-                        timestamp_pedido
-                    ])
-
-            # Exportar para JSON
-            json_filename = f'pedidos_{timestamp}.json'
-            dados_json = {
-                'parametros': {
-                    'num_produtores': num_produtores,
-                    'num_consumidores': num_consumidores,
-                    'duracao_segundos': duracao if duracao > 0 else 'ilimitada',
-                    'data_exportacao': datetime.now().isoformat()
-                },
-                'estatisticas': {
-                    'total_criados': stats.get('total_criados', 0),
-                    'total_processados': stats.get('total_processados', 0),
-                    'em_fila': stats.get('em_fila', 0),
-                    'em_preparo': em_preparo
-                },
-                'pedidos': [
-                    {
-                        'id': p.id,
-                        'mesa': p.mesa,
-                        'item': p.item,
-                        'status': p.status,
-                        'produtor_id': p.produtor_id,
-                        'consumidor_id': p.consumidor_id if p.consumidor_id != -1 else None,
-                        'timestamp': datetime.fromtimestamp(p.timestamp).isoformat()
-                    }
-                    for p in pedidos
-                ]
-            }
-
-            with open(json_filename, 'w', encoding='utf-8') as jsonfile:
-                json.dump(dados_json, jsonfile, indent=2, ensure_ascii=False)
-
-            # Mensagem de sucesso
-            from tkinter import messagebox
-            messagebox.showinfo(
-                "Exportação Concluída",
-                f"Dados exportados com sucesso!\n\n"
-                f"📄 CSV: {csv_filename}\n"
-                f"📄 JSON: {json_filename}\n\n"
-                f"Total de pedidos: {len(pedidos)}"
-            )
-
-            self.adicionar_log(f"📊 Dados exportados: {csv_filename}, {json_filename}")
+        # Parâmetros da configuração, lidos aqui na thread da interface
+        try:
+            parametros = {'num_produtores': int(self.spin_produtores.get()),
+                          'num_consumidores': int(self.spin_consumidores.get()),
+                          'duracao': int(self.spin_duracao.get())}
+        except:
+            parametros = {'num_produtores': len(self.sistema.listar_processos('produtor')),
+                          'num_consumidores': len(self.sistema.listar_processos('consumidor')),
+                          'duracao': 0}
 
+        try:
+            self.exportador = Exportador(shm_manager, f"pedidos_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+                                         self.FORMATOS_EXPORTACAO[self.combo_formato.get()],
+                                         self.ORIGENS_EXPORTACAO[self.combo_origem.get()], parametros)
+            self.exportador.iniciar()
         except Exception as e:
-            from tkinter import messagebox
             messagebox.showerror("Erro", f"Erro ao exportar dados:\n{e}")
-            self.adicionar_log(f"❌ Erro ao exportar: {e}")
\ No newline at end of file
+            self.adicionar_log(f"❌ Erro ao exportar: {e}")
+            return
+        self.btn_exportar.config(state=tk.DISABLED)
+        self.progresso_exportacao.config(value=0)
+        self.adicionar_log("📊 Exportação iniciada")
+        self.root.after(self.INTERVALO_EXPORTACAO_MS, self.acompanhar_exportacao)
+
+    def acompanhar_exportacao(self):
+        """Callback after(): atualiza a barra de progresso até a exportação terminar"""
+        fim = None
+        try:
+            while True:
+                evento = self.exportador.fila.get_nowait()
+                if evento[0] == 'progresso':
+                    _, escritos, total = evento
+                    self.progresso_exportacao.config(value=100 * escritos / total if total else 100)
+                else:
+                    fim = evento
+        except queue.Empty:
+            pass
+        if fim is None:
+            self.root.after(self.INTERVALO_EXPORTACAO_MS, self.acompanhar_exportacao)
+            return
+
+        self.btn_exportar.config(state=tk.NORMAL)
+        if fim[0] == 'concluido':
+            _, escritos, caminhos = fim
+            arquivos = "\n".join(f"📄 {formato.upper()}: {caminho}" for formato, caminho in caminhos.items())
+            messagebox.showinfo("Exportação Concluída",
+                                f"Dados exportados com sucesso!\n\n{arquivos}\n\nTotal de pedidos: {escritos}")
+            self.adicionar_log(f"📊 Dados exportados: {', '.join(caminhos.values())}")
+        else:
+            messagebox.showerror("Erro", f"Erro ao exportar dados:\n{fim[1]}")
+            self.adicionar_log(f"❌ Erro ao exportar: {fim[1]}")
@@ -1,49 +1,177 @@
+import argparse
+import threading
 import time
-from multiprocessing import Process
-from shared_memory_manager import SharedMemoryManager
+from shared_memory_manager import PoliticaDespacho
+from sharded_memory_manager import abrir_memoria_compartilhada
 from producer import iniciar_produtor
-from consumer import iniciar_consumidor
+from consumer import iniciar_consumidor, iniciar_consumidor_async
+from supervisor import Supervisor
+from autoscaler import Autoescalador, ConfiguracaoAutoescala
 from gui import SistemaGUI
 
 class SistemaRestaurante:
-    def __init__(self):
+    def __init__(self, num_fragmentos=1, politica=PoliticaDespacho.FIFO, prioridade_max=0, prazo=None,
+                 cozinheiros_por_processo=1, autoescala=None, lote_item=1):
         self.processos = {'produtor': [], 'consumidor': []}
+        # A autoescala altera a lista de consumidores em outra thread: toda escrita troca a lista
+        # inteira sob a trava, e quem percorre (interface, amostrador) usa listar_processos()
+        self.trava_processos = threading.Lock()
+        # Ids de consumidor nunca se repetem na execução (tabela de batimentos, logs)
+        self.proximo_consumidor_id = 1
         self.shm_manager = None
+        # Filas independentes, cada uma com seu lock (1 = arena única)
+        self.num_fragmentos = num_fragmentos
+        # Ordem de despacho e urgência dos pedidos gerados pelos produtores
+        self.politica = PoliticaDespacho(politica)
+        self.prioridade_max = prioridade_max
+        self.prazo = prazo
+        # Acima de 1, cada processo consumidor roda esse número de cozinheiros assíncronos
+        self.cozinheiros_por_processo = cozinheiros_por_processo
+        # Cria os processos em paralelo e marca o início quando todos estão prontos
+        self.supervisor = Supervisor()
+        # ConfiguracaoAutoescala: consumidores seguem a fila entre os limites (None = fixos)
+        self.autoescala = autoescala
+        self.autoescalador = None
+        # Acima de 1, cada cozinheiro prepara juntos até esse número de pedidos do mesmo item
+        self.lote_item = lote_item
 
     def inicializar_memoria_compartilhada(self):
         print("Inicializando memória compartilhada...")
         try:
-            temp_shm = SharedMemoryManager(create=False)
+            # Resíduo de uma execução anterior: não esperar se não houver
+            temp_shm = abrir_memoria_compartilhada(self.num_fragmentos, timeout_anexacao=0)
             temp_shm.unlink()
             temp_shm.close()
         except:
             pass
 
-        self.shm_manager = SharedMemoryManager(create=True)
-        print("✓ Memória compartilhada inicializada")
+        self.shm_manager = abrir_memoria_compartilhada(self.num_fragmentos, create=True,
+                                                       politica=self.politica)
+        if self.num_fragmentos > 1:
+            print(f"✓ Memória compartilhada inicializada ({self.num_fragmentos} fragmentos)")
+        else:
+            print("✓ Memória compartilhada inicializada")
+        self.supervisor.preparar()
 
-    def criar_processos(self, num_produtores, num_consumidores):
-        print(f"\nCriando {num_produtores} produtores...")
+    def criar_processos(self, num_produtores, num_consumidores, cozinheiros_por_processo=None):
+        if cozinheiros_por_processo is None:
+            cozinheiros_por_processo = self.cozinheiros_por_processo
+
+        if self.autoescala:
+            num_consumidores = min(max(num_consumidores, self.autoescala.min_consumidores),
+                                   self.autoescala.max_consumidores)
+
+        # (tipo, id, alvo, args, kwargs) de cada processo
+        trabalhadores = []
         for i in range(1, num_produtores + 1):
-            p = Process(target=iniciar_produtor, args=(i,))
-            p.start()
-            self.processos['produtor'].append({'id': i, 'process': p})
-            print(f"  ✓ Produtor {i} criado (PID: {p.pid})")
-            time.sleep(0.2)
-
-        print(f"\nCriando {num_consumidores} consumidores...")
-        for i in range(1, num_consumidores + 1):
-            p = Process(target=iniciar_consumidor, args=(i,))
-            p.start()
-            self.processos['consumidor'].append({'id': i, 'process': p})
-            print(f"  ✓ Consumidor {i} criado (PID: {p.pid})")
-            time.sleep(0.2)
+            trabalhadores.append(('produtor', i, iniciar_produtor, (i,),
+                                  {'num_fragmentos': self.num_fragmentos,
+                                   'prioridade_max': self.prioridade_max,
+                                   'prazo': self.prazo}))
+        for i in self._reservar_ids_consumidor(num_consumidores):
+            trabalhadores.append(('consumidor', i) + self._trabalhador_consumidor(i, cozinheiros_por_processo))
+
+        if cozinheiros_por_processo > 1:
+            print(f"\nCriando {num_produtores} produtores e {num_consumidores} consumidores "
+                  f"com {cozinheiros_por_processo} cozinheiros cada...")
+        else:
+            print(f"\nCriando {num_produtores} produtores e {num_consumidores} consumidores...")
+        inicio = time.perf_counter()
+        processos = self.supervisor.iniciar([(alvo, args, kwargs) for _, _, alvo, args, kwargs in trabalhadores])
+
+        for (tipo, i, _, _, kwargs), p in zip(trabalhadores, processos):
+            self._registrar_processo(tipo, {'id': i, 'process': p, 'drenar': kwargs.get('drenar'), 'drenando': False})
+            print(f"  ✓ {tipo.capitalize()} {i} criado (PID: {p.pid})")
+        print(f"✓ {len(processos)} processos prontos em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return True
+
+    def listar_processos(self, tipo):
+        """Cópia da lista de processos do tipo (segura para percorrer de qualquer thread)"""
+        with self.trava_processos:
+            return list(self.processos.get(tipo, []))
+
+    def descartar_processos(self):
+        """Esquece os processos da execução (depois de todos terem saído)"""
+        with self.trava_processos:
+            self.processos = {'produtor': [], 'consumidor': []}
+
+    def _registrar_processo(self, tipo, proc_info):
+        with self.trava_processos:
+            self.processos[tipo] = self.processos[tipo] + [proc_info]
+
+    def _reservar_ids_consumidor(self, quantidade):
+        with self.trava_processos:
+            inicio = self.proximo_consumidor_id
+            self.proximo_consumidor_id += quantidade
+        return range(inicio, inicio + quantidade)
+
+    def _trabalhador_consumidor(self, consumidor_id, cozinheiros_por_processo=None):
+        """(alvo, args, kwargs) de um consumidor, com seu evento de drenagem"""
+        if cozinheiros_por_processo is None:
+            cozinheiros_por_processo = self.cozinheiros_por_processo
+        kwargs = {'num_fragmentos': self.num_fragmentos, 'drenar': self.supervisor.contexto.Event(),
+                  'lote_item': self.lote_item}
+        if cozinheiros_por_processo > 1:
+            return iniciar_consumidor_async, (consumidor_id, cozinheiros_por_processo), kwargs
+        return iniciar_consumidor, (consumidor_id,), kwargs
+
+    # --- Autoescala de consumidores ---
+
+    def consumidores_ativos(self):
+        """Consumidores vivos que não estão sendo drenados"""
+        return [proc_info for proc_info in self.listar_processos('consumidor')
+                if not proc_info.get('drenando') and proc_info['process'].is_alive()]
+
+    def adicionar_consumidor(self):
+        """Inicia mais um consumidor (esperando ele se anexar); retorna seu id"""
+        consumidor_id = self._reservar_ids_consumidor(1)[0]
+        alvo, args, kwargs = self._trabalhador_consumidor(consumidor_id)
+        p = self.supervisor.iniciar([(alvo, args, kwargs)])[0]
+        self._registrar_processo('consumidor', {'id': consumidor_id, 'process': p,
+                                                'drenar': kwargs['drenar'], 'drenando': False})
+        return consumidor_id
+
+    def drenar_consumidor(self):
+        """Pede ao consumidor ativo mais novo que termine o que tem e saia; retorna seu id"""
+        with self.trava_processos:
+            ativos = [proc_info for proc_info in self.processos['consumidor']
+                      if not proc_info.get('drenando') and proc_info['process'].is_alive()]
+            if not ativos:
+                return None
+            proc_info = ativos[-1]
+            proc_info['drenando'] = True
+        proc_info['drenar'].set()
+        return proc_info['id']
+
+    def recolher_consumidores_drenados(self):
+        """Remove da lista os consumidores drenados que já saíram"""
+        with self.trava_processos:
+            drenados = [proc_info for proc_info in self.processos['consumidor']
+                        if proc_info.get('drenando') and not proc_info['process'].is_alive()]
+            if drenados:
+                self.processos['consumidor'] = [proc_info for proc_info in self.processos['consumidor']
+                                                if proc_info not in drenados]
+        for proc_info in drenados:
+            proc_info['process'].join()
+        return len(drenados)
+
+    def iniciar_autoescala(self, ao_mudar=None):
+        if not self.autoescala:
+            return False
+        self.autoescalador = Autoescalador(self, self.autoescala, ao_mudar)
+        self.autoescalador.iniciar()
         return True
 
+    def parar_autoescala(self):
+        if self.autoescalador:
+            self.autoescalador.parar()
+            self.autoescalador = None
+
     def encerrar_processos(self):
         print("\nEncerrando processos...")
-        for tipo, lista_processos in self.processos.items():
-            for proc_info in lista_processos:
+        self.parar_autoescala()
+        for tipo in ('produtor', 'consumidor'):
+            for proc_info in self.listar_processos(tipo):
                 proc = proc_info['process']
                 if proc.is_alive():
                     proc.terminate()
@@ -51,7 +179,7 @@ class SistemaRestaurante:
                     if proc.is_alive():
                         proc.kill()
                         proc.join()
-        self.processos = {'produtor': [], 'consumidor': []}
+        self.descartar_processos()
         print("✓ Processos encerrados")
 
     def limpar_memoria(self):
@@ -85,5 +213,33 @@ class SistemaRestaurante:
             print("\n✓ Sistema encerrado")
 
 if __name__ == "__main__":
-    sistema = SistemaRestaurante()
+    parser = argparse.ArgumentParser(description="Sistema de gerenciamento de pedidos")
+    parser.add_argument('--fragmentos', type=int, default=1,
+                        help="número de filas independentes na memória compartilhada (padrão: 1)")
+    parser.add_argument('--politica', choices=[p.value for p in PoliticaDespacho],
+                        default=PoliticaDespacho.FIFO.value,
+                        help="ordem de despacho dos pedidos pendentes (padrão: fifo)")
+    parser.add_argument('--prioridade-max', type=int, default=0,
+                        help="prioridade máxima sorteada para cada pedido (padrão: 0)")
+    parser.add_argument('--prazo', type=float, default=None,
+                        help="prazo de cada pedido, em segundos após a criação (padrão: sem prazo)")
+    parser.add_argument('--cozinheiros', type=int, default=1,
+                        help="cozinheiros assíncronos por processo consumidor (padrão: 1)")
+    parser.add_argument('--autoescala', metavar='MIN:MAX', default=None,
+                        help="ajusta o número de consumidores à fila entre MIN e MAX (padrão: fixo)")
+    parser.add_argument('--lote-item', type=int, default=1,
+                        help="pedidos do mesmo item preparados juntos por cozinheiro (padrão: 1)")
+    args = parser.parse_args()
+
+    autoescala = None
+    if args.autoescala:
+        minimo, _, maximo = args.autoescala.partition(':')
+        minimo = max(1, int(minimo))
+        autoescala = ConfiguracaoAutoescala(min_consumidores=minimo,
+                                            max_consumidores=max(minimo, int(maximo or minimo)))
+
+    sistema = SistemaRestaurante(num_fragmentos=max(1, args.fragmentos), politica=args.politica,
+                                 prioridade_max=args.prioridade_max, prazo=args.prazo,
+                                 cozinheiros_por_processo=max(1, args.cozinheiros),
+                                 autoescala=autoescala, lote_item=max(1, args.lote_item))
     sistema.executar()
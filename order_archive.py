@@ -0,0 +1,372 @@
+"""
+Arquivo em disco dos pedidos concluídos
+
+Arquivo mapeado em memória, em que registros só são acrescentados no fim
+(todos os inteiros em little-endian):
+
+    [cabeçalho 64 bytes][dicionário de itens][registros de tamanho fixo...]
+
+O dicionário guarda cada nome de item uma única vez; o registro referencia o
+item por um código de 16 bits. Um registro é gravado antes de o contador de
+registros do cabeçalho ser incrementado, então leitores sem lock nunca veem
+registros incompletos. Escritas (anexar/limpar) devem ser serializadas pelo
+chamador; o SharedMemoryManager as faz sob o lock do segmento. Dentro de um
+processo, o mapeamento é compartilhado pelas threads que usam a mesma
+instância: remapear (quando o arquivo cresce) e ler o mapa acontecem sob uma
+trava da instância, para nenhuma thread ler um mapa já fechado. ``limpar``
+incrementa a geração do cabeçalho, para quem mantém índices sobre o arquivo.
+
+``IndiceArquivo`` mantém, no processo que consulta, índices secundários
+(posições por mesa, item, produtor e consumidor) e ordens por id e por
+criação, atualizados de forma incremental a cada consulta.
+"""
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+_MAGIC = b'PDRA'
+_VERSAO = 3
+# magic, versão, tamanho do registro, itens no dicionário, registros publicados
+_CABECALHO = struct.Struct('<4sHHI4xQ')
+_TAMANHO_CABECALHO = 64
+_OFF_NUM_ITENS = 8
+_OFF_NUM_REGISTROS = 16
+# Geração (u64, +1 a cada limpar), no espaço livre do cabeçalho: arquivos
+# antigos têm zero aqui, sem mudar o formato
+_OFF_GERACAO = 24
+
+ITEM_MAX_BYTES = 48
+MAX_ITENS = 1024
+_TAMANHO_DICIONARIO = MAX_ITENS * ITEM_MAX_BYTES
+_INICIO_REGISTROS = _TAMANHO_CABECALHO + _TAMANHO_DICIONARIO
+
+# id, timestamps de criação, conclusão, prazo e retirada, mesa, código do
+# item, produtor, consumidor, prioridade
+_REGISTRO = struct.Struct('<qddddHHiii')
+
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+
+
+class RegistroArquivado(NamedTuple):
+    id: int
+    mesa: int
+    item: str
+    timestamp: float
+    produtor_id: int
+    consumidor_id: int
+    concluido_em: float
+    prioridade: int = 0
+    deadline: float = 0.0
+    retirado_em: float = 0.0
+
+
+class ArquivoPedidos:
+    """Histórico de pedidos concluídos, só com inserções no fim"""
+
+    # Crescimento do arquivo, em registros, sempre que o mapeamento enche
+    REGISTROS_POR_EXTENSAO = 65536
+
+    def __init__(self, caminho: str, criar: bool = False):
+        self.caminho = caminho
+        self._fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o600)
+        self._mapa = None
+        # Remapeamento e leituras do mapa entre threads desta instância (reentrante)
+        self._trava_mapa = threading.RLock()
+        self._itens = []
+        self._codigos = {}
+
+        tamanho = os.fstat(self._fd).st_size
+        if criar or tamanho < _INICIO_REGISTROS:
+            os.ftruncate(self._fd, 0)
+            os.ftruncate(self._fd, _INICIO_REGISTROS + self.REGISTROS_POR_EXTENSAO * _REGISTRO.size)
+            self._mapear()
+            _CABECALHO.pack_into(self._mapa, 0, _MAGIC, _VERSAO, _REGISTRO.size, 0, 0)
+        else:
+            self._mapear()
+            magic, versao, tamanho_registro = _CABECALHO.unpack_from(self._mapa, 0)[:3]
+            if magic != _MAGIC or versao != _VERSAO or tamanho_registro != _REGISTRO.size:
+                raise ValueError(f"Arquivo '{caminho}' não possui o formato esperado")
+
+    def _mapear(self):
+        with self._trava_mapa:
+            if self._mapa is not None:
+                self._mapa.close()
+            self._mapa = mmap.mmap(self._fd, os.fstat(self._fd).st_size)
+
+    def _garantir_mapeamento(self, num_registros: int):
+        """Remapeia (estendendo o arquivo se preciso) para caber num_registros"""
+        necessario = _INICIO_REGISTROS + num_registros * _REGISTRO.size
+        with self._trava_mapa:
+            if necessario <= len(self._mapa):
+                return
+            if os.fstat(self._fd).st_size < necessario:
+                extensao = self.REGISTROS_POR_EXTENSAO * _REGISTRO.size
+                os.ftruncate(self._fd, necessario + extensao)
+            self._mapear()
+
+    def __len__(self) -> int:
+        with self._trava_mapa:
+            return _U64.unpack_from(self._mapa, _OFF_NUM_REGISTROS)[0]
+
+    # --- Dicionário de itens ---
+
+    def _carregar_itens(self):
+        """Lê entradas do dicionário gravadas por outros processos"""
+        with self._trava_mapa:
+            num_itens = _U32.unpack_from(self._mapa, _OFF_NUM_ITENS)[0]
+            for codigo in range(len(self._itens), num_itens):
+                inicio = _TAMANHO_CABECALHO + codigo * ITEM_MAX_BYTES
+                nome = self._mapa[inicio:inicio + ITEM_MAX_BYTES].rstrip(b'\0').decode('utf-8', 'ignore')
+                self._itens.append(nome)
+                self._codigos.setdefault(nome, codigo)
+
+    def _codigo_item(self, item: str) -> int:
+        """Código do item no dicionário, registrando-o se necessário; -1 se cheio"""
+        codigo = self._codigos.get(item)
+        if codigo is not None:
+            return codigo
+        with self._trava_mapa:
+            self._carregar_itens()
+            codigo = self._codigos.get(item)
+            if codigo is not None:
+                return codigo
+
+            codigo = len(self._itens)
+            if codigo >= MAX_ITENS:
+                return -1
+            dados = item.encode('utf-8')[:ITEM_MAX_BYTES]
+            inicio = _TAMANHO_CABECALHO + codigo * ITEM_MAX_BYTES
+            self._mapa[inicio:inicio + ITEM_MAX_BYTES] = dados.ljust(ITEM_MAX_BYTES, b'\0')
+            _U32.pack_into(self._mapa, _OFF_NUM_ITENS, codigo + 1)
+            self._itens.append(item)
+            self._codigos[item] = codigo
+            return codigo
+
+    def codigo_item(self, item: str) -> int:
+        """Código do item no dicionário, sem registrá-lo; -1 se nunca foi arquivado"""
+        codigo = self._codigos.get(item)
+        if codigo is None:
+            self._carregar_itens()
+            codigo = self._codigos.get(item, -1)
+        return codigo
+
+    def nomes_itens(self) -> List[str]:
+        """Itens já arquivados, na ordem do dicionário"""
+        self._carregar_itens()
+        return list(self._itens)
+
+    def _nome_item(self, codigo: int) -> str:
+        if codigo >= len(self._itens):
+            self._carregar_itens()
+        return self._itens[codigo] if codigo < len(self._itens) else '?'
+
+    # --- Escrita (serializada pelo chamador) ---
+
+    def anexar(self, pedido_id: int, mesa: int, item: str, timestamp: float,
+               produtor_id: int, consumidor_id: int, concluido_em: float,
+               prioridade: int = 0, deadline: float = 0.0, retirado_em: float = 0.0) -> bool:
+        """Acrescenta um pedido concluído; False se o dicionário de itens estiver cheio"""
+        codigo = self._codigo_item(item)
+        if codigo < 0:
+            return False
+
+        with self._trava_mapa:
+            num_registros = len(self)
+            self._garantir_mapeamento(num_registros + 1)
+            _REGISTRO.pack_into(self._mapa, _INICIO_REGISTROS + num_registros * _REGISTRO.size,
+                                pedido_id, timestamp, concluido_em, deadline, retirado_em, mesa, codigo,
+                                produtor_id, consumidor_id, prioridade)
+            # Publicar só depois de o registro estar completo
+            _U64.pack_into(self._mapa, _OFF_NUM_REGISTROS, num_registros + 1)
+        return True
+
+    def limpar(self):
+        """Descarta todos os registros (o dicionário de itens é mantido)"""
+        with self._trava_mapa:
+            _U64.pack_into(self._mapa, _OFF_NUM_REGISTROS, 0)
+            _U64.pack_into(self._mapa, _OFF_GERACAO, self.geracao() + 1)
+
+    def geracao(self) -> int:
+        with self._trava_mapa:
+            return _U64.unpack_from(self._mapa, _OFF_GERACAO)[0]
+
+    # --- Leitura (sem lock) ---
+
+    def ler(self, inicio: int = 0, fim: Optional[int] = None) -> List[RegistroArquivado]:
+        """Registros [inicio, fim) em ordem de conclusão"""
+        with self._trava_mapa:
+            total = len(self)
+            fim = total if fim is None else min(fim, total)
+            inicio = max(0, inicio)
+            if inicio >= fim:
+                return []
+
+            self._garantir_mapeamento(fim)
+            dados = self._mapa[_INICIO_REGISTROS + inicio * _REGISTRO.size:
+                               _INICIO_REGISTROS + fim * _REGISTRO.size]
+        return [
+            RegistroArquivado(pedido_id, mesa, self._nome_item(codigo), timestamp,
+                              produtor_id, consumidor_id, concluido_em, prioridade, deadline, retirado_em)
+            for pedido_id, timestamp, concluido_em, deadline, retirado_em, mesa, codigo,
+                produtor_id, consumidor_id, prioridade
+            in _REGISTRO.iter_unpack(dados)
+        ]
+
+    def _brutos(self, inicio: int, fim: int):
+        """Tuplas dos registros [inicio, fim), sem decodificar itens (uso interno)"""
+        with self._trava_mapa:
+            self._garantir_mapeamento(fim)
+            # Fatia copiada: as tuplas não dependem do mapa depois de soltar a trava
+            dados = self._mapa[_INICIO_REGISTROS + inicio * _REGISTRO.size:
+                               _INICIO_REGISTROS + fim * _REGISTRO.size]
+        return _REGISTRO.iter_unpack(dados)
+
+    def ler_posicoes(self, posicoes) -> List[RegistroArquivado]:
+        """Registros nas posições dadas, na ordem dada"""
+        registros = []
+        for posicao in posicoes:
+            pedido_id, timestamp, concluido_em, deadline, retirado_em, mesa, codigo, \
+                produtor_id, consumidor_id, prioridade = next(self._brutos(posicao, posicao + 1))
+            registros.append(RegistroArquivado(pedido_id, mesa, self._nome_item(codigo), timestamp,
+                                               produtor_id, consumidor_id, concluido_em, prioridade,
+                                               deadline, retirado_em))
+        return registros
+
+    def iterar(self, inicio: int = 0, fim: Optional[int] = None,
+               lote: int = 4096) -> Iterator[RegistroArquivado]:
+        """Percorre os registros em lotes, com memória limitada"""
+        fim = len(self) if fim is None else fim
+        for posicao in range(inicio, fim, lote):
+            yield from self.ler(posicao, min(posicao + lote, fim))
+
+    def close(self):
+        with self._trava_mapa:
+            if self._mapa is not None:
+                self._mapa.close()
+                self._mapa = None
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def unlink(self):
+        try:
+            os.unlink(self.caminho)
+        except OSError:
+            pass
+
+
+# Campos com índice secundário; ordens de consulta (chave crescente)
+CAMPOS_INDEXADOS = ('mesa', 'item', 'produtor_id', 'consumidor_id')
+ORDENS = ('tempo', 'id')
+
+
+class IndiceArquivo:
+    """Índices secundários de um ArquivoPedidos, mantidos por quem consulta
+
+    Para cada campo de CAMPOS_INDEXADOS, a lista de posições de cada valor
+    (crescente, pois o arquivo só cresce no fim) e uma coluna com o valor de
+    cada posição; ``atualizar`` indexa só os registros publicados desde a
+    chamada anterior. Uma consulta parte da menor lista entre os filtros e
+    confere os demais nas colunas, sem percorrer o arquivo. As posições
+    ordenadas por criação ou id de cada consulta ficam em cache e, quando o
+    arquivo cresce, os novos registros (já ordenados) são mesclados a elas.
+    """
+
+    LOTE = 4096
+    # Consultas distintas mantidas em cache
+    MAX_CONSULTAS = 16
+
+    def __init__(self, arquivo: ArquivoPedidos):
+        self.arquivo = arquivo
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.geracao = self.arquivo.geracao()
+        self.total = 0
+        self.ids = array('q')
+        self.criados = array('d')
+        self.colunas: Dict[str, array] = {campo: array('i') for campo in CAMPOS_INDEXADOS}
+        self.postagens: Dict[str, Dict[int, array]] = {campo: {} for campo in CAMPOS_INDEXADOS}
+        # (filtros, ordem) -> (registros indexados quando calculada, posições ordenadas)
+        self._consultas = {}
+
+    def atualizar(self) -> int:
+        """Indexa os registros novos; recomeça se o arquivo foi limpo. Retorna o total indexado"""
+        fim = len(self.arquivo)
+        if self.arquivo.geracao() != self.geracao or fim < self.total:
+            self._reiniciar()
+        colunas = [self.colunas[campo] for campo in CAMPOS_INDEXADOS]
+        postagens = [self.postagens[campo] for campo in CAMPOS_INDEXADOS]
+        for inicio in range(self.total, fim, self.LOTE):
+            posicao = inicio
+            for pedido_id, timestamp, _, _, _, mesa, codigo, produtor_id, consumidor_id, _ \
+                    in self.arquivo._brutos(inicio, min(inicio + self.LOTE, fim)):
+                self.ids.append(pedido_id)
+                self.criados.append(timestamp)
+                for coluna, postagem, valor in zip(colunas, postagens,
+                                                    (mesa, codigo, produtor_id, consumidor_id)):
+                    coluna.append(valor)
+                    lista = postagem.get(valor)
+                    if lista is None:
+                        lista = postagem[valor] = array('I')
+                    lista.append(posicao)
+                posicao += 1
+        self.total = fim
+        return fim
+
+    def chave(self, ordem: str):
+        """Função posição -> chave de ordenação"""
+        return (self.criados if ordem == 'tempo' else self.ids).__getitem__
+
+    def _normalizar(self, filtros: dict) -> Optional[tuple]:
+        """Filtros como (campo, valor) ordenados, item já codificado; None se nada casa"""
+        normalizados = []
+        for campo, valor in sorted(filtros.items()):
+            if campo not in CAMPOS_INDEXADOS:
+                raise ValueError(f"Campo sem índice: {campo}")
+            if campo == 'item':
+                valor = self.arquivo.codigo_item(valor)
+                if valor < 0:
+                    return None
+            normalizados.append((campo, int(valor)))
+        return tuple(normalizados)
+
+    def _casar(self, filtros: tuple, desde: int) -> array:
+        """Posições >= desde que satisfazem os filtros, em ordem de posição"""
+        if not filtros:
+            return array('I', range(desde, self.total))
+        listas = [(self.postagens[campo].get(valor, array('I')), campo) for campo, valor in filtros]
+        menor, campo_menor = min(listas, key=lambda par: len(par[0]))
+        outros = [(self.colunas[campo], valor) for campo, valor in filtros if campo != campo_menor]
+        candidatas = menor[bisect_left(menor, desde):]
+        if not outros:
+            return array('I', candidatas)
+        return array('I', (posicao for posicao in candidatas
+                           if all(coluna[posicao] == valor for coluna, valor in outros)))
+
+    def consultar(self, filtros: dict, ordem: str = 'tempo') -> array:
+        """Posições do arquivo que satisfazem os filtros, em ordem crescente da chave"""
+        if ordem not in ORDENS:
+            raise ValueError(f"ordem deve ser uma de {ORDENS}")
+        self.atualizar()
+        normalizados = self._normalizar(filtros)
+        if normalizados is None:
+            return array('I')
+
+        chave_consulta = (normalizados, ordem)
+        indexados, posicoes = self._consultas.pop(chave_consulta, (0, array('I')))
+        if indexados < self.total:
+            novas = sorted(self._casar(normalizados, indexados), key=self.chave(ordem))
+            if novas:
+                # Duas sequências já ordenadas: o sort as mescla em tempo linear
+                posicoes = array('I', sorted(posicoes + array('I', novas), key=self.chave(ordem))) \
+                    if posicoes else array('I', novas)
+        if len(self._consultas) >= self.MAX_CONSULTAS:
+            self._consultas.pop(next(iter(self._consultas)))
+        self._consultas[chave_consulta] = (self.total, posicoes)
+        return posicoes
@@ -0,0 +1,115 @@
+"""
+Amostragem de métricas dos processos de trabalho em segundo plano
+
+O painel de processos não deve chamar o psutil na thread da interface:
+``cpu_percent(interval=0.1)`` dorme 0,1 s por processo. O AmostradorMetricas
+roda em uma thread própria e, a cada ``intervalo`` segundos, lê todos os
+trabalhadores em uma única passagem:
+
+- os ``psutil.Process`` ficam em cache por pid, e ``cpu_percent(None)`` mede
+  a CPU desde a leitura anterior do mesmo objeto, sem dormir (a primeira
+  leitura de cada processo só arma a medição e vale 0);
+- ``oneshot()`` agrupa as leituras de /proc de cada processo;
+- com ``detalhado``, também o número de threads e as trocas de contexto por
+  segundo (voluntárias + involuntárias, pela diferença entre amostras).
+
+Cada amostra completa, um dicionário chave -> métricas, é publicada em uma
+``queue.Queue``; a interface esvazia a fila sem bloquear e mostra a mais
+recente.
+"""
+import queue
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional
+
+import psutil
+
+
+class AmostradorMetricas:
+    def __init__(self, obter_pids: Callable[[], Dict[Hashable, int]], intervalo: float = 1.0,
+                 detalhado: bool = False):
+        # Chamado na thread do amostrador: chave (ex.: tipo e id) -> pid dos processos vivos
+        self.obter_pids = obter_pids
+        self.intervalo = intervalo
+        self.detalhado = detalhado
+        self.fila = queue.Queue()
+        self._processos: Dict[int, psutil.Process] = {}
+        # pid -> (instante, trocas de contexto) da amostra anterior
+        self._trocas: Dict[int, tuple] = {}
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _processo(self, pid: int) -> psutil.Process:
+        processo = self._processos.get(pid)
+        if processo is None:
+            processo = self._processos[pid] = psutil.Process(pid)
+            # Arma a medição: a próxima leitura cobre o intervalo desde agora
+            processo.cpu_percent(None)
+        return processo
+
+    def _medir(self, pid: int, agora: float) -> dict:
+        processo = self._processo(pid)
+        with processo.oneshot():
+            metricas = {
+                'cpu': processo.cpu_percent(None),
+                'memoria_mb': processo.memory_info().rss / 1024 / 1024
+            }
+            if self.detalhado:
+                metricas['threads'] = processo.num_threads()
+                trocas = sum(processo.num_ctx_switches()[:2])
+                anterior = self._trocas.get(pid)
+                self._trocas[pid] = (agora, trocas)
+                metricas['trocas_por_segundo'] = (trocas - anterior[1]) / (agora - anterior[0]) \
+                    if anterior is not None and agora > anterior[0] else 0.0
+        return metricas
+
+    def amostrar(self) -> dict:
+        """Uma passagem por todos os processos; os que sumiram saem do cache"""
+        try:
+            pids = dict(self.obter_pids())
+        except Exception as e:
+            print(f"Erro ao listar processos para métricas: {e}")
+            return {}
+
+        agora = time.monotonic()
+        amostra = {}
+        for chave, pid in pids.items():
+            try:
+                amostra[chave] = self._medir(pid, agora)
+            except psutil.Error:
+                # Processo encerrado ou inacessível entre a listagem e a leitura
+                self._processos.pop(pid, None)
+                self._trocas.pop(pid, None)
+
+        vivos = set(pids.values())
+        for pid in [pid for pid in self._processos if pid not in vivos]:
+            del self._processos[pid]
+            self._trocas.pop(pid, None)
+        return amostra
+
+    def _executar(self):
+        while True:
+            self.fila.put(self.amostrar())
+            if self._parar.wait(self.intervalo):
+                break
+
+    def iniciar(self):
+        self._parar.clear()
+        self._thread = threading.Thread(target=self._executar, daemon=True)
+        self._thread.start()
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def ultima_amostra(self) -> Optional[dict]:
+        """Esvazia a fila sem bloquear; a amostra mais recente ou None se não chegou nenhuma"""
+        amostra = None
+        try:
+            while True:
+                amostra = self.fila.get_nowait()
+        except queue.Empty:
+            pass
+        return amostra
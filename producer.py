@@ -1,9 +1,13 @@
+import argparse
+import math
 import os
+import queue
 import sys
 import time
 import random
-from multiprocessing import Process
-from shared_memory_manager import SharedMemoryManager, Pedido, PedidoStatus
+from shared_memory_manager import Pedido, PedidoStatus
+from sharded_memory_manager import abrir_memoria_compartilhada
+from supervisor import Supervisor, aguardar_largada
 
 class Produtor:
 
@@ -19,40 +23,77 @@ class Produtor:
         "Frango Grelhado",
         "Peixe Assado"
     ]
+    # Fatia máxima de cada espera: o estado compartilhado é relido entre fatias
+    PASSO_ESPERA = 0.1
 
-    def __init__(self, produtor_id: int, intervalo_min=1, intervalo_max=4):
+    def __init__(self, produtor_id: int, intervalo_min=1, intervalo_max=4, max_itens_por_mesa=1,
+                 num_fragmentos=1, prioridade_max=0, prazo=None, largada=None):
         self.produtor_id = produtor_id
         self.intervalo_min = intervalo_min
         self.intervalo_max = intervalo_max
+        # Uma mesa pode pedir vários itens de uma vez (enviados em um único lote)
+        self.max_itens_por_mesa = max_itens_por_mesa
+        self.num_fragmentos = num_fragmentos
+        # Prioridade sorteada em [0, prioridade_max]; prazo em segundos após a criação (None = sem prazo)
+        self.prioridade_max = prioridade_max
+        self.prazo = prazo
         self.contador_pedidos = 0
         self.ativo = True
+        # Barreira de largada do supervisor (None = começar assim que anexar)
+        self.largada = largada
+        # Sorteio de item e prioridade de cada pedido (o GeradorCarga aceita semente)
+        self.rng = random.Random()
+
+    def proximo_id(self) -> int:
+        self.contador_pedidos += 1
+        return int(f"{self.produtor_id}{self.contador_pedidos:04d}")
+
+    def criar_pedido(self, mesa: int, timestamp=None) -> Pedido:
+        pedido_id = self.proximo_id()
+        agora = time.time() if timestamp is None else timestamp
+
+        return Pedido(
+            id=pedido_id,
+            mesa=mesa,
+            item=self.rng.choice(self.ITENS_MENU),
+            timestamp=agora,
+            status=PedidoStatus.PENDENTE.value,
+            produtor_id=self.produtor_id,
+            prioridade=self.rng.randint(0, self.prioridade_max),
+            deadline=agora + self.prazo if self.prazo else 0.0
+        )
+
+    def esperar(self, shm_manager, segundos: float) -> bool:
+        """Dorme em fatias de PASSO_ESPERA; False assim que o sistema entrar em drenagem"""
+        limite = time.monotonic() + segundos
+        while not shm_manager.em_encerramento:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return True
+            time.sleep(min(restante, self.PASSO_ESPERA))
+        return False
 
     def executar(self):
         print(f"[Produtor {self.produtor_id}] Iniciado (PID: {os.getpid()})")
 
-        shm_manager = SharedMemoryManager(create=False)
+        shm_manager = abrir_memoria_compartilhada(self.num_fragmentos)
+        aguardar_largada(self.largada)
 
         try:
             while self.ativo:
-                time.sleep(random.uniform(self.intervalo_min, self.intervalo_max))
-
-                self.contador_pedidos += 1
-                pedido_id = int(f"{self.produtor_id}{self.contador_pedidos:04d}")
+                if not self.esperar(shm_manager, random.uniform(self.intervalo_min, self.intervalo_max)):
+                    print(f"[Produtor {self.produtor_id}] Sistema em drenagem")
+                    break
 
-                pedido = Pedido(
-                    id=pedido_id,
-                    mesa=random.randint(1, 20),
-                    item=random.choice(self.ITENS_MENU),
-                    timestamp=time.time(),
-                    status=PedidoStatus.PENDENTE.value,
-                    produtor_id=self.produtor_id
-                )
+                mesa = random.randint(1, 20)
+                pedidos = [self.criar_pedido(mesa)
+                           for _ in range(random.randint(1, self.max_itens_por_mesa))]
 
-                sucesso = shm_manager.adicionar_pedido(pedido)
+                adicionados = shm_manager.adicionar_pedidos(pedidos)
 
-                if sucesso:
+                for pedido in pedidos[:adicionados]:
                     print(f"[Produtor {self.produtor_id}] Pedido #{pedido.id} criado: {pedido.item} (Mesa {pedido.mesa})")
-                else:
+                for pedido in pedidos[adicionados:]:
                     print(f"[Produtor {self.produtor_id}] Erro ao criar pedido #{pedido.id}")
 
         except KeyboardInterrupt:
@@ -62,14 +103,256 @@ class Produtor:
             shm_manager.close()
             print(f"[Produtor {self.produtor_id}] Encerrado")
 
-def iniciar_produtor(produtor_id: int, intervalo_min=1, intervalo_max=4):
-    produtor = Produtor(produtor_id, intervalo_min, intervalo_max)
+class GeradorCarga(Produtor):
+    """Produtor em laço aberto para testes de carga
+
+    As chegadas seguem um processo de Poisson com taxa λ(t) (amostrado por
+    afinamento) e são agendadas independentemente de quanto tempo a
+    submissão leva. Cada pedido leva como timestamp o instante em que
+    *deveria* ter chegado, não o instante de envio: se o gerador ou a fila
+    atrasarem, o atraso aparece na latência medida (sem omissão coordenada).
+    Chegadas já vencidas são enviadas juntas, em lotes de até ``lote_max``.
+
+    Distribuições:
+      poisson  taxa constante
+      rajadas  liga/desliga: ``duracao_rajada`` s com chegadas, ``duracao_pausa`` s sem
+      diurna   taxa senoidal entre taxa*(1-amplitude) e taxa*(1+amplitude),
+               com um "dia" comprimido em ``periodo_diurno`` s
+    Em todas, a taxa média é ``taxa``.
+    """
+
+    DISTRIBUICOES = ('poisson', 'rajadas', 'diurna')
+    # Faixa de ids dos pedidos de cada gerador (ids = produtor_id * IDS_POR_PRODUTOR + n)
+    IDS_POR_PRODUTOR = 10 ** 9
+
+    def __init__(self, produtor_id: int, taxa: float, distribuicao='poisson', duracao=None,
+                 lote_max=256, num_fragmentos=1, prioridade_max=0, prazo=None,
+                 duracao_rajada=1.0, duracao_pausa=4.0, periodo_diurno=60.0, amplitude=0.8,
+                 intervalo_relatorio=1.0, largada=None, semente=None):
+        super().__init__(produtor_id, num_fragmentos=num_fragmentos,
+                         prioridade_max=prioridade_max, prazo=prazo, largada=largada)
+        if taxa <= 0:
+            raise ValueError("taxa deve ser positiva")
+        if distribuicao not in self.DISTRIBUICOES:
+            raise ValueError(f"distribuicao deve ser uma de {self.DISTRIBUICOES}")
+        self.taxa = taxa
+        self.distribuicao = distribuicao
+        self.duracao = duracao
+        self.lote_max = lote_max
+        self.duracao_rajada = duracao_rajada
+        self.duracao_pausa = duracao_pausa
+        self.periodo_diurno = periodo_diurno
+        self.amplitude = min(max(amplitude, 0.0), 1.0)
+        self.intervalo_relatorio = intervalo_relatorio
+        # Com semente, chegadas, mesas, itens e prioridades se repetem entre execuções;
+        # cada gerador deriva a sua da semente e do próprio id
+        self.rng = random.Random(None if semente is None else f"{semente}:{produtor_id}")
+
+        if distribuicao == 'rajadas':
+            self.taxa_maxima = taxa * (duracao_rajada + duracao_pausa) / duracao_rajada
+        elif distribuicao == 'diurna':
+            self.taxa_maxima = taxa * (1 + self.amplitude)
+        else:
+            self.taxa_maxima = taxa
+
+        self.enviados = 0
+        self.rejeitados = 0
+        self.atraso_maximo = 0.0
+
+    def proximo_id(self) -> int:
+        self.contador_pedidos += 1
+        return self.produtor_id * self.IDS_POR_PRODUTOR + self.contador_pedidos
+
+    def taxa_em(self, t: float) -> float:
+        """Taxa de chegada (pedidos/s) no instante t, em segundos desde o início"""
+        if self.distribuicao == 'rajadas':
+            ciclo = self.duracao_rajada + self.duracao_pausa
+            return self.taxa_maxima if t % ciclo < self.duracao_rajada else 0.0
+        if self.distribuicao == 'diurna':
+            # Começa no vale da curva
+            fase = 2 * math.pi * t / self.periodo_diurno - math.pi / 2
+            return self.taxa * (1 + self.amplitude * math.sin(fase))
+        return self.taxa
+
+    def proxima_chegada(self, t: float) -> float:
+        """Instante da chegada seguinte a t (afinamento de Lewis-Shedler)"""
+        while True:
+            t += self.rng.expovariate(self.taxa_maxima)
+            if self.taxa_maxima == self.taxa or self.rng.random() * self.taxa_maxima <= self.taxa_em(t):
+                return t
+
+    def resumo(self, decorrido: float) -> dict:
+        return {
+            'produtor_id': self.produtor_id,
+            'duracao': decorrido,
+            'enviados': self.enviados,
+            'rejeitados': self.rejeitados,
+            'taxa_pedida': self.taxa,
+            'taxa_obtida': self.enviados / decorrido if decorrido > 0 else 0.0,
+            'atraso_maximo': self.atraso_maximo
+        }
+
+    def executar(self) -> dict:
+        print(f"[Gerador {self.produtor_id}] Iniciado (PID: {os.getpid()}): "
+              f"{self.taxa:.0f} pedidos/s, distribuição {self.distribuicao}")
+
+        shm_manager = abrir_memoria_compartilhada(self.num_fragmentos)
+        # Com vários geradores, todos começam a agenda juntos
+        aguardar_largada(self.largada)
+        inicio = time.monotonic()
+        inicio_relogio = time.time()
+        proxima = self.proxima_chegada(0.0)
+        proximo_relatorio = self.intervalo_relatorio
+        enviados_relatorio = 0
+        decorrido = 0.0
+
+        try:
+            while self.ativo:
+                decorrido = time.monotonic() - inicio
+                if self.duracao is not None and proxima >= self.duracao:
+                    # Agenda esgotada: a taxa obtida é medida sobre a duração inteira
+                    self.esperar(shm_manager, self.duracao - decorrido)
+                    break
+                if proxima > decorrido:
+                    if not self.esperar(shm_manager, min(proxima - decorrido, self.PASSO_ESPERA)):
+                        break
+                    continue
+
+                # Tudo o que já venceu vai em um lote, com o timestamp planejado
+                lote = []
+                self.atraso_maximo = max(self.atraso_maximo, decorrido - proxima)
+                while proxima <= decorrido and len(lote) < self.lote_max and \
+                        (self.duracao is None or proxima < self.duracao):
+                    lote.append(self.criar_pedido(self.rng.randint(1, 20), inicio_relogio + proxima))
+                    proxima = self.proxima_chegada(proxima)
+
+                adicionados = shm_manager.adicionar_pedidos(lote)
+                self.enviados += adicionados
+                self.rejeitados += len(lote) - adicionados
+
+                if decorrido >= proximo_relatorio:
+                    taxa = (self.enviados - enviados_relatorio) / self.intervalo_relatorio
+                    print(f"[Gerador {self.produtor_id}] t={decorrido:.0f}s taxa {taxa:.0f}/s "
+                          f"(pedida {self.taxa:.0f}/s), rejeitados {self.rejeitados}, "
+                          f"atraso máx {self.atraso_maximo * 1000:.1f} ms")
+                    enviados_relatorio = self.enviados
+                    proximo_relatorio += self.intervalo_relatorio
+
+        except KeyboardInterrupt:
+            print(f"[Gerador {self.produtor_id}] Interrompido pelo usuário")
+
+        finally:
+            decorrido = time.monotonic() - inicio
+            shm_manager.close()
+            print(f"[Gerador {self.produtor_id}] Encerrado: {self.enviados} pedidos em {decorrido:.1f}s")
+
+        return self.resumo(decorrido)
+
+def iniciar_gerador(produtor_id: int, taxa: float, resultados=None, **kwargs):
+    gerador = GeradorCarga(produtor_id, taxa, **kwargs)
+    resumo = gerador.executar()
+    if resultados is not None:
+        resultados.put(resumo)
+
+# Intervalo entre as verificações de geradores que morreram sem resumo
+INTERVALO_VERIFICACAO_GERADORES = 0.5
+
+def executar_geradores(num_processos: int, taxa: float, primeiro_id=1, **kwargs) -> dict:
+    """Divide a taxa entre processos geradores e agrega os resumos
+
+    Um gerador que termina sem enviar o resumo (não se anexou à memória,
+    falhou no meio) é relatado em ``falhas`` e fica fora da agregação.
+    """
+    supervisor = Supervisor()
+    resultados = supervisor.contexto.Queue()
+    processos = supervisor.iniciar([(iniciar_gerador, (primeiro_id + i, taxa / num_processos, resultados), kwargs)
+                                    for i in range(num_processos)])
+    pendentes = {primeiro_id + i: processo for i, processo in enumerate(processos)}
+    resumos = []
+    falhas = []
+
+    def receber(resumo):
+        resumos.append(resumo)
+        pendentes.pop(resumo['produtor_id'], None)
+
+    while pendentes:
+        try:
+            receber(resultados.get(timeout=INTERVALO_VERIFICACAO_GERADORES))
+        except queue.Empty:
+            mortos = [produtor_id for produtor_id, processo in pendentes.items() if not processo.is_alive()]
+            # Um gerador pode ter enviado o resumo logo antes de sair
+            try:
+                while True:
+                    receber(resultados.get_nowait())
+            except queue.Empty:
+                pass
+            for produtor_id in mortos:
+                if produtor_id in pendentes:
+                    codigo = pendentes.pop(produtor_id).exitcode
+                    falhas.append(produtor_id)
+                    print(f"⚠️  Gerador {produtor_id} terminou sem resumo (código de saída {codigo})")
+    for processo in processos:
+        processo.join()
+
+    duracao = max((resumo['duracao'] for resumo in resumos), default=0.0)
+    enviados = sum(resumo['enviados'] for resumo in resumos)
+    return {
+        'processos': num_processos,
+        'duracao': duracao,
+        'enviados': enviados,
+        'rejeitados': sum(resumo['rejeitados'] for resumo in resumos),
+        'taxa_pedida': taxa,
+        'taxa_obtida': enviados / duracao if duracao > 0 else 0.0,
+        'atraso_maximo': max((resumo['atraso_maximo'] for resumo in resumos), default=0.0),
+        'falhas': sorted(falhas)
+    }
+
+def iniciar_produtor(produtor_id: int, intervalo_min=1, intervalo_max=4, max_itens_por_mesa=1,
+                     num_fragmentos=1, prioridade_max=0, prazo=None, largada=None):
+    produtor = Produtor(produtor_id, intervalo_min, intervalo_max, max_itens_por_mesa, num_fragmentos,
+                        prioridade_max, prazo, largada)
     produtor.executar()
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        produtor_id = int(sys.argv[1])
-    else:
-        produtor_id = 1
+    parser = argparse.ArgumentParser(description="Produtor de pedidos (com --taxa: gerador de carga)")
+    parser.add_argument('produtor_id', nargs='?', type=int, default=1)
+    parser.add_argument('--taxa', type=float, default=None,
+                        help="pedidos/s no total; ativa o gerador de carga em laço aberto")
+    parser.add_argument('--distribuicao', choices=GeradorCarga.DISTRIBUICOES, default='poisson')
+    parser.add_argument('--duracao', type=float, default=10.0, help="segundos de carga (padrão: 10)")
+    parser.add_argument('--processos', type=int, default=1, help="processos geradores (padrão: 1)")
+    parser.add_argument('--lote', type=int, default=256, help="máximo de pedidos por envio (padrão: 256)")
+    parser.add_argument('--fragmentos', type=int, default=1)
+    parser.add_argument('--prioridade-max', type=int, default=0)
+    parser.add_argument('--prazo', type=float, default=None)
+    parser.add_argument('--semente', type=int, default=None,
+                        help="semente do gerador de carga, para execuções reproduzíveis")
+    parser.add_argument('--criar', action='store_true',
+                        help="criar a memória compartilhada (quando main.py não está em execução)")
+    args = parser.parse_args()
 
-    iniciar_produtor(produtor_id)
+    if args.taxa is None:
+        iniciar_produtor(args.produtor_id, num_fragmentos=args.fragmentos,
+                         prioridade_max=args.prioridade_max, prazo=args.prazo)
+        sys.exit(0)
+
+    shm_manager = abrir_memoria_compartilhada(args.fragmentos, create=True) if args.criar else None
+    try:
+        resumo = executar_geradores(args.processos, args.taxa, primeiro_id=args.produtor_id,
+                                    distribuicao=args.distribuicao, duracao=args.duracao,
+                                    lote_max=args.lote, num_fragmentos=args.fragmentos,
+                                    prioridade_max=args.prioridade_max, prazo=args.prazo,
+                                    semente=args.semente)
+        print(f"\nTaxa pedida: {resumo['taxa_pedida']:.0f} pedidos/s")
+        print(f"Taxa obtida: {resumo['taxa_obtida']:.0f} pedidos/s "
+              f"({resumo['enviados']} pedidos em {resumo['duracao']:.1f}s, {resumo['processos']} processos)")
+        print(f"Rejeitados (fila cheia): {resumo['rejeitados']}")
+        print(f"Atraso máximo em relação à agenda: {resumo['atraso_maximo'] * 1000:.1f} ms")
+        if resumo['falhas']:
+            print(f"Geradores sem resumo: {len(resumo['falhas'])} de {resumo['processos']} "
+                  f"({', '.join(map(str, resumo['falhas']))})")
+            sys.exit(1)
+    finally:
+        if shm_manager:
+            shm_manager.unlink()
+            shm_manager.close()
@@ -0,0 +1,497 @@
+"""
+Modo fragmentado da memória compartilhada
+
+Em vez de uma única arena disputada por todos os processos, N fragmentos
+independentes (``<nome>_p<i>``), cada um com arena, lock, semáforo e arquivo
+de concluídos próprios. O produtor escolhe o fragmento pela mesa (ou pelo
+id do produtor); o consumidor tem um fragmento "de casa" e, quando ele está
+vazio, rouba pedidos dos demais. Estatísticas e listagens somam/mesclam os
+fragmentos para a interface.
+
+Com um único fragmento o sistema usa o ``SharedMemoryManager`` diretamente;
+``abrir_memoria_compartilhada`` escolhe a implementação certa.
+"""
+import heapq
+import itertools
+import select
+import threading
+import time
+from typing import Dict, List, Optional
+
+from shared_memory_manager import (SharedMemoryManager, Pedido, PoliticaDespacho, CanalNotificacao,
+                                   EstadoExecucao, HISTOGRAMAS, percentis_histograma, iterar_pedidos_arquivados)
+
+
+class ShardedMemoryManager:
+    """Conjunto de SharedMemoryManager com a mesma API da arena única"""
+
+    # Campos do pedido aceitos para escolher o fragmento
+    CHAVES_FRAGMENTO = ('mesa', 'produtor_id')
+    # Espera entre tentativas quando o semáforo não tem descritor (Windows)
+    ESPERA_SEM_FIFO = 0.05
+
+    def __init__(self, name='pedidos_shm', create=True, num_fragmentos=2,
+                 chave_fragmento='mesa', **kwargs):
+        if num_fragmentos < 1:
+            raise ValueError("num_fragmentos deve ser pelo menos 1")
+        if chave_fragmento not in self.CHAVES_FRAGMENTO:
+            raise ValueError(f"chave_fragmento deve ser uma de {self.CHAVES_FRAGMENTO}")
+
+        self.name = name
+        self.chave_fragmento = chave_fragmento
+        self.fragmentos = []
+        try:
+            for indice in range(num_fragmentos):
+                self.fragmentos.append(
+                    SharedMemoryManager(self._nome_fragmento(indice), create=create, **kwargs))
+        except:
+            self.close()
+            raise
+
+        # Fragmento de origem dos pedidos retirados por este processo (para finalizar)
+        self._origem: Dict[int, SharedMemoryManager] = {}
+        self._parar_batimentos = threading.Event()
+        self._threads_batimento = []
+
+    def _nome_fragmento(self, indice: int) -> str:
+        return f"{self.name}_p{indice}"
+
+    @property
+    def num_fragmentos(self) -> int:
+        return len(self.fragmentos)
+
+    @property
+    def em_encerramento(self) -> bool:
+        return any(fragmento.em_encerramento for fragmento in self.fragmentos)
+
+    @em_encerramento.setter
+    def em_encerramento(self, valor: bool):
+        for fragmento in self.fragmentos:
+            fragmento.em_encerramento = valor
+
+    # ------------------------------------------------------------------
+    # Roteamento
+    # ------------------------------------------------------------------
+
+    def fragmento_do_pedido(self, pedido: Pedido) -> SharedMemoryManager:
+        """Fragmento em que o pedido é enfileirado"""
+        return self.fragmentos[getattr(pedido, self.chave_fragmento) % len(self.fragmentos)]
+
+    def fragmento_de_casa(self, consumidor_id: int) -> int:
+        """Índice do fragmento preferido do consumidor"""
+        return (consumidor_id - 1) % len(self.fragmentos)
+
+    def _fragmento_com_pedido(self, pedido_id: int) -> Optional[SharedMemoryManager]:
+        fragmento = self._origem.get(pedido_id)
+        if fragmento is not None:
+            return fragmento
+        for fragmento in self.fragmentos:
+            if fragmento.obter_pedido(pedido_id) is not None:
+                return fragmento
+        return None
+
+    # ------------------------------------------------------------------
+    # Produção
+    # ------------------------------------------------------------------
+
+    def adicionar_pedido(self, pedido: Pedido) -> bool:
+        """Adiciona pedido no fragmento da sua mesa/produtor (thread-safe)"""
+        return self.adicionar_pedidos([pedido]) == 1
+
+    def adicionar_pedidos(self, pedidos: List[Pedido]) -> int:
+        """Adiciona vários pedidos, um lote por fragmento; retorna quantos foram adicionados"""
+        lotes: Dict[int, List[Pedido]] = {}
+        for pedido in pedidos:
+            lotes.setdefault(id(self.fragmento_do_pedido(pedido)), []).append(pedido)
+
+        adicionados = 0
+        for lote in lotes.values():
+            adicionados += self.fragmento_do_pedido(lote[0]).adicionar_pedidos(lote)
+        return adicionados
+
+    # ------------------------------------------------------------------
+    # Consumo com roubo de trabalho
+    # ------------------------------------------------------------------
+
+    def _retirar_com_roubo(self, consumidor_id: int, n: int, mesmo_item: bool = False,
+                           espera_max: Optional[float] = None) -> List[Pedido]:
+        """Retira do fragmento de casa; se estiver vazio, do primeiro outro que tiver pedidos"""
+        casa = self.fragmento_de_casa(consumidor_id)
+        total = len(self.fragmentos)
+        for passo in range(total):
+            fragmento = self.fragmentos[(casa + passo) % total]
+            if mesmo_item:
+                pedidos = fragmento.obter_lote_mesmo_item(consumidor_id, n, espera_max)
+            else:
+                pedidos = fragmento.obter_proximos_pedidos(consumidor_id, n)
+            if pedidos:
+                for pedido in pedidos:
+                    self._origem[pedido.id] = fragmento
+                return pedidos
+        return []
+
+    def _esperar_fichas(self, timeout: Optional[float]) -> List[SharedMemoryManager]:
+        """Bloqueia até algum fragmento ter fichas, sem consumi-las; retorna os prontos"""
+        por_descritor = {fragmento.nao_vazio.fileno(): fragmento for fragmento in self.fragmentos}
+        if -1 in por_descritor:
+            time.sleep(self.ESPERA_SEM_FIFO if timeout is None else min(timeout, self.ESPERA_SEM_FIFO))
+            return []
+        try:
+            prontos = select.select(list(por_descritor), [], [], timeout)[0]
+        except InterruptedError:
+            return []
+        return [por_descritor[fd] for fd in prontos]
+
+    def obter_proximo_pedido(self, consumidor_id: int):
+        """Obtém o próximo pedido pendente (não bloqueante, com roubo)"""
+        pedidos = self.obter_proximos_pedidos(consumidor_id, 1)
+        return pedidos[0] if pedidos else None
+
+    def obter_proximos_pedidos(self, consumidor_id: int, n: int) -> List[Pedido]:
+        """Retira até n pedidos de um único fragmento (não bloqueante, com roubo)"""
+        return self._retirar_com_roubo(consumidor_id, n)
+
+    def aguardar_pedido(self, consumidor_id: int, timeout: Optional[float] = None):
+        """Obtém o próximo pedido, bloqueando até um chegar ou o timeout expirar"""
+        pedidos = self.aguardar_pedidos(consumidor_id, 1, timeout)
+        return pedidos[0] if pedidos else None
+
+    def aguardar_pedidos(self, consumidor_id: int, n: int,
+                         timeout: Optional[float] = None) -> List[Pedido]:
+        """Retira até n pedidos, esperando em todos os fragmentos ao mesmo tempo"""
+        return self._aguardar(consumidor_id, n, timeout)
+
+    def obter_lote_mesmo_item(self, consumidor_id: int, n: int,
+                              espera_max: Optional[float] = None) -> List[Pedido]:
+        """Retira até n pendentes do mesmo item de um único fragmento (não bloqueante, com roubo)"""
+        return self._retirar_com_roubo(consumidor_id, n, True, espera_max)
+
+    def aguardar_lote_mesmo_item(self, consumidor_id: int, n: int, espera_max: Optional[float] = None,
+                                 timeout: Optional[float] = None) -> List[Pedido]:
+        """Lote do mesmo item, esperando em todos os fragmentos ao mesmo tempo"""
+        return self._aguardar(consumidor_id, n, timeout, True, espera_max)
+
+    def _aguardar(self, consumidor_id: int, n: int, timeout: Optional[float],
+                  mesmo_item: bool = False, espera_max: Optional[float] = None) -> List[Pedido]:
+        limite = None if timeout is None else time.monotonic() + timeout
+        prontos = []
+        while True:
+            pedidos = self._retirar_com_roubo(consumidor_id, n, mesmo_item, espera_max)
+            if pedidos:
+                return pedidos
+            if self.em_encerramento:
+                return []
+
+            if prontos:
+                # Fichas sem pedido (cancelado ou retirado por outro): descartar e tentar de novo
+                for fragmento in prontos:
+                    fragmento.nao_vazio.tentar_adquirir()
+                prontos = []
+                continue
+
+            restante = None if limite is None else limite - time.monotonic()
+            if restante is not None and restante <= 0:
+                return []
+            prontos = self._esperar_fichas(restante)
+
+    def obter_politica(self) -> PoliticaDespacho:
+        return self.fragmentos[0].obter_politica()
+
+    def definir_politica(self, politica) -> bool:
+        """Troca a política de despacho em todos os fragmentos"""
+        return all([fragmento.definir_politica(politica) for fragmento in self.fragmentos])
+
+    def assinar(self, canal: Optional[CanalNotificacao] = None) -> CanalNotificacao:
+        """Um único canal, sinalizado por mutações em qualquer fragmento"""
+        novo = canal is None
+        if novo:
+            canal = CanalNotificacao()
+        try:
+            for fragmento in self.fragmentos:
+                fragmento.assinar(canal)
+        except:
+            if novo:
+                canal.cancelar()
+            raise
+        return canal
+
+    # ------------------------------------------------------------------
+    # Estado da execução e drenagem
+    # ------------------------------------------------------------------
+
+    def obter_estado(self) -> EstadoExecucao:
+        return self.fragmentos[0].obter_estado()
+
+    def obter_epoca_drenagem(self) -> int:
+        return self.fragmentos[0].obter_epoca_drenagem()
+
+    def definir_estado(self, estado) -> bool:
+        """Muda o estado em todos os fragmentos"""
+        return all([fragmento.definir_estado(estado) for fragmento in self.fragmentos])
+
+    def marcar_encerramento(self):
+        """Entra em drenagem: nenhum pedido novo é retirado, os em preparo terminam"""
+        self.definir_estado(EstadoExecucao.DRENANDO)
+
+    def resetar_encerramento(self):
+        """Volta a executar normalmente"""
+        self.definir_estado(EstadoExecucao.EXECUTANDO)
+
+    def marcar_ocioso(self, consumidor_id: int) -> bool:
+        return all([fragmento.marcar_ocioso(consumidor_id) for fragmento in self.fragmentos])
+
+    def confirmar_drenagem(self, consumidor_id: int) -> bool:
+        return all([fragmento.confirmar_drenagem(consumidor_id) for fragmento in self.fragmentos])
+
+    def obter_trabalhadores(self) -> List[dict]:
+        """Consumidores de todos os fragmentos; ocupado se estiver ocupado em algum"""
+        por_id: Dict[int, dict] = {}
+        for fragmento in self.fragmentos:
+            for trabalhador in fragmento.obter_trabalhadores():
+                atual = por_id.setdefault(trabalhador['consumidor_id'], dict(trabalhador))
+                atual['ocupado'] = atual['ocupado'] or trabalhador['ocupado']
+                atual['ultimo_batimento'] = max(atual['ultimo_batimento'], trabalhador['ultimo_batimento'])
+                atual['epoca_confirmada'] = min(atual['epoca_confirmada'], trabalhador['epoca_confirmada'])
+        return list(por_id.values())
+
+    # Mesmo algoritmo da arena única: um canal assinado em todos os fragmentos,
+    # recuperação de leases e em preparo somados
+    aguardar_drenagem = SharedMemoryManager.aguardar_drenagem
+
+    # ------------------------------------------------------------------
+    # Atualização e finalização
+    # ------------------------------------------------------------------
+
+    def obter_pedido(self, pedido_id: int) -> Optional[Pedido]:
+        fragmento = self._fragmento_com_pedido(pedido_id)
+        return fragmento.obter_pedido(pedido_id) if fragmento else None
+
+    def atualizar_pedido(self, pedido_id: int, status: Optional[str] = None,
+                         consumidor_id: Optional[int] = None,
+                         timestamp: Optional[float] = None) -> bool:
+        fragmento = self._fragmento_com_pedido(pedido_id)
+        if fragmento is None:
+            return False
+        return fragmento.atualizar_pedido(pedido_id, status, consumidor_id, timestamp)
+
+    def finalizar_pedido(self, pedido_id: int, consumidor_id: Optional[int] = None) -> bool:
+        """Finaliza pedido no fragmento de onde foi retirado (thread-safe)"""
+        return self.finalizar_pedidos([pedido_id], consumidor_id) == 1
+
+    def finalizar_pedidos(self, pedido_ids: List[int], consumidor_id: Optional[int] = None) -> int:
+        """Finaliza vários pedidos, uma seção crítica por fragmento envolvido"""
+        lotes: Dict[int, List[int]] = {}
+        fragmentos = {}
+        for pedido_id in pedido_ids:
+            fragmento = self._fragmento_com_pedido(pedido_id)
+            if fragmento is None:
+                continue
+            lotes.setdefault(id(fragmento), []).append(pedido_id)
+            fragmentos[id(fragmento)] = fragmento
+
+        finalizados = 0
+        for chave, ids in lotes.items():
+            finalizados += fragmentos[chave].finalizar_pedidos(ids, consumidor_id)
+        for pedido_id in pedido_ids:
+            self._origem.pop(pedido_id, None)
+        return finalizados
+
+    # ------------------------------------------------------------------
+    # Leases
+    # ------------------------------------------------------------------
+
+    def batimento(self, consumidor_id: int) -> bool:
+        """Batimento em todos os fragmentos (o consumidor pode ter roubado de qualquer um)"""
+        return all([fragmento.batimento(consumidor_id) for fragmento in self.fragmentos])
+
+    def manter_batimentos(self, consumidor_id: int, intervalo: Optional[float] = None):
+        """Uma única thread de batimentos para todos os fragmentos, até close()"""
+        intervalo = intervalo or SharedMemoryManager.INTERVALO_BATIMENTO
+        parar = self._parar_batimentos
+
+        def bater():
+            while not parar.wait(intervalo):
+                self.batimento(consumidor_id)
+
+        self.batimento(consumidor_id)
+        thread = threading.Thread(target=bater, daemon=True)
+        thread.start()
+        self._threads_batimento.append(thread)
+
+    def recuperar_pedidos_expirados(self) -> int:
+        return sum(fragmento.recuperar_pedidos_expirados() for fragmento in self.fragmentos)
+
+    # ------------------------------------------------------------------
+    # Leitura agregada para a interface
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _somar(dicionarios: List[dict]) -> dict:
+        total = {}
+        for dicionario in dicionarios:
+            for chave, valor in dicionario.items():
+                total[chave] = total.get(chave, 0) + valor
+        return total
+
+    def obter_versao(self) -> int:
+        """Soma dos contadores de versão (muda quando qualquer fragmento muda)"""
+        return sum(fragmento.obter_versao() for fragmento in self.fragmentos)
+
+    def obter_mudancas(self, desde: Optional[tuple] = None):
+        """Retorna (cursor, mudanças) de todos os fragmentos; o cursor tem um valor por fragmento
+
+        As mudanças vêm como None se qualquer fragmento exigir ressincronização.
+        Entre fragmentos, ficam na ordem de chegada dos pedidos (a ordem das
+        mudanças de um mesmo pedido é mantida).
+        """
+        desde = desde or (None,) * len(self.fragmentos)
+        cursores, mudancas = [], []
+        for fragmento, cursor in zip(self.fragmentos, desde):
+            cursor, mudancas_fragmento = fragmento.obter_mudancas(cursor)
+            cursores.append(cursor)
+            if mudancas is not None:
+                mudancas = None if mudancas_fragmento is None else mudancas + mudancas_fragmento
+        if mudancas is not None and len(self.fragmentos) > 1:
+            mudancas.sort(key=lambda mudanca: mudanca.timestamp)
+        return tuple(cursores), mudancas
+
+    def obter_instantaneo(self, recentes: Optional[int] = None):
+        """Retorna (estatísticas somadas, pedidos mesclados em ordem de chegada)
+
+        Cada fragmento é lido de forma consistente; entre fragmentos as cópias
+        podem ser de instantes ligeiramente diferentes.
+        """
+        estatisticas, pedidos = [], []
+        for fragmento in self.fragmentos:
+            stats, pedidos_fragmento = fragmento.obter_instantaneo(recentes)
+            estatisticas.append(stats)
+            pedidos.extend(pedidos_fragmento)
+        pedidos.sort(key=lambda pedido: pedido.timestamp)
+        return self._somar(estatisticas), pedidos
+
+    def obter_todos_pedidos(self) -> List[Pedido]:
+        try:
+            return self.obter_instantaneo()[1]
+        except:
+            return []
+
+    def obter_estatisticas(self) -> dict:
+        return self._somar([fragmento.obter_estatisticas() for fragmento in self.fragmentos])
+
+    def obter_estatisticas_por_fragmento(self) -> List[dict]:
+        """Estatísticas de cada fragmento, na ordem dos índices"""
+        return [fragmento.obter_estatisticas() for fragmento in self.fragmentos]
+
+    def obter_histogramas(self) -> dict:
+        """Histogramas de latência somados balde a balde entre os fragmentos"""
+        total = {}
+        for fragmento in self.fragmentos:
+            for nome, histograma in fragmento.obter_histogramas().items():
+                if nome not in total:
+                    total[nome] = dict(histograma, baldes=list(histograma['baldes']))
+                    continue
+                acumulado = total[nome]
+                acumulado['amostras'] += histograma['amostras']
+                acumulado['soma'] += histograma['soma']
+                acumulado['maximo'] = max(acumulado['maximo'], histograma['maximo'])
+                acumulado['baldes'] = [a + b for a, b in zip(acumulado['baldes'], histograma['baldes'])]
+        return total
+
+    def obter_percentis(self, pontos=(50, 95, 99)) -> dict:
+        try:
+            return {nome: percentis_histograma(histograma, pontos)
+                    for nome, histograma in self.obter_histogramas().items()}
+        except Exception as e:
+            print(f"Erro ao obter percentis: {e}")
+            return {nome: percentis_histograma({'amostras': 0}, pontos) for nome in HISTOGRAMAS}
+
+    def obter_ocupacao(self) -> dict:
+        return self._somar([fragmento.obter_ocupacao() for fragmento in self.fragmentos])
+
+    def obter_pedidos_em_preparo(self):
+        return sum(fragmento.obter_pedidos_em_preparo() for fragmento in self.fragmentos)
+
+    def obter_pedidos_ativos(self) -> List[Pedido]:
+        pedidos = [pedido for fragmento in self.fragmentos for pedido in fragmento.obter_pedidos_ativos()]
+        pedidos.sort(key=lambda pedido: pedido.timestamp)
+        return pedidos
+
+    def total_arquivados(self) -> int:
+        return sum(fragmento.total_arquivados() for fragmento in self.fragmentos)
+
+    def obter_pedidos_arquivados(self, inicio: int = 0, fim: Optional[int] = None) -> List[Pedido]:
+        """Pedidos concluídos [inicio, fim) de todos os fragmentos, em ordem de conclusão
+
+        O arquivo de cada fragmento já está em ordem de conclusão: os fluxos
+        são mesclados sob demanda, lendo em lotes só até o fim da janela.
+        """
+        try:
+            fluxos = [iterar_pedidos_arquivados(fragmento.arquivo) for fragmento in self.fragmentos]
+            mesclados = heapq.merge(*fluxos, key=lambda pedido: pedido.concluido_em)
+            return list(itertools.islice(mesclados, max(0, inicio), None if fim is None else max(0, fim)))
+        except Exception as e:
+            print(f"Erro ao ler arquivo de pedidos: {e}")
+            return []
+
+    def consultar_pedidos(self, filtros: Optional[dict] = None, status: Optional[str] = None,
+                          ordem: str = 'tempo', decrescente: bool = True,
+                          inicio: int = 0, quantidade: int = 50):
+        """Janela dos pedidos filtrados de todos os fragmentos; retorna (total, pedidos)
+
+        Cada fragmento devolve os seus primeiros pedidos até o fim da janela,
+        que são mesclados antes de cortá-la. Uma janela mais perto do fim da
+        lista é pedida na ordem inversa, a partir do fim, e desvirada.
+        """
+        total = sum(fragmento.consultar_pedidos(filtros, status, ordem, decrescente, 0, 0)[0]
+                    for fragmento in self.fragmentos)
+        inicio = min(max(0, inicio), total)
+        fim = min(total, inicio + quantidade)
+        invertida = total - fim < inicio
+        if invertida:
+            inicio, fim, decrescente = total - fim, total - inicio, not decrescente
+
+        atributo = 'timestamp' if ordem == 'tempo' else 'id'
+        partes = [fragmento.consultar_pedidos(filtros, status, ordem, decrescente, 0, fim)[1]
+                  for fragmento in self.fragmentos]
+        mesclados = heapq.merge(*partes, key=lambda pedido: getattr(pedido, atributo), reverse=decrescente)
+        pedidos = list(itertools.islice(mesclados, inicio, fim))
+        if invertida:
+            pedidos.reverse()
+        return total, pedidos
+
+    def obter_itens(self) -> List[str]:
+        return sorted(set(item for fragmento in self.fragmentos for item in fragmento.obter_itens()))
+
+    # ------------------------------------------------------------------
+    # Manutenção e ciclo de vida
+    # ------------------------------------------------------------------
+
+    def cancelar_pedidos_pendentes(self):
+        """Cancela todos os pedidos pendentes de todos os fragmentos"""
+        return sum(fragmento.cancelar_pedidos_pendentes() for fragmento in self.fragmentos)
+
+    def limpar(self):
+        """Limpa todos os fragmentos"""
+        self._origem.clear()
+        return all([fragmento.limpar() for fragmento in self.fragmentos])
+
+    def close(self):
+        self._parar_batimentos.set()
+        # Os fragmentos liberam as entradas dos consumidores; nenhum batimento pode registrá-las de novo
+        for thread in self._threads_batimento:
+            thread.join(timeout=SharedMemoryManager.INTERVALO_BATIMENTO)
+        self._threads_batimento = []
+        for fragmento in self.fragmentos:
+            fragmento.close()
+
+    def unlink(self):
+        for fragmento in self.fragmentos:
+            fragmento.unlink()
+
+
+def abrir_memoria_compartilhada(num_fragmentos: int = 1, name: str = 'pedidos_shm',
+                                create: bool = False, **kwargs):
+    """Arena única com um fragmento, ShardedMemoryManager com mais de um"""
+    if num_fragmentos > 1:
+        return ShardedMemoryManager(name, create=create, num_fragmentos=num_fragmentos, **kwargs)
+    return SharedMemoryManager(name, create=create, **kwargs)
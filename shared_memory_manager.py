@@ -1,20 +1,158 @@
 """
 Módulo de gerenciamento de memória compartilhada
 Implementa a estrutura de dados compartilhada e mecanismos de sincronização
+
+A memória é uma arena segmentada que cresce sob demanda:
+
+    <nome>          segmento diretório: cabeçalho com estatísticas, índices,
+                    número de segmentos de slots e gerações do mapeamento
+    <nome>_s<i>     segmentos de slots, todos com ``slots_por_segmento`` slots
+    <nome>_h<g>     tabela hash id -> slot da geração g
+
+O slot global ``s`` fica no segmento ``s // slots_por_segmento``. Quando a
+ocupação por pedidos em andamento passa de ``LIMIAR_CRESCIMENTO``, quem está
+alocando cria o próximo segmento de slots (e, se preciso, uma tabela hash
+maior), sob o lock, e incrementa ``geracao`` no diretório. Os demais processos
+comparam a geração a cada acesso e mapeiam os segmentos novos de forma
+transparente.
+
+Índices mantidos dentro da própria arena, atualizados na mesma seção crítica
+de cada mutação:
+
+- lista intrusiva FIFO dos pendentes e lista dos pedidos em preparo (campos
+  ``prox``/``ant`` do slot; um slot está em no máximo uma delas, conforme o
+  status); os slots livres formam uma pilha pelo mesmo campo ``prox``;
+- lista do histórico em ordem de chegada (campos ``hprox``/``hant``);
+- tabela hash de endereçamento aberto (sondagem linear, remoção por
+  deslocamento reverso) de id do pedido para slot;
+- contadores por status no cabeçalho.
+
+Retirar o próximo pedido, localizar por id e contar por status são O(1).
+
+A ordem de despacho dos pendentes segue a política gravada no cabeçalho:
+FIFO usa a própria lista de pendentes; PRIORIDADE (maior ``prioridade``
+primeiro) e EDF (``deadline`` mais cedo primeiro) usam um heap binário de
+slots guardado ao fim de cada segmento de slots, com a posição de cada
+pedido no heap gravada no próprio slot. Escolher o próximo custa O(log n).
+No EDF, um pedido cujo prazo já passou é rebaixado para junto dos pedidos
+sem prazo, para não atrasar os que ainda podem ser atendidos a tempo.
+
+A arena guarda só o trabalho em andamento: ao ser concluído, o pedido é
+gravado no arquivo em disco ``<nome>.arquivo`` (ver ``order_archive``) na
+mesma seção crítica e seu slot volta para a pilha de livres. Se a gravação
+falhar, o pedido concluído fica na arena e é despejado quando faltar slot;
+pedidos pendentes ou em preparo nunca são descartados.
+
+Leitores de monitoramento não usam o lock: o campo ``seq`` do cabeçalho é um
+seqlock. Escritores o tornam ímpar antes de alterar a arena e par ao
+terminar; leitores copiam a região e repetem a cópia se ``seq`` mudou ou
+estava ímpar.
+
+A sincronização acompanha o segmento: todo processo que se anexa pelo nome
+encontra o mesmo lock (arquivo ``<nome>.lock`` travado com ``flock``) e o
+mesmo semáforo "não vazio" (FIFO ``<nome>.fifo`` em que cada byte é uma
+ficha, como no jobserver do make).
+
+Monitores (interface, painéis) não precisam consultar a arena em intervalos
+fixos: ``assinar()`` devolve um ``CanalNotificacao``, um FIFO próprio do
+assinante registrado numa tabela do cabeçalho. Ao fim de cada seção
+crítica de escrita, o escritor grava um byte no FIFO de cada assinante que
+ainda não tenha notificação pendente; o assinante espera com ``select`` (ou
+registra ``fileno()`` em um laço de eventos) e rearma o canal com
+``consumir()``. Sem mutações, ninguém acorda.
+
+Cada slot guarda, além da criação (``timestamp``), os instantes em que o
+pedido foi retirado e concluído. Nessas transições o escritor soma a
+duração (espera na fila, preparo e latência total) a histogramas de baldes
+logarítmicos no diretório, como no HdrHistogram: cada potência de dois é
+dividida em ``SUBBALDES_HISTOGRAMA`` baldes lineares, o que dá erro relativo
+de no máximo 1/16 com tamanho fixo e atualização O(1). Os percentis são
+calculados pelos leitores a partir de uma cópia (``obter_percentis``).
+
+Retirar um pedido concede um lease de ``duracao_lease`` segundos ao
+consumidor. Cada consumidor tem um registro na tabela de batimentos do
+diretório e grava nele, sem lock, o instante do último batimento
+(``batimento``/``manter_batimentos``). Os pedidos em preparo ficam também em
+uma roda de temporização: ``CASAS_RODA`` listas intrusivas (campos
+``wprox``/``want`` do slot), uma por tique de ``RESOLUCAO_RODA`` segundos,
+indexadas pelo vencimento do lease. Quem retira pedidos avança o cursor da
+roda e visita só as casas vencidas desde a última passagem: o lease de um
+consumidor que ainda bate é renovado até o último batimento mais a duração;
+os demais pedidos voltam para a fila de pendentes. O custo é proporcional
+aos leases vencidos, não ao número de pedidos.
+
+Os pendentes também ficam em uma lista por item (campos ``iprox``/``iant``),
+com cabeça, cauda e contagem numa tabela de itens do diretório. Com ela,
+``obter_lote_mesmo_item`` retira de uma vez vários pendentes do mesmo item,
+para preparo conjunto: no FIFO, do item com mais pendentes, salvo quando o
+pedido mais antigo já esperou ``espera_max`` (aí o item dele); em PRIORIDADE
+e EDF, sempre do item do próximo pedido pela política.
+
+O estado da execução (``EstadoExecucao``) fica num bloco de controle do
+diretório, visível a todos os processos: fora de EXECUTANDO nenhum pedido é
+retirado. Entrar em DRENANDO incrementa a época de drenagem e libera fichas
+do semáforo para acordar quem espera pedidos; cada consumidor confirma a
+época na sua entrada da tabela de batimentos ao sair, e a entrada também diz
+se ele está ocupado ou ocioso. ``aguardar_drenagem`` espera, pelo canal de
+notificação, até não haver pedidos em preparo.
+
+Cada transição de status também é anexada a um anel de mudanças no
+diretório, numerado por uma sequência crescente. ``obter_mudancas(cursor)``
+devolve só o que mudou desde o cursor, para monitores que atualizam a tela
+de forma incremental.
+
+``consultar_pedidos`` devolve uma janela de pedidos filtrados e ordenados:
+os concluídos pelos índices secundários do arquivo (``IndiceArquivo``), os
+em andamento pelas listas de status e de item da arena.
 """
-from multiprocessing import shared_memory, Lock
-import json
+from multiprocessing import shared_memory
+from contextlib import contextmanager
+import os
+import select
+import tempfile
+import threading
 import time
-from typing import List
+from typing import Iterator, List, NamedTuple, Optional
 from dataclasses import dataclass
 from enum import Enum
+from bisect import bisect_left
 import struct
 
+from order_archive import ArquivoPedidos, IndiceArquivo, RegistroArquivado, CAMPOS_INDEXADOS, ORDENS
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 class PedidoStatus(Enum):
     PENDENTE = "Pendente"
     EM_PREPARO = "Em Preparo"
     CONCLUIDO = "Concluído"
 
+class PoliticaDespacho(Enum):
+    FIFO = "fifo"
+    PRIORIDADE = "prioridade"
+    EDF = "edf"
+
+class EstadoExecucao(Enum):
+    EXECUTANDO = "executando"
+    DRENANDO = "drenando"
+    PARADO = "parado"
+
+class Mudanca(NamedTuple):
+    """Uma transição de status do feed de mudanças (status None = pedido removido da arena)"""
+    seq: int
+    pedido_id: int
+    timestamp: float
+    mesa: int
+    item: str
+    status: Optional[str]
+    anterior: Optional[str]
+    produtor_id: int
+    consumidor_id: int
+
 @dataclass
 class Pedido:
     id: int
@@ -24,6 +162,12 @@ class Pedido:
     status: str
     produtor_id: int
     consumidor_id: int = -1
+    # Maior valor = mais urgente; deadline em segundos desde a época (0 = sem prazo)
+    prioridade: int = 0
+    deadline: float = 0.0
+    # Instantes em que foi retirado por um consumidor e concluído (0 = ainda não)
+    retirado_em: float = 0.0
+    concluido_em: float = 0.0
 
     def to_dict(self):
         return {
@@ -33,21 +177,590 @@ class Pedido:
             'timestamp': self.timestamp,
             'status': self.status,
             'produtor_id': self.produtor_id,
-            'consumidor_id': self.consumidor_id
+            'consumidor_id': self.consumidor_id,
+            'prioridade': self.prioridade,
+            'deadline': self.deadline,
+            'retirado_em': self.retirado_em,
+            'concluido_em': self.concluido_em
         }
 
     @classmethod
     def from_dict(cls, data):
         return cls(**data)
 
+# Cabeçalho do diretório: magic, versão, geometria, seqlock, gerações,
+# estatísticas, cabeças/caudas dos índices, contadores de prazo, política,
+# heap, duração do lease, cursor da roda de temporização e recuperados
+_MAGIC = b'PDRS'
+_VERSAO_LAYOUT = 12
+_CABECALHO = struct.Struct('<4sHHII' '7Q' 'III' '7i' '2Q' 'II' 'dQQQ')
+_OFF_SEQ = 16
+_OFF_GERACAO = 24
+_OFF_TOTAL_CRIADOS = 32
+_OFF_TOTAL_PROCESSADOS = 40
+_OFF_EM_FILA = 48
+_OFF_EM_PREPARO = 56
+_OFF_OCUPADOS = 64
+_OFF_NUM_SEGMENTOS = 72
+_OFF_CAPACIDADE_HASH = 76
+_OFF_GERACAO_HASH = 80
+_OFF_PENDENTES_CABECA = 84
+_OFF_PENDENTES_CAUDA = 88
+_OFF_PREPARO_CABECA = 92
+_OFF_PREPARO_CAUDA = 96
+_OFF_LIVRES_CABECA = 100
+_OFF_HISTORICO_CABECA = 104
+_OFF_HISTORICO_CAUDA = 108
+_OFF_PRAZOS_PERDIDOS = 112
+_OFF_CONCLUIDOS_COM_PRAZO = 120
+_OFF_POLITICA = 128
+_OFF_TAMANHO_HEAP = 132
+_OFF_DURACAO_LEASE = 136
+_OFF_CURSOR_RODA = 144
+_OFF_RECUPERADOS = 152
+_OFF_FALHAS_ARQUIVO = 160
+
+# Tabela de assinantes de notificação, logo após o cabeçalho:
+# quantidade (u32, seguida de 4 bytes de alinhamento) e MAX_ASSINANTES
+# entradas (pid, token, notificação pendente); token 0 = entrada livre
+MAX_ASSINANTES = 16
+_OFF_NUM_ASSINANTES = _CABECALHO.size
+_OFF_ASSINANTES = _OFF_NUM_ASSINANTES + 8
+_ENTRADA_ASSINANTE = struct.Struct('<iII')
+_OFF_ASSINANTE_PENDENTE = 8
+
+# Histogramas de latência (em microssegundos), após a tabela de assinantes:
+# amostras, soma, máximo e um contador u64 por balde. Valores abaixo de
+# SUBBALDES_HISTOGRAMA têm balde próprio; acima, cada potência de dois tem
+# SUBBALDES_HISTOGRAMA baldes. O último balde acumula tudo a partir de 2^37 µs
+HISTOGRAMAS = ('espera', 'preparo', 'total')
+SUBBALDES_HISTOGRAMA = 16
+NUM_BALDES_HISTOGRAMA = SUBBALDES_HISTOGRAMA * 34
+_HISTOGRAMA = struct.Struct('<3Q')
+_BALDES = struct.Struct(f'<{NUM_BALDES_HISTOGRAMA}Q')
+_TAMANHO_HISTOGRAMA = _HISTOGRAMA.size + _BALDES.size
+_OFF_HISTOGRAMAS = _OFF_ASSINANTES + MAX_ASSINANTES * _ENTRADA_ASSINANTE.size
+_HIST_ESPERA, _HIST_PREPARO, _HIST_TOTAL = range(len(HISTOGRAMAS))
+
+# Tabela de batimentos, após os histogramas: MAX_TRABALHADORES entradas
+# (consumidor_id, pid, último batimento, ocupado, última época de drenagem
+# confirmada); pid 0 = entrada livre. close() libera as entradas do processo e
+# um id reaproveitado por outro processo sobrescreve a entrada antiga
+MAX_TRABALHADORES = 256
+_ENTRADA_TRABALHADOR = struct.Struct('<iidII')
+_OFF_TRABALHADORES = _OFF_HISTOGRAMAS + len(HISTOGRAMAS) * _TAMANHO_HISTOGRAMA
+_OFF_TRABALHADOR_BATIMENTO = 8
+_OFF_TRABALHADOR_OCUPADO = 16
+_OFF_TRABALHADOR_EPOCA = 20
+
+# Roda de temporização dos leases: cabeça (i32) da lista de cada casa; o
+# tique t (tempo / RESOLUCAO_RODA) fica na casa t % CASAS_RODA
+CASAS_RODA = 256
+RESOLUCAO_RODA = 0.25
+_OFF_RODA = _OFF_TRABALHADORES + MAX_TRABALHADORES * _ENTRADA_TRABALHADOR.size
+
+# Tabela de itens, após a roda: MAX_ITENS entradas (nome, cabeça e cauda da
+# lista dos pendentes do item, quantidade de pendentes); nome vazio = livre
+ITEM_MAX_BYTES = 48
+MAX_ITENS = 64
+_ENTRADA_ITEM = struct.Struct(f'<{ITEM_MAX_BYTES}siiI')
+_OFF_ITEM_CABECA = ITEM_MAX_BYTES
+_OFF_ITEM_CAUDA = _OFF_ITEM_CABECA + 4
+_OFF_ITEM_PENDENTES = _OFF_ITEM_CAUDA + 4
+_OFF_ITENS = _OFF_RODA + CASAS_RODA * 4
+
+# Bloco de controle, após a tabela de itens: estado da execução (u32, mais
+# 4 bytes de alinhamento) e época de drenagem (u64, +1 a cada drenagem)
+_CONTROLE = struct.Struct('<I4xQ')
+_OFF_CONTROLE = _OFF_ITENS + MAX_ITENS * _ENTRADA_ITEM.size
+_OFF_ESTADO = _OFF_CONTROLE
+_OFF_EPOCA_DRENAGEM = _OFF_CONTROLE + 8
+
+# Feed de mudanças, após o bloco de controle: sequência da próxima mudança e
+# base (menor sequência ainda válida, avançada por limpar), seguidas de um anel
+# com as CAPACIDADE_MUDANCAS mudanças mais recentes. Cada entrada: sequência,
+# id, criação, mesa, produtor, consumidor, status novo, status anterior e item
+CAPACIDADE_MUDANCAS = 1024
+_CABECALHO_MUDANCAS = struct.Struct('<QQ')
+_ENTRADA_MUDANCA = struct.Struct(f'<QqdiiiBB{ITEM_MAX_BYTES}s2x')
+_OFF_MUDANCAS = _OFF_CONTROLE + _CONTROLE.size
+_OFF_MUDANCAS_SEQ = _OFF_MUDANCAS
+_OFF_MUDANCAS_BASE = _OFF_MUDANCAS + 8
+_OFF_ANEL_MUDANCAS = _OFF_MUDANCAS + _CABECALHO_MUDANCAS.size
+_TAMANHO_DIRETORIO = _OFF_ANEL_MUDANCAS + CAPACIDADE_MUDANCAS * _ENTRADA_MUDANCA.size
+
+# Slot: id, mesa, timestamp, status, produtor_id, consumidor_id, item,
+# prox, ant (fila do status / pilha de livres), hprox, hant (histórico),
+# prioridade, deadline, posição no heap, rebaixado por prazo perdido,
+# instantes de retirada e de conclusão, vencimento do lease, wprox, want e
+# casa (roda de temporização), entrada do consumidor na tabela de batimentos,
+# entrada do item na tabela de itens e iprox, iant (pendentes do item)
+_SLOT = struct.Struct(f'<qidBii{ITEM_MAX_BYTES}siiiiidiBdddiiiiiii')
+_OFF_SLOT_ID = 0
+_OFF_SLOT_TIMESTAMP = 12
+_OFF_SLOT_STATUS = 20
+_OFF_SLOT_CONSUMIDOR = 25
+_OFF_SLOT_PROX = 29 + ITEM_MAX_BYTES
+_OFF_SLOT_ANT = _OFF_SLOT_PROX + 4
+_OFF_SLOT_HPROX = _OFF_SLOT_ANT + 4
+_OFF_SLOT_HANT = _OFF_SLOT_HPROX + 4
+_OFF_SLOT_PRIORIDADE = _OFF_SLOT_HANT + 4
+_OFF_SLOT_DEADLINE = _OFF_SLOT_PRIORIDADE + 4
+_OFF_SLOT_POS_HEAP = _OFF_SLOT_DEADLINE + 8
+_OFF_SLOT_ATRASADO = _OFF_SLOT_POS_HEAP + 4
+_OFF_SLOT_RETIRADO = _OFF_SLOT_ATRASADO + 1
+_OFF_SLOT_CONCLUIDO = _OFF_SLOT_RETIRADO + 8
+_OFF_SLOT_LEASE = _OFF_SLOT_CONCLUIDO + 8
+_OFF_SLOT_WPROX = _OFF_SLOT_LEASE + 8
+_OFF_SLOT_WANT = _OFF_SLOT_WPROX + 4
+_OFF_SLOT_CASA = _OFF_SLOT_WANT + 4
+_OFF_SLOT_TRABALHADOR = _OFF_SLOT_CASA + 4
+_OFF_SLOT_ITEM = _OFF_SLOT_TRABALHADOR + 4
+_OFF_SLOT_IPROX = _OFF_SLOT_ITEM + 4
+_OFF_SLOT_IANT = _OFF_SLOT_IPROX + 4
+# Campos iniciais do slot (id, mesa, timestamp, status, produtor, consumidor, item)
+_SLOT_PREFIXO = struct.Struct(f'<qidBii{ITEM_MAX_BYTES}s')
+
+# Heap de despacho: um slot (i32) por posição, guardado após os slots de
+# cada segmento; a posição p fica no segmento p // slots_por_segmento
+_ENTRADA_HEAP = struct.Struct('<i')
+
+# Entrada da tabela hash: id do pedido, slot + 1 (0 = entrada livre)
+_ENTRADA_HASH = struct.Struct('<qi')
+_FATOR_CARGA_MAX = 0.75
+_NENHUM = -1
+
+_U8 = struct.Struct('<B')
+_I32 = struct.Struct('<i')
+_I64 = struct.Struct('<q')
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+_F64 = struct.Struct('<d')
+
+# Códigos de status gravados no slot
+_STATUS_VAZIO = 0
+_STATUS_PARA_CODIGO = {
+    PedidoStatus.PENDENTE.value: 1,
+    PedidoStatus.EM_PREPARO.value: 2,
+    PedidoStatus.CONCLUIDO.value: 3,
+}
+_CODIGO_PARA_STATUS = {codigo: status for status, codigo in _STATUS_PARA_CODIGO.items()}
+_COD_PENDENTE = _STATUS_PARA_CODIGO[PedidoStatus.PENDENTE.value]
+_COD_EM_PREPARO = _STATUS_PARA_CODIGO[PedidoStatus.EM_PREPARO.value]
+_COD_CONCLUIDO = _STATUS_PARA_CODIGO[PedidoStatus.CONCLUIDO.value]
+
+_POLITICA_PARA_CODIGO = {
+    PoliticaDespacho.FIFO: 0,
+    PoliticaDespacho.PRIORIDADE: 1,
+    PoliticaDespacho.EDF: 2,
+}
+_CODIGO_PARA_POLITICA = {codigo: politica for politica, codigo in _POLITICA_PARA_CODIGO.items()}
+_POL_FIFO = _POLITICA_PARA_CODIGO[PoliticaDespacho.FIFO]
+_POL_PRIORIDADE = _POLITICA_PARA_CODIGO[PoliticaDespacho.PRIORIDADE]
+_POL_EDF = _POLITICA_PARA_CODIGO[PoliticaDespacho.EDF]
+
+_ESTADO_PARA_CODIGO = {
+    EstadoExecucao.EXECUTANDO: 0,
+    EstadoExecucao.DRENANDO: 1,
+    EstadoExecucao.PARADO: 2,
+}
+_CODIGO_PARA_ESTADO = {codigo: estado for estado, codigo in _ESTADO_PARA_CODIGO.items()}
+_EST_EXECUTANDO = _ESTADO_PARA_CODIGO[EstadoExecucao.EXECUTANDO]
+
+# Status que mantêm o slot em uma lista intrusiva: (cabeça, cauda, contador)
+_LISTAS_STATUS = {
+    _COD_PENDENTE: (_OFF_PENDENTES_CABECA, _OFF_PENDENTES_CAUDA, _OFF_EM_FILA),
+    _COD_EM_PREPARO: (_OFF_PREPARO_CABECA, _OFF_PREPARO_CAUDA, _OFF_EM_PREPARO),
+}
+
+
+def _codificar_item(item: str) -> bytes:
+    """Codifica o nome do item em UTF-8 limitado ao tamanho do slot"""
+    dados = item.encode('utf-8')[:ITEM_MAX_BYTES]
+    # Não deixar um caractere multibyte cortado ao meio
+    return dados.decode('utf-8', 'ignore').encode('utf-8')
+
+
+def _hash_id(pedido_id: int) -> int:
+    """Hash multiplicativo (Fibonacci) do id em 64 bits"""
+    return ((pedido_id * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) >> 32
+
+
+def _janela_mesclada(chaves_ativos: list, posicoes, chave, inicio: int, fim: int) -> list:
+    """Posições [inicio, fim) da mescla de duas sequências crescentes, sem percorrer o começo
+
+    ``chaves_ativos`` são as chaves da primeira sequência (pequena);
+    ``posicoes`` a segunda, com ``chave(posicao)``. Em empate, a segunda vem
+    antes. Retorna (True, índice) para a primeira e (False, posição) para a
+    segunda. Custo O(log² n + fim - inicio).
+    """
+    # Menor j cuja posição na mescla (j + ativos com chave menor) alcança inicio
+    baixo, alto = 0, len(posicoes)
+    while baixo < alto:
+        meio = (baixo + alto) // 2
+        if meio + bisect_left(chaves_ativos, chave(posicoes[meio])) >= inicio:
+            alto = meio
+        else:
+            baixo = meio + 1
+    j, i = baixo, inicio - baixo
+    janela = []
+    while len(janela) < fim - inicio and (i < len(chaves_ativos) or j < len(posicoes)):
+        if j < len(posicoes) and (i >= len(chaves_ativos) or chave(posicoes[j]) <= chaves_ativos[i]):
+            janela.append((False, posicoes[j]))
+            j += 1
+        else:
+            janela.append((True, i))
+            i += 1
+    return janela
+
+
+def _potencia_de_dois(n: int) -> int:
+    """Menor potência de dois >= n"""
+    return 1 << max(0, n - 1).bit_length()
+
+
+def _indice_balde(valor: int) -> int:
+    """Balde do histograma para um valor em microssegundos"""
+    if valor < SUBBALDES_HISTOGRAMA:
+        return max(0, valor)
+    deslocamento = valor.bit_length() - 5
+    return min(NUM_BALDES_HISTOGRAMA - 1,
+               (deslocamento + 1) * SUBBALDES_HISTOGRAMA + ((valor >> deslocamento) & (SUBBALDES_HISTOGRAMA - 1)))
+
+
+def _maior_valor_balde(indice: int) -> int:
+    """Maior valor (µs) que cai no balde"""
+    if indice < SUBBALDES_HISTOGRAMA:
+        return indice
+    deslocamento = indice // SUBBALDES_HISTOGRAMA - 1
+    inicio = (SUBBALDES_HISTOGRAMA + indice % SUBBALDES_HISTOGRAMA) << deslocamento
+    return inicio + (1 << deslocamento) - 1
+
+
+def percentis_histograma(histograma: dict, pontos=(50, 95, 99)) -> dict:
+    """Percentis (em segundos) de um histograma de ``obter_histogramas``
+
+    Cada percentil é o maior valor do balde em que cai, limitado ao máximo
+    observado. Retorna também amostras, média e máximo; sem amostras os
+    valores são None.
+    """
+    amostras = histograma['amostras']
+    resultado = {'amostras': amostras}
+    if amostras == 0:
+        resultado.update({'media': None, 'max': None})
+        resultado.update({'p' + f"{ponto:g}".replace('.', ''): None for ponto in pontos})
+        return resultado
+
+    resultado['media'] = histograma['soma'] / amostras / 1e6
+    resultado['max'] = histograma['maximo'] / 1e6
+    baldes = histograma['baldes']
+    for ponto in sorted(pontos):
+        alvo = max(1, -(-amostras * ponto // 100))
+        acumulado = 0
+        for indice, contagem in enumerate(baldes):
+            acumulado += contagem
+            if acumulado >= alvo:
+                break
+        valor = min(_maior_valor_balde(indice), histograma['maximo'])
+        resultado['p' + f"{ponto:g}".replace('.', '')] = valor / 1e6
+    return resultado
+
+
+def iterar_pedidos_arquivados(arquivo: ArquivoPedidos, inicio: int = 0, fim: Optional[int] = None,
+                              lote: int = 4096) -> Iterator[Pedido]:
+    """Percorre os concluídos [inicio, fim) de um arquivo como Pedidos, em lotes, com memória limitada"""
+    for registro in arquivo.iterar(inicio, fim, lote):
+        yield SharedMemoryManager._pedido_arquivado(registro)
+
+
+def _criar_segmento(nome: str, tamanho: int) -> shared_memory.SharedMemory:
+    """Cria um segmento, descartando um resíduo de execução anterior com o mesmo nome"""
+    try:
+        return shared_memory.SharedMemory(name=nome, create=True, size=tamanho)
+    except FileExistsError:
+        antigo = shared_memory.SharedMemory(name=nome)
+        antigo.close()
+        antigo.unlink()
+        return shared_memory.SharedMemory(name=nome, create=True, size=tamanho)
+
+
+def _caminho_sincronizacao(name: str, sufixo: str) -> str:
+    """Caminho do arquivo de sincronização associado ao segmento"""
+    return os.path.join(tempfile.gettempdir(), f"{name}.{sufixo}")
+
+
+def _caminho_assinante(pid: int, token: int) -> str:
+    """FIFO de um assinante; independe do segmento (um canal pode assinar vários)"""
+    return _caminho_sincronizacao(f"assinante_{pid}_{token:08x}", 'fifo')
+
+
+class TravaSegmento:
+    """Lock entre processos localizado pelo nome do segmento
+
+    Usa ``flock`` (``msvcrt.locking`` no Windows) sobre ``<nome>.lock``, de modo
+    que processos anexados com ``create=False`` disputam o mesmo lock. O lock é
+    liberado pelo kernel se o processo que o detém morrer. Um ``threading.Lock``
+    complementa o ``flock``, que não exclui threads do mesmo processo.
+    """
+
+    def __init__(self, name: str):
+        self.caminho = _caminho_sincronizacao(name, 'lock')
+        self._trava_local = threading.Lock()
+        self._fd = None
+        self._pid = None
+
+    def _descritor(self) -> int:
+        # Após fork o descritor herdado compartilha o flock do pai: reabrir
+        if self._fd is None or self._pid != os.getpid():
+            self._fd = os.open(self.caminho, os.O_RDWR | os.O_CREAT, 0o600)
+            self._pid = os.getpid()
+        return self._fd
+
+    def acquire(self):
+        self._trava_local.acquire()
+        try:
+            fd = self._descritor()
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+        except:
+            self._trava_local.release()
+            raise
+        return True
+
+    def release(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            self._trava_local.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+    def close(self):
+        if self._fd is not None and self._pid == os.getpid():
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+        self._fd = None
+
+    def unlink(self):
+        try:
+            os.unlink(self.caminho)
+        except OSError:
+            pass
+
+
+class SemaforoSegmento:
+    """Semáforo contador "não vazio" localizado pelo nome do segmento
+
+    Cada byte no FIFO ``<nome>.fifo`` é uma ficha. ``liberar`` escreve fichas
+    sem bloquear (FIFO cheio significa semáforo saturado) e ``adquirir`` bloqueia
+    em ``select`` até haver uma ficha ou o timeout expirar. Sem FIFO (Windows),
+    ``adquirir`` degrada para uma espera curta seguida de nova verificação.
+    """
+
+    ESPERA_SEM_FIFO = 0.05
+
+    def __init__(self, name: str, create: bool = False):
+        self.caminho = _caminho_sincronizacao(name, 'fifo')
+        self._fd = None
+
+        if not hasattr(os, 'mkfifo'):
+            return
+
+        if create:
+            self.unlink()
+        try:
+            os.mkfifo(self.caminho, 0o600)
+        except FileExistsError:
+            pass
+        # O_RDWR evita bloquear na abertura e receber EOF sem escritores
+        self._fd = os.open(self.caminho, os.O_RDWR | os.O_NONBLOCK)
+
+    def fileno(self) -> int:
+        return self._fd if self._fd is not None else -1
+
+    def liberar(self, n: int = 1):
+        """Disponibiliza n fichas"""
+        if self._fd is None or n <= 0:
+            return
+        try:
+            os.write(self._fd, b'\0' * n)
+        except (BlockingIOError, OSError):
+            pass
+
+    def tentar_adquirir(self, n: int = 1) -> int:
+        """Consome até n fichas sem bloquear; retorna quantas consumiu"""
+        if self._fd is None or n <= 0:
+            return 0
+        try:
+            return len(os.read(self._fd, n))
+        except (BlockingIOError, OSError):
+            return 0
+
+    def adquirir(self, timeout: Optional[float] = None) -> bool:
+        """Bloqueia até obter uma ficha; False se o timeout expirar"""
+        if self._fd is None:
+            time.sleep(self.ESPERA_SEM_FIFO if timeout is None else min(timeout, self.ESPERA_SEM_FIFO))
+            return True
+
+        limite = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.tentar_adquirir():
+                return True
+            restante = None if limite is None else limite - time.monotonic()
+            if restante is not None and restante <= 0:
+                return False
+            try:
+                select.select([self._fd], [], [], restante)
+            except InterruptedError:
+                pass
+
+    def close(self):
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+
+    def unlink(self):
+        try:
+            os.unlink(self.caminho)
+        except OSError:
+            pass
+
+
+class CanalNotificacao:
+    """FIFO de um assinante, sinalizado pelos escritores após cada mutação
+
+    ``fileno()`` pode ser usado em ``select`` ou registrado em um laço de
+    eventos. Depois de acordar, chame ``consumir()`` antes de ler o estado:
+    isso rearma o canal, e uma mutação posterior volta a sinalizá-lo. Um
+    mesmo canal pode assinar vários segmentos (modo fragmentado).
+    """
+
+    def __init__(self):
+        if not hasattr(os, 'mkfifo'):
+            raise OSError("Canal de notificação requer FIFOs (mkfifo)")
+        self.pid = os.getpid()
+        self.token = int.from_bytes(os.urandom(4), 'little') | 1
+        self.caminho = _caminho_assinante(self.pid, self.token)
+        os.mkfifo(self.caminho, 0o600)
+        # O_RDWR: o FIFO tem sempre um leitor, e os escritores nunca recebem ENXIO
+        self._fd = os.open(self.caminho, os.O_RDWR | os.O_NONBLOCK)
+        self._registros = []
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def _registrar(self, gerenciador, indice: int):
+        self._registros.append((gerenciador, indice))
+
+    def consumir(self):
+        """Rearma o canal e descarta as notificações já recebidas"""
+        for gerenciador, indice in self._registros:
+            gerenciador._rearmar_assinante(indice, self.token)
+        try:
+            while os.read(self._fd, 4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def esperar(self, timeout: Optional[float] = None) -> bool:
+        """Bloqueia até haver notificação; False se o timeout expirar"""
+        try:
+            return bool(select.select([self._fd], [], [], timeout)[0])
+        except InterruptedError:
+            return False
+
+    def cancelar(self):
+        """Remove as assinaturas e apaga o FIFO"""
+        for gerenciador, indice in self._registros:
+            try:
+                gerenciador._cancelar_assinante(indice, self.token)
+            except:
+                pass
+        self._registros = []
+        if self._fd is not None:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+        try:
+            os.unlink(self.caminho)
+        except OSError:
+            pass
+
+
 class SharedMemoryManager:
-    BUFFER_SIZE = 20480  # 20KB
+    HEADER_SIZE = _TAMANHO_DIRETORIO
+    SLOT_SIZE = _SLOT.size
+    # Geometria padrão da arena (em slots); cada segmento tem SLOTS_POR_SEGMENTO slots
+    SLOTS_POR_SEGMENTO = 1024
+    CAPACIDADE_INICIAL = 1024
+    CAPACIDADE_MAXIMA = 65536
+    # Fração de slots com pedidos em andamento que dispara o crescimento
+    LIMIAR_CRESCIMENTO = 0.75
+    # Cópias otimistas antes de recorrer ao lock (escritor lento ou morto)
+    TENTATIVAS_LEITURA = 64
+    # Anexação a uma arena ainda não criada: espera exponencial até o timeout
+    TIMEOUT_ANEXACAO = 5.0
+    ESPERA_ANEXACAO_INICIAL = 0.001
+    ESPERA_ANEXACAO_MAXIMA = 0.05
+    # Lease de um pedido retirado e intervalo padrão dos batimentos (segundos)
+    DURACAO_LEASE = 10.0
+    INTERVALO_BATIMENTO = 1.0
 
-    def __init__(self, name='pedidos_shm', create=True, lock=None):
+    def __init__(self, name='pedidos_shm', create=True, lock=None,
+                 capacidade_inicial=None, capacidade_maxima=None, slots_por_segmento=None,
+                 politica=PoliticaDespacho.FIFO, timeout_anexacao=None, duracao_lease=None):
         self.name = name
         self.shm = None
-        self.lock = lock if lock else Lock()
-        self.em_encerramento = False
+        self.buf = None
+        self.lock = lock if lock else TravaSegmento(name)
+        self.nao_vazio = SemaforoSegmento(name, create=create)
+        # Descritores abertos para os FIFOs dos assinantes, por (pid, token)
+        self._fds_assinantes = {}
+        # Entrada de cada consumidor deste processo na tabela de batimentos
+        self._trabalhadores = {}
+        # Entrada de cada nome de item (codificado) na tabela de itens
+        self._itens = {}
+        self._parar_batimentos = threading.Event()
+        self._threads_batimento = []
+        # Pedidos concluídos; quem cria a arena começa um arquivo novo
+        self.arquivo = ArquivoPedidos(_caminho_sincronizacao(name, 'arquivo'), criar=create)
+        # Índices secundários do arquivo, criados na primeira consulta deste processo
+        self._indice_arquivo = None
+        self._trava_indice = threading.Lock()
+
+        # Mapeamentos locais dos segmentos de slots e da tabela hash
+        self._segmentos = []
+        self._bufs = []
+        self._shm_hash = None
+        self._buf_hash = None
+        self._geracao = -1
+        self._geracao_hash = -1
+        self.slots_por_segmento = 0
+        self.max_segmentos = 0
+        self.capacidade_hash = 0
 
         if create:
             try:
@@ -59,219 +772,1738 @@ class SharedMemoryManager:
                 except:
                     pass
 
-                self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=self.BUFFER_SIZE)
-                initial_data = {'pedidos': [], 'stats': {
-                    'total_criados': 0, 'total_processados': 0, 'em_fila': 0
-                }}
-                self._write_data_unsafe(initial_data)
+                self.shm = shared_memory.SharedMemory(name=self.name, create=True, size=self.HEADER_SIZE)
+                self.buf = self.shm.buf
+                self._inicializar_arena(capacidade_inicial or self.CAPACIDADE_INICIAL,
+                                        capacidade_maxima or self.CAPACIDADE_MAXIMA,
+                                        slots_por_segmento or self.SLOTS_POR_SEGMENTO,
+                                        PoliticaDespacho(politica),
+                                        duracao_lease or self.DURACAO_LEASE)
 
             except FileExistsError:
                 self.shm = shared_memory.SharedMemory(name=self.name)
+                self._anexar()
         else:
+            self.shm = self._abrir_diretorio(
+                self.TIMEOUT_ANEXACAO if timeout_anexacao is None else timeout_anexacao)
+            self._anexar()
+
+    @property
+    def capacidade(self) -> int:
+        """Capacidade atual da arena em slots (segmentos já mapeados)"""
+        return len(self._bufs) * self.slots_por_segmento
+
+    # ------------------------------------------------------------------
+    # Arena: criação, anexação e mapeamento de segmentos (uso interno)
+    # ------------------------------------------------------------------
+
+    def _nome_segmento(self, indice: int) -> str:
+        return f"{self.name}_s{indice}"
+
+    def _nome_hash(self, geracao: int) -> str:
+        return f"{self.name}_h{geracao}"
+
+    def _abrir_diretorio(self, timeout: float) -> shared_memory.SharedMemory:
+        """Abre o diretório de uma arena existente, esperando quem a cria terminar
+
+        Tenta de novo com espera exponencial enquanto o segmento não existe ou
+        ainda não tem o magic (gravado por último na criação). Lança
+        FileNotFoundError após o timeout.
+        """
+        limite = time.monotonic() + timeout
+        espera = self.ESPERA_ANEXACAO_INICIAL
+        while True:
             try:
-                self.shm = shared_memory.SharedMemory(name=self.name)
+                shm = shared_memory.SharedMemory(name=self.name)
+                if bytes(shm.buf[:len(_MAGIC)]) != bytes(len(_MAGIC)):
+                    return shm
+                shm.close()
             except FileNotFoundError:
-                time.sleep(0.5)
-                self.shm = shared_memory.SharedMemory(name=self.name)
+                pass
+            if time.monotonic() >= limite:
+                raise FileNotFoundError(f"Memória compartilhada '{self.name}' não encontrada")
+            time.sleep(espera)
+            espera = min(espera * 2, self.ESPERA_ANEXACAO_MAXIMA)
 
-    def _write_data_unsafe(self, data: dict):
-        """Escreve dados SEM lock (uso interno)"""
-        try:
-            json_str = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
-            json_bytes = json_str.encode('utf-8')
+    def _inicializar_arena(self, capacidade_inicial: int, capacidade_maxima: int, slots_por_segmento: int,
+                           politica: PoliticaDespacho, duracao_lease: float):
+        """Grava o diretório e cria os primeiros segmentos (uso interno)"""
+        self.slots_por_segmento = _potencia_de_dois(slots_por_segmento)
+        self.max_segmentos = max(1, -(-capacidade_maxima // self.slots_por_segmento))
+        num_segmentos = min(self.max_segmentos, max(1, -(-capacidade_inicial // self.slots_por_segmento)))
+        self._configurar_geometria()
+
+        # Magic zerado até a arena estar completa: quem anexa espera por ele
+        _CABECALHO.pack_into(self.buf, 0, bytes(len(_MAGIC)), _VERSAO_LAYOUT, 0,
+                             self.slots_por_segmento, self.max_segmentos,
+                             0, 0, 0, 0, 0, 0, 0,
+                             0, 0, 0,
+                             _NENHUM, _NENHUM, _NENHUM, _NENHUM, _NENHUM, _NENHUM, _NENHUM,
+                             0, 0, _POLITICA_PARA_CODIGO[politica], 0,
+                             duracao_lease, int(time.time() / RESOLUCAO_RODA), 0, 0)
+        self._esvaziar_roda_unsafe()
+        for _ in range(num_segmentos):
+            self._adicionar_segmento_unsafe()
+        self._redimensionar_hash_unsafe()
+        self.buf[:len(_MAGIC)] = _MAGIC
+
+    def _configurar_geometria(self):
+        self._bits_segmento = self.slots_por_segmento.bit_length() - 1
+        self._mascara_segmento = self.slots_por_segmento - 1
+        self._inicio_heap = self.slots_por_segmento * self.SLOT_SIZE
+
+    def _anexar(self):
+        """Valida o diretório de uma arena existente e mapeia seus segmentos (uso interno)"""
+        self.buf = self.shm.buf
+        magic, versao, _, slots_por_segmento, max_segmentos = _CABECALHO.unpack_from(self.buf, 0)[:5]
+        if magic != _MAGIC or versao != _VERSAO_LAYOUT:
+            raise ValueError(f"Segmento '{self.name}' não possui o layout esperado")
+        self.slots_por_segmento = slots_por_segmento
+        self.max_segmentos = max_segmentos
+        self._configurar_geometria()
+        self._sincronizar_mapeamentos()
+
+    def _sincronizar_mapeamentos(self):
+        """Mapeia segmentos criados por outros processos desde o último acesso"""
+        geracao = self._ler_u64(_OFF_GERACAO)
+        if geracao == self._geracao:
+            return
+
+        num_segmentos = self._ler_u32(_OFF_NUM_SEGMENTOS)
+        while len(self._segmentos) < num_segmentos:
+            segmento = shared_memory.SharedMemory(name=self._nome_segmento(len(self._segmentos)))
+            self._segmentos.append(segmento)
+            self._bufs.append(segmento.buf)
+
+        geracao_hash = self._ler_u32(_OFF_GERACAO_HASH)
+        if geracao_hash != self._geracao_hash:
+            self._fechar_hash()
+            self._shm_hash = shared_memory.SharedMemory(name=self._nome_hash(geracao_hash))
+            self._buf_hash = self._shm_hash.buf
+            self._geracao_hash = geracao_hash
+            self.capacidade_hash = self._ler_u32(_OFF_CAPACIDADE_HASH)
+
+        self._geracao = geracao
+
+    def _fechar_hash(self):
+        if self._shm_hash is not None:
+            self._buf_hash = None
+            try:
+                self._shm_hash.close()
+            except:
+                pass
+            self._shm_hash = None
+
+    def _adicionar_segmento_unsafe(self) -> bool:
+        """Cria o próximo segmento de slots e empilha seus slots como livres"""
+        indice = len(self._segmentos)
+        if indice >= self.max_segmentos:
+            return False
+
+        segmento = _criar_segmento(self._nome_segmento(indice),
+                                   self.slots_por_segmento * (self.SLOT_SIZE + _ENTRADA_HEAP.size))
+        self._segmentos.append(segmento)
+        self._bufs.append(segmento.buf)
+
+        # Slots novos (zerados = vazios) encadeados na pilha de livres
+        self._empilhar_livres_unsafe(indice)
+
+        self._escrever_u32(_OFF_NUM_SEGMENTOS, indice + 1)
+        self._geracao = self._ler_u64(_OFF_GERACAO) + 1
+        self._escrever_u64(_OFF_GERACAO, self._geracao)
+        return True
+
+    def _empilhar_livres_unsafe(self, indice: int):
+        """Empilha todos os slots do segmento `indice` como livres, em ordem crescente"""
+        buf = self._bufs[indice]
+        primeiro = indice * self.slots_por_segmento
+        livres = self._ler_i32(_OFF_LIVRES_CABECA)
+        for deslocamento in range(self.slots_por_segmento - 1, -1, -1):
+            _I32.pack_into(buf, deslocamento * self.SLOT_SIZE + _OFF_SLOT_PROX, livres)
+            livres = primeiro + deslocamento
+        self._escrever_i32(_OFF_LIVRES_CABECA, livres)
+
+    def _redimensionar_hash_unsafe(self):
+        """Recria a tabela hash se a capacidade da arena ultrapassou o fator de carga"""
+        capacidade_hash = _potencia_de_dois(int(self.capacidade / _FATOR_CARGA_MAX) + 1)
+        if capacidade_hash <= self.capacidade_hash:
+            return
+
+        geracao_hash = self._geracao_hash + 1
+        nova = _criar_segmento(self._nome_hash(geracao_hash), capacidade_hash * _ENTRADA_HASH.size)
+        antiga = self._shm_hash
+
+        self._shm_hash = nova
+        self._buf_hash = nova.buf
+        self.capacidade_hash = capacidade_hash
+        self._geracao_hash = geracao_hash
+        self._escrever_u32(_OFF_CAPACIDADE_HASH, capacidade_hash)
+        self._escrever_u32(_OFF_GERACAO_HASH, geracao_hash)
+
+        # Reinserir todos os pedidos residentes (percorrendo o histórico)
+        slot = self._ler_i32(_OFF_HISTORICO_CABECA)
+        while slot != _NENHUM:
+            self._hash_inserir(self._id_slot(slot), slot)
+            slot = self._ler_i32_slot(slot, _OFF_SLOT_HPROX)
+
+        if antiga is not None:
+            antiga.close()
+            antiga.unlink()
+
+        self._geracao = self._ler_u64(_OFF_GERACAO) + 1
+        self._escrever_u64(_OFF_GERACAO, self._geracao)
+
+    def _crescer_unsafe(self) -> bool:
+        """Acrescenta um segmento de slots à arena; False se já está no máximo"""
+        if not self._adicionar_segmento_unsafe():
+            return False
+        self._redimensionar_hash_unsafe()
+        return True
+
+    # ------------------------------------------------------------------
+    # Acesso ao layout binário (uso interno, sem lock)
+    # ------------------------------------------------------------------
+
+    def _ler_u64(self, offset: int) -> int:
+        return _U64.unpack_from(self.buf, offset)[0]
+
+    def _escrever_u64(self, offset: int, valor: int):
+        _U64.pack_into(self.buf, offset, valor)
+
+    def _ler_u32(self, offset: int) -> int:
+        return _U32.unpack_from(self.buf, offset)[0]
+
+    def _escrever_u32(self, offset: int, valor: int):
+        _U32.pack_into(self.buf, offset, valor)
+
+    def _ler_i32(self, offset: int) -> int:
+        return _I32.unpack_from(self.buf, offset)[0]
+
+    def _escrever_i32(self, offset: int, valor: int):
+        _I32.pack_into(self.buf, offset, valor)
+
+    @contextmanager
+    def _escrita(self):
+        """Seção crítica de escrita: lock + seqlock ímpar durante a mutação"""
+        with self.lock:
+            seq = self._ler_u64(_OFF_SEQ)
+            # Ímpar na entrada indica escritor anterior morto no meio da escrita
+            self._escrever_u64(_OFF_SEQ, seq + 2 if seq & 1 else seq + 1)
+            try:
+                self._sincronizar_mapeamentos()
+                yield
+            finally:
+                self._escrever_u64(_OFF_SEQ, self._ler_u64(_OFF_SEQ) + 1)
+                if self._ler_u32(_OFF_NUM_ASSINANTES):
+                    self._notificar_assinantes_unsafe()
+
+    # --- Assinantes de notificação ---
+
+    def _notificar_assinantes_unsafe(self):
+        """Sinaliza cada assinante sem notificação pendente (uma escrita por assinante)"""
+        for indice in range(MAX_ASSINANTES):
+            offset = _OFF_ASSINANTES + indice * _ENTRADA_ASSINANTE.size
+            pid, token, pendente = _ENTRADA_ASSINANTE.unpack_from(self.buf, offset)
+            if token == 0 or pendente:
+                continue
+            _U32.pack_into(self.buf, offset + _OFF_ASSINANTE_PENDENTE, 1)
+            try:
+                fd = self._fds_assinantes.get((pid, token))
+                if fd is None:
+                    fd = os.open(_caminho_assinante(pid, token), os.O_WRONLY | os.O_NONBLOCK)
+                    self._fds_assinantes[(pid, token)] = fd
+                os.write(fd, b'\0')
+            except BlockingIOError:
+                # FIFO cheio: o assinante já tem o que ler
+                pass
+            except OSError:
+                # Assinante terminou sem cancelar: liberar a entrada
+                self._remover_assinante_unsafe(indice)
+
+    def _remover_assinante_unsafe(self, indice: int):
+        offset = _OFF_ASSINANTES + indice * _ENTRADA_ASSINANTE.size
+        pid, token, _ = _ENTRADA_ASSINANTE.unpack_from(self.buf, offset)
+        if token == 0:
+            return
+        _ENTRADA_ASSINANTE.pack_into(self.buf, offset, 0, 0, 0)
+        self._escrever_u32(_OFF_NUM_ASSINANTES, self._ler_u32(_OFF_NUM_ASSINANTES) - 1)
+        fd = self._fds_assinantes.pop((pid, token), None)
+        if fd is not None:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def _rearmar_assinante(self, indice: int, token: int):
+        # Sem lock: no pior caso o escritor seguinte sinaliza de novo (acordar a mais, nunca a menos)
+        offset = _OFF_ASSINANTES + indice * _ENTRADA_ASSINANTE.size
+        if _ENTRADA_ASSINANTE.unpack_from(self.buf, offset)[1] == token:
+            _U32.pack_into(self.buf, offset + _OFF_ASSINANTE_PENDENTE, 0)
+
+    def _cancelar_assinante(self, indice: int, token: int):
+        with self.lock:
+            offset = _OFF_ASSINANTES + indice * _ENTRADA_ASSINANTE.size
+            if _ENTRADA_ASSINANTE.unpack_from(self.buf, offset)[1] == token:
+                self._remover_assinante_unsafe(indice)
+
+    def _copiar_consistente(self, incluir_slots: bool = True, incluir_histogramas: bool = False):
+        """Copia cabeçalho e segmentos de slots sem lock (leitura seqlock)
+
+        Retorna (cabeçalho, [bytes de cada segmento de slots]). Os histogramas
+        (e as tabelas seguintes, até o feed de mudanças) só entram na cópia do
+        cabeçalho se pedidos.
+        """
+        fim_cabecalho = _OFF_MUDANCAS if incluir_histogramas else _OFF_HISTOGRAMAS
+        for _ in range(self.TENTATIVAS_LEITURA):
+            seq = _U64.unpack_from(self.buf, _OFF_SEQ)[0]
+            if seq & 1:
+                time.sleep(0)
+                continue
+            try:
+                self._sincronizar_mapeamentos()
+            except FileNotFoundError:
+                # Crescimento concorrente ainda não visível: tentar de novo
+                continue
+            cabecalho = bytes(self.buf[:fim_cabecalho])
+            blocos = [bytes(buf) for buf in self._bufs] if incluir_slots else []
+            if _U64.unpack_from(self.buf, _OFF_SEQ)[0] == seq:
+                return cabecalho, blocos
+
+        with self.lock:
+            self._sincronizar_mapeamentos()
+            return bytes(self.buf[:fim_cabecalho]), \
+                [bytes(buf) for buf in self._bufs] if incluir_slots else []
+
+    def _local(self, slot: int, bufs=None):
+        """(buffer do segmento, offset) de um slot global"""
+        return (self._bufs if bufs is None else bufs)[slot >> self._bits_segmento], \
+            (slot & self._mascara_segmento) * self.SLOT_SIZE
+
+    def _ler_i32_slot(self, slot: int, campo: int, bufs=None) -> int:
+        buf, offset = self._local(slot, bufs)
+        return _I32.unpack_from(buf, offset + campo)[0]
+
+    def _escrever_i32_slot(self, slot: int, campo: int, valor: int):
+        buf, offset = self._local(slot)
+        _I32.pack_into(buf, offset + campo, valor)
+
+    def _offset_hash(self, indice: int) -> int:
+        return indice * _ENTRADA_HASH.size
+
+    def _escrever_slot(self, slot: int, pedido: Pedido, status: int):
+        buf, offset = self._local(slot)
+        _SLOT.pack_into(buf, offset,
+                        pedido.id, pedido.mesa, pedido.timestamp,
+                        status, pedido.produtor_id,
+                        pedido.consumidor_id, _codificar_item(pedido.item),
+                        _NENHUM, _NENHUM, _NENHUM, _NENHUM,
+                        pedido.prioridade, pedido.deadline, _NENHUM, 0,
+                        pedido.retirado_em, pedido.concluido_em,
+                        0.0, _NENHUM, _NENHUM, _NENHUM, _NENHUM,
+                        _NENHUM, _NENHUM, _NENHUM)
+
+    def _ler_slot(self, slot: int, bufs=None) -> Pedido:
+        buf, offset = self._local(slot, bufs)
+        campos = _SLOT.unpack_from(buf, offset)
+        pedido_id, mesa, timestamp, status, produtor_id, consumidor_id, item = campos[:7]
+        prioridade, deadline = campos[11:13]
+        retirado_em, concluido_em = campos[15:17]
+        return Pedido(
+            id=pedido_id,
+            mesa=mesa,
+            item=item.rstrip(b'\0').decode('utf-8', 'ignore'),
+            timestamp=timestamp,
+            status=_CODIGO_PARA_STATUS.get(status, PedidoStatus.CONCLUIDO.value),
+            produtor_id=produtor_id,
+            consumidor_id=consumidor_id,
+            prioridade=prioridade,
+            deadline=deadline,
+            retirado_em=retirado_em,
+            concluido_em=concluido_em
+        )
+
+    def _status_slot(self, slot: int) -> int:
+        buf, offset = self._local(slot)
+        return buf[offset + _OFF_SLOT_STATUS]
+
+    def _id_slot(self, slot: int) -> int:
+        buf, offset = self._local(slot)
+        return _I64.unpack_from(buf, offset + _OFF_SLOT_ID)[0]
+
+    # --- Listas intrusivas (pendentes / em preparo / histórico) ---
+
+    def _lista_anexar(self, off_cabeca: int, off_cauda: int, slot: int,
+                      campo_prox: int = _OFF_SLOT_PROX, campo_ant: int = _OFF_SLOT_ANT):
+        """Insere o slot no fim da lista"""
+        cauda = self._ler_i32(off_cauda)
+        self._escrever_i32_slot(slot, campo_prox, _NENHUM)
+        self._escrever_i32_slot(slot, campo_ant, cauda)
+        if cauda == _NENHUM:
+            self._escrever_i32(off_cabeca, slot)
+        else:
+            self._escrever_i32_slot(cauda, campo_prox, slot)
+        self._escrever_i32(off_cauda, slot)
+
+    def _lista_remover(self, off_cabeca: int, off_cauda: int, slot: int,
+                       campo_prox: int = _OFF_SLOT_PROX, campo_ant: int = _OFF_SLOT_ANT):
+        """Retira o slot da lista em O(1)"""
+        prox = self._ler_i32_slot(slot, campo_prox)
+        ant = self._ler_i32_slot(slot, campo_ant)
+        if ant == _NENHUM:
+            self._escrever_i32(off_cabeca, prox)
+        else:
+            self._escrever_i32_slot(ant, campo_prox, prox)
+        if prox == _NENHUM:
+            self._escrever_i32(off_cauda, ant)
+        else:
+            self._escrever_i32_slot(prox, campo_ant, ant)
+        self._escrever_i32_slot(slot, campo_prox, _NENHUM)
+        self._escrever_i32_slot(slot, campo_ant, _NENHUM)
+
+    # --- Heap binário de despacho (políticas PRIORIDADE e EDF) ---
+
+    def _local_heap(self, posicao: int):
+        return self._bufs[posicao >> self._bits_segmento], \
+            self._inicio_heap + (posicao & self._mascara_segmento) * _ENTRADA_HEAP.size
+
+    def _heap_slot(self, posicao: int) -> int:
+        buf, offset = self._local_heap(posicao)
+        return _ENTRADA_HEAP.unpack_from(buf, offset)[0]
+
+    def _heap_colocar(self, posicao: int, slot: int):
+        buf, offset = self._local_heap(posicao)
+        _ENTRADA_HEAP.pack_into(buf, offset, slot)
+        self._escrever_i32_slot(slot, _OFF_SLOT_POS_HEAP, posicao)
+
+    def _chave_heap(self, slot: int, politica: int) -> tuple:
+        """Chave de ordenação do slot (menor sai primeiro); empate pela chegada"""
+        buf, offset = self._local(slot)
+        timestamp = _F64.unpack_from(buf, offset + _OFF_SLOT_TIMESTAMP)[0]
+        if politica == _POL_PRIORIDADE:
+            return (-_I32.unpack_from(buf, offset + _OFF_SLOT_PRIORIDADE)[0], timestamp)
+        deadline = _F64.unpack_from(buf, offset + _OFF_SLOT_DEADLINE)[0]
+        if deadline <= 0 or buf[offset + _OFF_SLOT_ATRASADO]:
+            return (1, timestamp)
+        return (0, deadline)
+
+    def _heap_subir(self, posicao: int, politica: int):
+        slot = self._heap_slot(posicao)
+        chave = self._chave_heap(slot, politica)
+        while posicao > 0:
+            pai = (posicao - 1) >> 1
+            slot_pai = self._heap_slot(pai)
+            if self._chave_heap(slot_pai, politica) <= chave:
+                break
+            self._heap_colocar(posicao, slot_pai)
+            posicao = pai
+        self._heap_colocar(posicao, slot)
+
+    def _heap_descer(self, posicao: int, politica: int):
+        tamanho = self._ler_u32(_OFF_TAMANHO_HEAP)
+        slot = self._heap_slot(posicao)
+        chave = self._chave_heap(slot, politica)
+        while True:
+            filho = 2 * posicao + 1
+            if filho >= tamanho:
+                break
+            slot_filho = self._heap_slot(filho)
+            chave_filho = self._chave_heap(slot_filho, politica)
+            if filho + 1 < tamanho:
+                slot_direito = self._heap_slot(filho + 1)
+                chave_direito = self._chave_heap(slot_direito, politica)
+                if chave_direito < chave_filho:
+                    filho, slot_filho, chave_filho = filho + 1, slot_direito, chave_direito
+            if chave <= chave_filho:
+                break
+            self._heap_colocar(posicao, slot_filho)
+            posicao = filho
+        self._heap_colocar(posicao, slot)
+
+    def _heap_inserir(self, slot: int, politica: int):
+        tamanho = self._ler_u32(_OFF_TAMANHO_HEAP)
+        self._escrever_u32(_OFF_TAMANHO_HEAP, tamanho + 1)
+        self._heap_colocar(tamanho, slot)
+        self._heap_subir(tamanho, politica)
+
+    def _heap_remover(self, slot: int):
+        """Retira o slot do heap (se estiver nele) em O(log n)"""
+        posicao = self._ler_i32_slot(slot, _OFF_SLOT_POS_HEAP)
+        if posicao < 0:
+            return
+        self._escrever_i32_slot(slot, _OFF_SLOT_POS_HEAP, _NENHUM)
+        ultima = self._ler_u32(_OFF_TAMANHO_HEAP) - 1
+        self._escrever_u32(_OFF_TAMANHO_HEAP, ultima)
+        if posicao == ultima:
+            return
+
+        politica = self._ler_u32(_OFF_POLITICA)
+        substituto = self._heap_slot(ultima)
+        self._heap_colocar(posicao, substituto)
+        self._heap_subir(posicao, politica)
+        self._heap_descer(self._ler_i32_slot(substituto, _OFF_SLOT_POS_HEAP), politica)
 
-            # Limitar pedidos se necessário
-            if len(json_bytes) > self.BUFFER_SIZE - 100:
-                if len(data.get('pedidos', [])) > 50:
-                    data['pedidos'] = data['pedidos'][-50:]
-                json_str = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
-                json_bytes = json_str.encode('utf-8')
+    def _proximo_pendente_unsafe(self) -> int:
+        """Slot do próximo pendente segundo a política de despacho; -1 se não houver"""
+        politica = self._ler_u32(_OFF_POLITICA)
+        if politica == _POL_FIFO:
+            return self._ler_i32(_OFF_PENDENTES_CABECA)
+        if self._ler_u32(_OFF_TAMANHO_HEAP) == 0:
+            return _NENHUM
 
-            # Escrever tamanho (4 bytes) + dados
-            size_bytes = struct.pack('I', len(json_bytes))
+        if politica == _POL_EDF:
+            # Prazo já perdido: rebaixar em vez de atrasar quem ainda pode ser atendido
+            agora = time.time()
+            while True:
+                slot = self._heap_slot(0)
+                buf, offset = self._local(slot)
+                deadline = _F64.unpack_from(buf, offset + _OFF_SLOT_DEADLINE)[0]
+                if deadline <= 0 or buf[offset + _OFF_SLOT_ATRASADO] or deadline >= agora:
+                    break
+                buf[offset + _OFF_SLOT_ATRASADO] = 1
+                self._heap_descer(0, politica)
+        return self._heap_slot(0)
 
-            # Limpar área
-            total_size = 4 + len(json_bytes)
-            for i in range(total_size):
-                self.shm.buf[i] = 0
+    # --- Leases: tabela de batimentos e roda de temporização ---
 
-            # Escrever tamanho
-            for i in range(4):
-                self.shm.buf[i] = size_bytes[i]
+    def _esvaziar_roda_unsafe(self):
+        for casa in range(CASAS_RODA):
+            self._escrever_i32(_OFF_RODA + casa * 4, _NENHUM)
 
-            # Escrever dados
-            for i, byte in enumerate(json_bytes):
-                self.shm.buf[4 + i] = byte
+    def _offset_trabalhador(self, indice: int) -> int:
+        return _OFF_TRABALHADORES + indice * _ENTRADA_TRABALHADOR.size
 
+    def _entrada_trabalhador_unsafe(self, consumidor_id: int) -> int:
+        """Entrada do consumidor na tabela de batimentos, registrando-o se preciso; -1 se cheia"""
+        meu_pid = os.getpid()
+        indice = self._trabalhadores.get(consumidor_id)
+        if indice is not None:
+            cid, pid = _ENTRADA_TRABALHADOR.unpack_from(self.buf, self._offset_trabalhador(indice))[:2]
+            if pid == meu_pid and cid == consumidor_id:
+                return indice
+
+        agora = time.time()
+        livre = mais_antigo = anterior = -1
+        batimento_mais_antigo = float('inf')
+        for indice in range(MAX_TRABALHADORES):
+            cid, pid, batimento = _ENTRADA_TRABALHADOR.unpack_from(self.buf, self._offset_trabalhador(indice))[:3]
+            if pid == 0:
+                if livre < 0:
+                    livre = indice
+            elif cid == consumidor_id:
+                if pid == meu_pid:
+                    self._trabalhadores[consumidor_id] = indice
+                    return indice
+                # Id reaproveitado: a entrada de um processo anterior com o mesmo id
+                anterior = indice
+            elif batimento < batimento_mais_antigo:
+                mais_antigo, batimento_mais_antigo = indice, batimento
+        if anterior >= 0:
+            livre = anterior
+        elif livre < 0:
+            # Tabela cheia: reaproveitar a entrada de quem parou de bater há mais tempo
+            duracao = _F64.unpack_from(self.buf, _OFF_DURACAO_LEASE)[0]
+            if mais_antigo < 0 or batimento_mais_antigo + duracao > agora:
+                return -1
+            livre = mais_antigo
+        _ENTRADA_TRABALHADOR.pack_into(self.buf, self._offset_trabalhador(livre), consumidor_id, meu_pid, agora,
+                                       0, self._ler_u64(_OFF_EPOCA_DRENAGEM) & 0xFFFFFFFF)
+        self._trabalhadores[consumidor_id] = livre
+        return livre
+
+    def _liberar_trabalhadores(self):
+        """Libera as entradas que este processo registrou na tabela de batimentos"""
+        try:
+            with self.lock:
+                for consumidor_id, indice in self._trabalhadores.items():
+                    offset = self._offset_trabalhador(indice)
+                    cid, pid = _ENTRADA_TRABALHADOR.unpack_from(self.buf, offset)[:2]
+                    if cid == consumidor_id and pid == os.getpid():
+                        _ENTRADA_TRABALHADOR.pack_into(self.buf, offset, 0, 0, 0.0, 0, 0)
         except Exception as e:
-            print(f"Erro ao escrever: {e}")
-            raise
+            print(f"Erro ao liberar consumidores: {e}")
+        self._trabalhadores = {}
+
+    def _validade_batimento(self, slot: int) -> float:
+        """Até quando o lease do slot pode ser renovado pelo último batimento do dono (0 = não pode)"""
+        buf, offset = self._local(slot)
+        indice = _I32.unpack_from(buf, offset + _OFF_SLOT_TRABALHADOR)[0]
+        if indice < 0:
+            return 0.0
+        cid, pid, batimento = _ENTRADA_TRABALHADOR.unpack_from(self.buf, self._offset_trabalhador(indice))[:3]
+        # Entrada reaproveitada por outro consumidor: o dono do pedido parou de bater
+        if pid == 0 or cid != _I32.unpack_from(buf, offset + _OFF_SLOT_CONSUMIDOR)[0]:
+            return 0.0
+        return batimento + _F64.unpack_from(self.buf, _OFF_DURACAO_LEASE)[0]
+
+    def _roda_inserir(self, slot: int, vencimento: float):
+        """Coloca o slot na casa do tique em que o lease vence (no máximo uma volta à frente)"""
+        cursor = self._ler_u64(_OFF_CURSOR_RODA)
+        tique = min(max(int(vencimento / RESOLUCAO_RODA) + 1, cursor + 1), cursor + CASAS_RODA)
+        casa = tique % CASAS_RODA
+        cabeca = self._ler_i32(_OFF_RODA + casa * 4)
+        buf, offset = self._local(slot)
+        _F64.pack_into(buf, offset + _OFF_SLOT_LEASE, vencimento)
+        _I32.pack_into(buf, offset + _OFF_SLOT_WPROX, cabeca)
+        _I32.pack_into(buf, offset + _OFF_SLOT_WANT, _NENHUM)
+        _I32.pack_into(buf, offset + _OFF_SLOT_CASA, casa)
+        if cabeca != _NENHUM:
+            self._escrever_i32_slot(cabeca, _OFF_SLOT_WANT, slot)
+        self._escrever_i32(_OFF_RODA + casa * 4, slot)
+
+    def _roda_remover(self, slot: int):
+        """Retira o slot da roda (se estiver nela) em O(1)"""
+        buf, offset = self._local(slot)
+        casa = _I32.unpack_from(buf, offset + _OFF_SLOT_CASA)[0]
+        if casa < 0:
+            return
+        prox = _I32.unpack_from(buf, offset + _OFF_SLOT_WPROX)[0]
+        ant = _I32.unpack_from(buf, offset + _OFF_SLOT_WANT)[0]
+        if ant == _NENHUM:
+            self._escrever_i32(_OFF_RODA + casa * 4, prox)
+        else:
+            self._escrever_i32_slot(ant, _OFF_SLOT_WPROX, prox)
+        if prox != _NENHUM:
+            self._escrever_i32_slot(prox, _OFF_SLOT_WANT, ant)
+        for campo in (_OFF_SLOT_WPROX, _OFF_SLOT_WANT, _OFF_SLOT_CASA):
+            _I32.pack_into(buf, offset + campo, _NENHUM)
+
+    def _roda_atrasada(self) -> bool:
+        """Há casas vencidas desde a última passagem (leitura sem lock)"""
+        return int(time.time() / RESOLUCAO_RODA) > self._ler_u64(_OFF_CURSOR_RODA)
+
+    def _recuperar_expirados_unsafe(self) -> int:
+        """Visita as casas vencidas da roda; retorna quantos pedidos voltaram à fila
+
+        O lease de um consumidor que ainda bate é renovado; o pedido de quem
+        parou volta a ser pendente, sem consumidor.
+        """
+        agora = time.time()
+        atual = int(agora / RESOLUCAO_RODA)
+        cursor = self._ler_u64(_OFF_CURSOR_RODA)
+        if atual <= cursor:
+            return 0
+        # Avançar antes: leases renovados vão para casas à frente de `atual`
+        self._escrever_u64(_OFF_CURSOR_RODA, atual)
+
+        recuperados = 0
+        for tique in range(max(cursor + 1, atual - CASAS_RODA + 1), atual + 1):
+            off_casa = _OFF_RODA + (tique % CASAS_RODA) * 4
+            slot = self._ler_i32(off_casa)
+            self._escrever_i32(off_casa, _NENHUM)
+            while slot != _NENHUM:
+                buf, offset = self._local(slot)
+                prox = _I32.unpack_from(buf, offset + _OFF_SLOT_WPROX)[0]
+                for campo in (_OFF_SLOT_WPROX, _OFF_SLOT_WANT, _OFF_SLOT_CASA):
+                    _I32.pack_into(buf, offset + campo, _NENHUM)
+
+                vencimento = _F64.unpack_from(buf, offset + _OFF_SLOT_LEASE)[0]
+                if vencimento <= agora:
+                    vencimento = self._validade_batimento(slot)
+                if vencimento > agora:
+                    self._roda_inserir(slot, vencimento)
+                else:
+                    _I32.pack_into(buf, offset + _OFF_SLOT_CONSUMIDOR, -1)
+                    self._transicionar_unsafe(slot, _COD_PENDENTE)
+                    recuperados += 1
+                slot = prox
+
+        if recuperados:
+            self._escrever_u64(_OFF_RECUPERADOS, self._ler_u64(_OFF_RECUPERADOS) + recuperados)
+        return recuperados
+
+    # --- Tabela de itens e listas de pendentes por item ---
+
+    def _offset_item(self, indice: int) -> int:
+        return _OFF_ITENS + indice * _ENTRADA_ITEM.size
+
+    def _indice_item_unsafe(self, dados: bytes) -> int:
+        """Entrada do item na tabela, registrando-o se preciso; -1 se a tabela estiver cheia"""
+        if not dados:
+            return -1
+        nome = dados.ljust(ITEM_MAX_BYTES, b'\0')
+        indice = self._itens.get(dados)
+        if indice is not None and bytes(self.buf[self._offset_item(indice):
+                                                 self._offset_item(indice) + ITEM_MAX_BYTES]) == nome:
+            return indice
+        for indice in range(MAX_ITENS):
+            offset = self._offset_item(indice)
+            atual = bytes(self.buf[offset:offset + ITEM_MAX_BYTES])
+            if atual == nome:
+                break
+            if not any(atual):
+                _ENTRADA_ITEM.pack_into(self.buf, offset, dados, _NENHUM, _NENHUM, 0)
+                break
+        else:
+            return -1
+        self._itens[dados] = indice
+        return indice
+
+    def _item_pendentes_unsafe(self, slot: int, novo: int, anterior: int):
+        """Mantém a lista de pendentes do item do slot ao entrar ou sair de PENDENTE"""
+        indice = self._ler_i32_slot(slot, _OFF_SLOT_ITEM)
+        if indice < 0:
+            return
+        offset = self._offset_item(indice)
+        if anterior == _COD_PENDENTE:
+            self._lista_remover(offset + _OFF_ITEM_CABECA, offset + _OFF_ITEM_CAUDA, slot,
+                                _OFF_SLOT_IPROX, _OFF_SLOT_IANT)
+            self._escrever_u32(offset + _OFF_ITEM_PENDENTES, self._ler_u32(offset + _OFF_ITEM_PENDENTES) - 1)
+        elif novo == _COD_PENDENTE:
+            self._lista_anexar(offset + _OFF_ITEM_CABECA, offset + _OFF_ITEM_CAUDA, slot,
+                               _OFF_SLOT_IPROX, _OFF_SLOT_IANT)
+            self._escrever_u32(offset + _OFF_ITEM_PENDENTES, self._ler_u32(offset + _OFF_ITEM_PENDENTES) + 1)
+
+    def _item_do_lote_unsafe(self, cabeca: int, espera_max: Optional[float]) -> int:
+        """Item a preparar em lote, a partir do próximo pendente pela política"""
+        item = self._ler_i32_slot(cabeca, _OFF_SLOT_ITEM)
+        if item < 0 or self._ler_u32(_OFF_POLITICA) != _POL_FIFO:
+            return item
+        buf, offset = self._local(cabeca)
+        if espera_max is not None:
+            idade = time.time() - _F64.unpack_from(buf, offset + _OFF_SLOT_TIMESTAMP)[0]
+            if idade >= espera_max:
+                return item
+        # O mais antigo ainda pode esperar: o item com mais pendentes rende o maior lote
+        maior = self._ler_u32(self._offset_item(item) + _OFF_ITEM_PENDENTES)
+        for indice in range(MAX_ITENS):
+            pendentes = self._ler_u32(self._offset_item(indice) + _OFF_ITEM_PENDENTES)
+            if pendentes > maior:
+                item, maior = indice, pendentes
+        return item
+
+    def _retirar_lote_item_unsafe(self, consumidor_id: int, n: int, espera_max: Optional[float],
+                                  retirados: List[Pedido]) -> List[Pedido]:
+        """Retira até n pendentes do mesmo item para ``retirados`` (uso interno)
+
+        Cada pedido entra na lista assim que é marcado em preparo: se algo
+        falhar no meio, quem chamou ainda sabe quais já são seus.
+        """
+        cabeca = self._proximo_pendente_unsafe()
+        if cabeca == _NENHUM:
+            return retirados
+        item = self._item_do_lote_unsafe(cabeca, espera_max)
+        if item == self._ler_i32_slot(cabeca, _OFF_SLOT_ITEM):
+            # O próximo pela política vai no lote, mesmo fora da ordem de chegada do item
+            self._atualizar_slot_unsafe(cabeca, _COD_EM_PREPARO, consumidor_id)
+            retirados.append(self._ler_slot(cabeca))
+        if item < 0:
+            return retirados
+
+        off_cabeca = self._offset_item(item) + _OFF_ITEM_CABECA
+        while len(retirados) < n:
+            slot = self._ler_i32(off_cabeca)
+            if slot == _NENHUM:
+                break
+            self._atualizar_slot_unsafe(slot, _COD_EM_PREPARO, consumidor_id)
+            retirados.append(self._ler_slot(slot))
+        return retirados
+
+    # --- Tabela hash id -> slot ---
+
+    def _hash_buscar(self, pedido_id: int) -> int:
+        """Índice da entrada do id na tabela; -1 se ausente"""
+        mascara = self.capacidade_hash - 1
+        indice = _hash_id(pedido_id) & mascara
+        while True:
+            entrada_id, slot_mais_um = _ENTRADA_HASH.unpack_from(self._buf_hash, self._offset_hash(indice))
+            if slot_mais_um == 0:
+                return -1
+            if entrada_id == pedido_id:
+                return indice
+            indice = (indice + 1) & mascara
 
-    def _read_data_unsafe(self) -> dict:
-        """Lê dados SEM lock (uso interno)"""
+    def _hash_inserir(self, pedido_id: int, slot: int):
+        mascara = self.capacidade_hash - 1
+        indice = _hash_id(pedido_id) & mascara
+        while _ENTRADA_HASH.unpack_from(self._buf_hash, self._offset_hash(indice))[1] != 0:
+            indice = (indice + 1) & mascara
+        _ENTRADA_HASH.pack_into(self._buf_hash, self._offset_hash(indice), pedido_id, slot + 1)
+
+    def _hash_remover(self, pedido_id: int, slot: int):
+        """Remove a entrada (id, slot) com deslocamento reverso, sem lápides"""
+        mascara = self.capacidade_hash - 1
+        indice = _hash_id(pedido_id) & mascara
+        while True:
+            entrada_id, slot_mais_um = _ENTRADA_HASH.unpack_from(self._buf_hash, self._offset_hash(indice))
+            if slot_mais_um == 0:
+                return
+            if entrada_id == pedido_id and slot_mais_um == slot + 1:
+                break
+            indice = (indice + 1) & mascara
+
+        livre = indice
+        while True:
+            indice = (indice + 1) & mascara
+            entrada_id, slot_mais_um = _ENTRADA_HASH.unpack_from(self._buf_hash, self._offset_hash(indice))
+            if slot_mais_um == 0:
+                break
+            ideal = _hash_id(entrada_id) & mascara
+            # A entrada só pode voltar para `livre` se isso não a colocar antes da posição ideal
+            if (indice - ideal) & mascara >= (indice - livre) & mascara:
+                _ENTRADA_HASH.pack_into(self._buf_hash, self._offset_hash(livre), entrada_id, slot_mais_um)
+                livre = indice
+        _ENTRADA_HASH.pack_into(self._buf_hash, self._offset_hash(livre), 0, 0)
+
+    def _localizar_unsafe(self, pedido_id: int) -> int:
+        """Slot onde está o pedido; -1 se não residente"""
+        indice = self._hash_buscar(pedido_id)
+        if indice < 0:
+            return -1
+        return _ENTRADA_HASH.unpack_from(self._buf_hash, self._offset_hash(indice))[1] - 1
+
+    # --- Transições de status e alocação ---
+
+    def _transicionar_unsafe(self, slot: int, novo: int):
+        """Move o slot entre listas/contadores conforme o novo status (uso interno)"""
+        buf, offset = self._local(slot)
+        anterior = buf[offset + _OFF_SLOT_STATUS]
+        if anterior == novo:
+            return
+
+        if anterior in _LISTAS_STATUS:
+            off_cabeca, off_cauda, off_contador = _LISTAS_STATUS[anterior]
+            self._lista_remover(off_cabeca, off_cauda, slot)
+            self._escrever_u64(off_contador, self._ler_u64(off_contador) - 1)
+            if anterior == _COD_PENDENTE:
+                self._heap_remover(slot)
+                self._item_pendentes_unsafe(slot, novo, anterior)
+            else:
+                self._roda_remover(slot)
+        if novo in _LISTAS_STATUS:
+            off_cabeca, off_cauda, off_contador = _LISTAS_STATUS[novo]
+            self._lista_anexar(off_cabeca, off_cauda, slot)
+            self._escrever_u64(off_contador, self._ler_u64(off_contador) + 1)
+            politica = self._ler_u32(_OFF_POLITICA)
+            if novo == _COD_PENDENTE and politica != _POL_FIFO:
+                self._heap_inserir(slot, politica)
+            if novo == _COD_PENDENTE:
+                self._item_pendentes_unsafe(slot, novo, anterior)
+
+        # Instantes do ciclo de vida e histogramas de latência
+        if novo == _COD_PENDENTE:
+            _F64.pack_into(buf, offset + _OFF_SLOT_RETIRADO, 0.0)
+            _F64.pack_into(buf, offset + _OFF_SLOT_CONCLUIDO, 0.0)
+        elif novo == _COD_EM_PREPARO:
+            agora = time.time()
+            _F64.pack_into(buf, offset + _OFF_SLOT_RETIRADO, agora)
+            self._registrar_latencia_unsafe(
+                _HIST_ESPERA, agora - _F64.unpack_from(buf, offset + _OFF_SLOT_TIMESTAMP)[0])
+
+            # Lease do consumidor; retirar também conta como batimento e o marca ocupado
+            consumidor_id = _I32.unpack_from(buf, offset + _OFF_SLOT_CONSUMIDOR)[0]
+            indice = self._entrada_trabalhador_unsafe(consumidor_id) if consumidor_id >= 0 else -1
+            if indice >= 0:
+                _F64.pack_into(self.buf, self._offset_trabalhador(indice) + _OFF_TRABALHADOR_BATIMENTO, agora)
+                _U32.pack_into(self.buf, self._offset_trabalhador(indice) + _OFF_TRABALHADOR_OCUPADO, 1)
+            _I32.pack_into(buf, offset + _OFF_SLOT_TRABALHADOR, indice)
+            self._roda_inserir(slot, agora + _F64.unpack_from(self.buf, _OFF_DURACAO_LEASE)[0])
+        elif novo == _COD_CONCLUIDO:
+            agora = time.time()
+            _F64.pack_into(buf, offset + _OFF_SLOT_CONCLUIDO, agora)
+            retirado_em = _F64.unpack_from(buf, offset + _OFF_SLOT_RETIRADO)[0]
+            if retirado_em > 0:
+                self._registrar_latencia_unsafe(_HIST_PREPARO, agora - retirado_em)
+            self._registrar_latencia_unsafe(
+                _HIST_TOTAL, agora - _F64.unpack_from(buf, offset + _OFF_SLOT_TIMESTAMP)[0])
+
+            self._escrever_u64(_OFF_TOTAL_PROCESSADOS, self._ler_u64(_OFF_TOTAL_PROCESSADOS) + 1)
+            deadline = _F64.unpack_from(buf, offset + _OFF_SLOT_DEADLINE)[0]
+            if deadline > 0:
+                self._escrever_u64(_OFF_CONCLUIDOS_COM_PRAZO, self._ler_u64(_OFF_CONCLUIDOS_COM_PRAZO) + 1)
+                if agora > deadline:
+                    self._escrever_u64(_OFF_PRAZOS_PERDIDOS, self._ler_u64(_OFF_PRAZOS_PERDIDOS) + 1)
+
+        buf[offset + _OFF_SLOT_STATUS] = novo
+        self._registrar_mudanca_unsafe(buf, offset, anterior)
+        if novo == _STATUS_VAZIO:
+            self._liberar_slot_unsafe(slot)
+        elif novo == _COD_CONCLUIDO:
+            self._arquivar_unsafe(slot)
+
+    def _registrar_mudanca_unsafe(self, buf, offset: int, anterior: int):
+        """Anexa ao anel de mudanças o estado atual do slot (uso interno)"""
+        pedido_id, mesa, timestamp, status, produtor_id, consumidor_id, item = _SLOT_PREFIXO.unpack_from(buf, offset)
+        seq = self._ler_u64(_OFF_MUDANCAS_SEQ)
+        _ENTRADA_MUDANCA.pack_into(self.buf, _OFF_ANEL_MUDANCAS + (seq % CAPACIDADE_MUDANCAS) * _ENTRADA_MUDANCA.size,
+                                   seq, pedido_id, timestamp, mesa, produtor_id, consumidor_id, status, anterior, item)
+        self._escrever_u64(_OFF_MUDANCAS_SEQ, seq + 1)
+
+    def _registrar_latencia_unsafe(self, histograma: int, segundos: float):
+        """Soma uma duração ao histograma em O(1) (uso interno)"""
+        valor = max(0, int(segundos * 1e6))
+        base = _OFF_HISTOGRAMAS + histograma * _TAMANHO_HISTOGRAMA
+        amostras, soma, maximo = _HISTOGRAMA.unpack_from(self.buf, base)
+        _HISTOGRAMA.pack_into(self.buf, base, amostras + 1, soma + valor, max(maximo, valor))
+        offset = base + _HISTOGRAMA.size + _indice_balde(valor) * _U64.size
+        _U64.pack_into(self.buf, offset, _U64.unpack_from(self.buf, offset)[0] + 1)
+
+    def _atualizar_slot_unsafe(self, slot: int, status: Optional[int] = None,
+                               consumidor_id: Optional[int] = None,
+                               timestamp: Optional[float] = None):
+        """Grava campos de um slot no lugar, mantendo índices e contadores (uso interno)"""
+        buf, offset = self._local(slot)
+        if consumidor_id is not None:
+            _I32.pack_into(buf, offset + _OFF_SLOT_CONSUMIDOR, consumidor_id)
+        if timestamp is not None:
+            _F64.pack_into(buf, offset + _OFF_SLOT_TIMESTAMP, timestamp)
+        # Por último: concluir pode arquivar e liberar o slot
+        if status is not None:
+            self._transicionar_unsafe(slot, status)
+
+    def _liberar_slot_unsafe(self, slot: int):
+        """Tira o slot do histórico e do hash e o devolve à pilha de livres"""
+        self._hash_remover(self._id_slot(slot), slot)
+        self._lista_remover(_OFF_HISTORICO_CABECA, _OFF_HISTORICO_CAUDA, slot,
+                            _OFF_SLOT_HPROX, _OFF_SLOT_HANT)
+        buf, offset = self._local(slot)
+        buf[offset + _OFF_SLOT_STATUS] = _STATUS_VAZIO
+        _I32.pack_into(buf, offset + _OFF_SLOT_PROX, self._ler_i32(_OFF_LIVRES_CABECA))
+        self._escrever_i32(_OFF_LIVRES_CABECA, slot)
+        self._escrever_u64(_OFF_OCUPADOS, self._ler_u64(_OFF_OCUPADOS) - 1)
+
+    def _arquivar_unsafe(self, slot: int) -> bool:
+        """Grava o pedido concluído no arquivo em disco e libera o slot
+
+        Se a gravação falhar, o pedido continua na arena como concluído (e
+        conta em 'falhas_arquivo'); _despejar_concluido_unsafe tenta de novo.
+        """
+        pedido = self._ler_slot(slot)
         try:
-            # Ler tamanho
-            size_bytes = bytes(self.shm.buf[0:4])
-            data_size = struct.unpack('I', size_bytes)[0]
+            arquivado = self.arquivo.anexar(pedido.id, pedido.mesa, pedido.item, pedido.timestamp,
+                                            pedido.produtor_id, pedido.consumidor_id, pedido.concluido_em,
+                                            pedido.prioridade, pedido.deadline, pedido.retirado_em)
+            motivo = "dicionário de itens do arquivo cheio"
+        except (OSError, ValueError) as e:
+            arquivado, motivo = False, e
+        if not arquivado:
+            self._escrever_u64(_OFF_FALHAS_ARQUIVO, self._ler_u64(_OFF_FALHAS_ARQUIVO) + 1)
+            print(f"Erro ao arquivar pedido {pedido.id} (mantido na arena): {motivo}")
+            return False
+        self._liberar_slot_unsafe(slot)
+        return True
 
-            if data_size == 0 or data_size > self.BUFFER_SIZE:
-                return {'pedidos': [], 'stats': {
-                    'total_criados': 0, 'total_processados': 0, 'em_fila': 0
-                }}
+    def _despejar_concluido_unsafe(self) -> bool:
+        """Arquiva e libera o concluído mais antigo que ficou na arena; False se não houver ou falhar
 
-            # Ler JSON
-            data_bytes = bytes(self.shm.buf[4:4+data_size])
-            json_str = data_bytes.decode('utf-8')
-            return json.loads(json_str)
+        Só ficam concluídos no histórico os que não puderam ser arquivados:
+        nenhum é liberado sem antes ir para o arquivo.
+        """
+        slot = self._ler_i32(_OFF_HISTORICO_CABECA)
+        while slot != _NENHUM:
+            if self._status_slot(slot) == _COD_CONCLUIDO:
+                return self._arquivar_unsafe(slot)
+            slot = self._ler_i32_slot(slot, _OFF_SLOT_HPROX)
+        return False
 
-        except:
-            return {'pedidos': [], 'stats': {
-                'total_criados': 0, 'total_processados': 0, 'em_fila': 0
-            }}
+    def _alocar_slot_unsafe(self) -> int:
+        """Retira um slot da pilha de livres, crescendo a arena se preciso; -1 se cheia"""
+        em_andamento = self._ler_u64(_OFF_EM_FILA) + self._ler_u64(_OFF_EM_PREPARO)
+        if em_andamento + 1 > self.capacidade * self.LIMIAR_CRESCIMENTO:
+            self._crescer_unsafe()
+
+        slot = self._ler_i32(_OFF_LIVRES_CABECA)
+        if slot == _NENHUM:
+            if not self._crescer_unsafe() and not self._despejar_concluido_unsafe():
+                return -1
+            slot = self._ler_i32(_OFF_LIVRES_CABECA)
+
+        self._escrever_i32(_OFF_LIVRES_CABECA, self._ler_i32_slot(slot, _OFF_SLOT_PROX))
+        self._escrever_u64(_OFF_OCUPADOS, self._ler_u64(_OFF_OCUPADOS) + 1)
+        return slot
+
+    @staticmethod
+    def _estatisticas_de(cabecalho) -> dict:
+        return {
+            'total_criados': _U64.unpack_from(cabecalho, _OFF_TOTAL_CRIADOS)[0],
+            'total_processados': _U64.unpack_from(cabecalho, _OFF_TOTAL_PROCESSADOS)[0],
+            'em_fila': _U64.unpack_from(cabecalho, _OFF_EM_FILA)[0],
+            'em_preparo': _U64.unpack_from(cabecalho, _OFF_EM_PREPARO)[0],
+            'prazos_perdidos': _U64.unpack_from(cabecalho, _OFF_PRAZOS_PERDIDOS)[0],
+            'concluidos_com_prazo': _U64.unpack_from(cabecalho, _OFF_CONCLUIDOS_COM_PRAZO)[0],
+            'pedidos_recuperados': _U64.unpack_from(cabecalho, _OFF_RECUPERADOS)[0],
+            'falhas_arquivo': _U64.unpack_from(cabecalho, _OFF_FALHAS_ARQUIVO)[0]
+        }
+
+    @staticmethod
+    def _pedido_arquivado(registro: RegistroArquivado) -> Pedido:
+        return Pedido(registro.id, registro.mesa, registro.item, registro.timestamp,
+                      PedidoStatus.CONCLUIDO.value, registro.produtor_id, registro.consumidor_id,
+                      registro.prioridade, registro.deadline, registro.retirado_em, registro.concluido_em)
+
+    def _mesclar_arquivados(self, ativos: List[Pedido], recentes: Optional[int]) -> List[Pedido]:
+        """Junta os pedidos da arena aos concluídos do arquivo, em ordem de chegada
+
+        Deve ser chamado depois de copiar a arena: um pedido concluído entre as
+        duas leituras aparece nas duas e prevalece a versão da arena, que é a
+        mesma das estatísticas copiadas junto.
+        """
+        total = len(self.arquivo)
+        inicio = 0 if recentes is None else max(0, total - recentes)
+        ids_ativos = {pedido.id for pedido in ativos}
+        pedidos = [self._pedido_arquivado(registro) for registro in self.arquivo.ler(inicio, total)
+                   if registro.id not in ids_ativos]
+        pedidos.extend(ativos)
+        pedidos.sort(key=lambda pedido: pedido.timestamp)
+        return pedidos
+
+    def _pedidos_de(self, cabecalho, blocos) -> List[Pedido]:
+        """Percorre o histórico (ordem de chegada) em uma cópia da arena"""
+        pedidos = []
+        slot = _I32.unpack_from(cabecalho, _OFF_HISTORICO_CABECA)[0]
+        while slot != _NENHUM:
+            pedidos.append(self._ler_slot(slot, blocos))
+            slot = self._ler_i32_slot(slot, _OFF_SLOT_HPROX, blocos)
+        return pedidos
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def _adicionar_unsafe(self, pedido: Pedido) -> bool:
+        slot = self._alocar_slot_unsafe()
+        if slot < 0:
+            print(f"Erro ao adicionar pedido: fila cheia ({self.capacidade} pedidos ativos)")
+            return False
+
+        self._escrever_slot(slot, pedido, _STATUS_VAZIO)
+        self._escrever_i32_slot(slot, _OFF_SLOT_ITEM, self._indice_item_unsafe(_codificar_item(pedido.item)))
+        self._lista_anexar(_OFF_HISTORICO_CABECA, _OFF_HISTORICO_CAUDA, slot,
+                           _OFF_SLOT_HPROX, _OFF_SLOT_HANT)
+        self._hash_inserir(pedido.id, slot)
+        self._transicionar_unsafe(slot, _STATUS_PARA_CODIGO[pedido.status])
+        self._escrever_u64(_OFF_TOTAL_CRIADOS, self._ler_u64(_OFF_TOTAL_CRIADOS) + 1)
+        return True
 
     def adicionar_pedido(self, pedido: Pedido) -> bool:
         """Adiciona pedido (thread-safe)"""
-        for tentativa in range(3):
-            try:
-                with self.lock:
-                    data = self._read_data_unsafe()
-                    data['pedidos'].append(pedido.to_dict())
-                    data['stats']['total_criados'] += 1
-                    data['stats']['em_fila'] = len([p for p in data['pedidos']
-                                                    if p['status'] == PedidoStatus.PENDENTE.value])
-                    self._write_data_unsafe(data)
-                    return True
-            except Exception as e:
-                if tentativa < 2:
-                    time.sleep(0.1)
+        return self.adicionar_pedidos([pedido]) == 1
+
+    def adicionar_pedidos(self, pedidos: List[Pedido]) -> int:
+        """Adiciona vários pedidos em uma única seção crítica (thread-safe)
+
+        Retorna quantos foram adicionados; para no primeiro que não couber.
+        """
+        adicionados = 0
+        try:
+            with self._escrita():
+                for pedido in pedidos:
+                    if not self._adicionar_unsafe(pedido):
+                        break
+                    adicionados += 1
+        except Exception as e:
+            print(f"Erro ao adicionar pedido: {e}")
+
+        # Acordar consumidores bloqueados em aguardar_pedido
+        self.nao_vazio.liberar(adicionados)
+        return adicionados
+
+    def _retirar_pedidos(self, consumidor_id: int, n: int, mesmo_item: bool = False,
+                         espera_max: Optional[float] = None) -> List[Pedido]:
+        """Retira até n pendentes (do mesmo item, se pedido) sem mexer no semáforo (uso interno)"""
+        # Drenando ou parado: nenhum pedido novo sai da fila
+        if self.em_encerramento:
+            return []
+
+        retirados = []
+        recuperados = 0
+        try:
+            with self._escrita():
+                # Leases vencidos desde a última passagem voltam à fila antes da retirada
+                recuperados = self._recuperar_expirados_unsafe()
+                if mesmo_item:
+                    self._retirar_lote_item_unsafe(consumidor_id, n, espera_max, retirados)
                 else:
-                    print(f"Erro ao adicionar pedido: {e}")
-                    return False
-        return False
+                    while len(retirados) < n:
+                        slot = self._proximo_pendente_unsafe()
+                        if slot == _NENHUM:
+                            break
+                        self._atualizar_slot_unsafe(slot, _COD_EM_PREPARO, consumidor_id)
+                        retirados.append(self._ler_slot(slot))
+        except Exception as e:
+            # Os já marcados em preparo seguem para o consumidor, em vez de ficarem órfãos até o lease vencer
+            print(f"Erro ao retirar pedidos (consumidor {consumidor_id}, {len(retirados)} já retirados): {e}")
+        # Fichas dos recuperados: quem chamou desconta as dos pedidos que retirou
+        self.nao_vazio.liberar(recuperados)
+        return retirados
 
     def obter_proximo_pedido(self, consumidor_id: int):
-        """Obtém o próximo pedido pendente (thread-safe)"""
-        # ← NOVA VERIFICAÇÃO: Não pegar novos pedidos se em encerramento
-        if hasattr(self, 'em_encerramento') and self.em_encerramento:
-            return None
+        """Obtém o próximo pedido pendente (thread-safe, não bloqueante)"""
+        pedidos = self.obter_proximos_pedidos(consumidor_id, 1)
+        return pedidos[0] if pedidos else None
 
-        for tentativa in range(3):
-            try:
-                with self.lock:
-                    data = self._read_data_unsafe()
-                    for pedido_dict in data['pedidos']:
-                        if pedido_dict['status'] == PedidoStatus.PENDENTE.value:
-                            pedido_dict['status'] = PedidoStatus.EM_PREPARO.value
-                            pedido_dict['consumidor_id'] = consumidor_id
-                            self._write_data_unsafe(data)
-                            return Pedido.from_dict(pedido_dict)
-                    return None
-            except:
-                if tentativa < 2:
-                    time.sleep(0.1)
-        return None
+    def obter_proximos_pedidos(self, consumidor_id: int, n: int) -> List[Pedido]:
+        """Retira até n pedidos pendentes em uma única seção crítica (não bloqueante)"""
+        pedidos = self._retirar_pedidos(consumidor_id, n)
+        # Manter as fichas do semáforo próximas do número de pendentes
+        self.nao_vazio.tentar_adquirir(len(pedidos))
+        return pedidos
+
+    def aguardar_pedido(self, consumidor_id: int, timeout: Optional[float] = None):
+        """Obtém o próximo pedido, bloqueando até um chegar ou o timeout expirar"""
+        pedidos = self.aguardar_pedidos(consumidor_id, 1, timeout)
+        return pedidos[0] if pedidos else None
+
+    def aguardar_pedidos(self, consumidor_id: int, n: int,
+                         timeout: Optional[float] = None) -> List[Pedido]:
+        """Retira até n pedidos, bloqueando até haver ao menos um ou o timeout expirar"""
+        return self._aguardar(lambda: self._retirar_pedidos(consumidor_id, n), timeout)
+
+    def obter_lote_mesmo_item(self, consumidor_id: int, n: int,
+                              espera_max: Optional[float] = None) -> List[Pedido]:
+        """Retira até n pendentes do mesmo item em uma única seção crítica (não bloqueante)
+
+        ``espera_max`` (segundos) limita quanto o pendente mais antigo pode
+        ser preterido por um item com mais pedidos na fila (None = sem limite).
+        """
+        pedidos = self._retirar_pedidos(consumidor_id, n, True, espera_max)
+        self.nao_vazio.tentar_adquirir(len(pedidos))
+        return pedidos
+
+    def aguardar_lote_mesmo_item(self, consumidor_id: int, n: int, espera_max: Optional[float] = None,
+                                 timeout: Optional[float] = None) -> List[Pedido]:
+        """Como obter_lote_mesmo_item, bloqueando até haver ao menos um pendente ou o timeout expirar"""
+        return self._aguardar(lambda: self._retirar_pedidos(consumidor_id, n, True, espera_max), timeout)
+
+    def _aguardar(self, retirar, timeout: Optional[float]) -> List[Pedido]:
+        """Chama ``retirar`` até obter pedidos, esperando fichas do semáforo entre as tentativas"""
+        limite = None if timeout is None else time.monotonic() + timeout
+        ficha = False
+        while True:
+            pedidos = retirar()
+            if pedidos:
+                # A ficha que nos acordou já corresponde a um dos pedidos
+                self.nao_vazio.tentar_adquirir(len(pedidos) - 1 if ficha else len(pedidos))
+                return pedidos
+            if self.em_encerramento:
+                # Quem espera precisa ver a mudança de estado, não dormir até o timeout
+                return []
+
+            # Ficha sem pedido (cancelado ou retirado por outro): esperar de novo
+            restante = None if limite is None else limite - time.monotonic()
+            if restante is not None and restante <= 0:
+                return []
+            ficha = self.nao_vazio.adquirir(restante)
+            if not ficha:
+                return []
+
+    def obter_politica(self) -> PoliticaDespacho:
+        """Política de despacho em vigor"""
+        return _CODIGO_PARA_POLITICA[self._ler_u32(_OFF_POLITICA)]
+
+    def definir_politica(self, politica) -> bool:
+        """Troca a política de despacho, reconstruindo o heap dos pendentes (thread-safe)"""
+        codigo = _POLITICA_PARA_CODIGO[PoliticaDespacho(politica)]
+        try:
+            with self._escrita():
+                self._escrever_u32(_OFF_TAMANHO_HEAP, 0)
+                self._escrever_u32(_OFF_POLITICA, codigo)
+                slot = self._ler_i32(_OFF_PENDENTES_CABECA)
+                while slot != _NENHUM:
+                    self._escrever_i32_slot(slot, _OFF_SLOT_POS_HEAP, _NENHUM)
+                    if codigo != _POL_FIFO:
+                        self._heap_inserir(slot, codigo)
+                    slot = self._ler_i32_slot(slot, _OFF_SLOT_PROX)
+            return True
+        except Exception as e:
+            print(f"Erro ao definir política: {e}")
+            return False
+
+    def assinar(self, canal: Optional[CanalNotificacao] = None) -> CanalNotificacao:
+        """Registra um canal notificado após cada mutação (cria um novo se não for dado)
+
+        Lança OSError se a plataforma não tiver FIFOs e RuntimeError se a
+        tabela de assinantes estiver cheia.
+        """
+        novo = canal is None
+        if novo:
+            canal = CanalNotificacao()
+        try:
+            with self.lock:
+                for indice in range(MAX_ASSINANTES):
+                    offset = _OFF_ASSINANTES + indice * _ENTRADA_ASSINANTE.size
+                    if _ENTRADA_ASSINANTE.unpack_from(self.buf, offset)[1] == 0:
+                        _ENTRADA_ASSINANTE.pack_into(self.buf, offset, canal.pid, canal.token, 0)
+                        self._escrever_u32(_OFF_NUM_ASSINANTES, self._ler_u32(_OFF_NUM_ASSINANTES) + 1)
+                        break
+                else:
+                    raise RuntimeError(f"Limite de {MAX_ASSINANTES} assinantes atingido")
+        except:
+            if novo:
+                canal.cancelar()
+            raise
+        canal._registrar(self, indice)
+        return canal
+
+    # --- Bloco de controle: estado da execução e drenagem ---
+
+    def obter_estado(self) -> EstadoExecucao:
+        """Estado da execução visto por todos os processos (sem lock)"""
+        return _CODIGO_PARA_ESTADO.get(self._ler_u32(_OFF_ESTADO), EstadoExecucao.EXECUTANDO)
+
+    def obter_epoca_drenagem(self) -> int:
+        return self._ler_u64(_OFF_EPOCA_DRENAGEM)
+
+    def definir_estado(self, estado) -> bool:
+        """Muda o estado da execução (thread-safe); entrar em DRENANDO abre uma nova época
+
+        Fora de EXECUTANDO nenhum pedido é retirado, e os trabalhadores
+        bloqueados à espera de pedidos são acordados para ver o novo estado.
+        """
+        codigo = _ESTADO_PARA_CODIGO[EstadoExecucao(estado)]
+        try:
+            with self._escrita():
+                if codigo == _ESTADO_PARA_CODIGO[EstadoExecucao.DRENANDO] and \
+                        self._ler_u32(_OFF_ESTADO) != codigo:
+                    self._escrever_u64(_OFF_EPOCA_DRENAGEM, self._ler_u64(_OFF_EPOCA_DRENAGEM) + 1)
+                self._escrever_u32(_OFF_ESTADO, codigo)
+                registrados = sum(1 for indice in range(MAX_TRABALHADORES)
+                                  if _ENTRADA_TRABALHADOR.unpack_from(self.buf, self._offset_trabalhador(indice))[1])
+        except Exception as e:
+            print(f"Erro ao definir estado: {e}")
+            return False
+        if codigo != _EST_EXECUTANDO:
+            self.nao_vazio.liberar(registrados)
+        return True
+
+    @property
+    def em_encerramento(self) -> bool:
+        """Drenando ou parado (estado compartilhado entre todos os processos)"""
+        return self.buf is not None and self._ler_u32(_OFF_ESTADO) != _EST_EXECUTANDO
+
+    @em_encerramento.setter
+    def em_encerramento(self, valor: bool):
+        self.definir_estado(EstadoExecucao.DRENANDO if valor else EstadoExecucao.EXECUTANDO)
 
     def marcar_encerramento(self):
-        """Marca o sistema como em encerramento"""
-        self.em_encerramento = True
+        """Entra em drenagem: nenhum pedido novo é retirado, os em preparo terminam"""
+        self.definir_estado(EstadoExecucao.DRENANDO)
 
     def resetar_encerramento(self):
-        """Reseta flag de encerramento"""
-        self.em_encerramento = False
+        """Volta a executar normalmente"""
+        self.definir_estado(EstadoExecucao.EXECUTANDO)
 
-    def finalizar_pedido(self, pedido_id: int) -> bool:
-        """Finaliza pedido (thread-safe)"""
-        for tentativa in range(3):
-            try:
+    def _escrever_trabalhador(self, consumidor_id: int, campo: int, valor: int) -> bool:
+        """Grava um campo u32 da entrada do consumidor, sem lock depois do registro"""
+        try:
+            indice = self._trabalhadores.get(consumidor_id)
+            if indice is None or _ENTRADA_TRABALHADOR.unpack_from(
+                    self.buf, self._offset_trabalhador(indice))[0] != consumidor_id:
                 with self.lock:
-                    data = self._read_data_unsafe()
-                    for pedido_dict in data['pedidos']:
-                        if pedido_dict['id'] == pedido_id:
-                            pedido_dict['status'] = PedidoStatus.CONCLUIDO.value
-                            data['stats']['total_processados'] += 1
-                            self._write_data_unsafe(data)
-                            return True
+                    indice = self._entrada_trabalhador_unsafe(consumidor_id)
+                if indice < 0:
                     return False
-            except:
-                if tentativa < 2:
-                    time.sleep(0.1)
-        return False
+            _U32.pack_into(self.buf, self._offset_trabalhador(indice) + campo, valor)
+            return True
+        except Exception as e:
+            print(f"Erro ao atualizar consumidor {consumidor_id}: {e}")
+            return False
 
-    def obter_todos_pedidos(self) -> List[Pedido]:
+    def marcar_ocioso(self, consumidor_id: int) -> bool:
+        """O consumidor não tem mais pedidos em mãos (retirar volta a marcá-lo ocupado)"""
+        return self._escrever_trabalhador(consumidor_id, _OFF_TRABALHADOR_OCUPADO, 0)
+
+    def confirmar_drenagem(self, consumidor_id: int) -> bool:
+        """O consumidor viu a drenagem atual e não tem mais pedidos em mãos"""
+        self.marcar_ocioso(consumidor_id)
+        return self._escrever_trabalhador(consumidor_id, _OFF_TRABALHADOR_EPOCA,
+                                          self.obter_epoca_drenagem() & 0xFFFFFFFF)
+
+    def obter_trabalhadores(self) -> List[dict]:
+        """Consumidores registrados: id, pid, último batimento, ocupado e época confirmada"""
+        cabecalho = self._copiar_consistente(incluir_slots=False, incluir_histogramas=True)[0]
+        trabalhadores = []
+        for indice in range(MAX_TRABALHADORES):
+            cid, pid, batimento, ocupado, epoca = _ENTRADA_TRABALHADOR.unpack_from(
+                cabecalho, _OFF_TRABALHADORES + indice * _ENTRADA_TRABALHADOR.size)
+            if pid:
+                trabalhadores.append({'consumidor_id': cid, 'pid': pid, 'ultimo_batimento': batimento,
+                                      'ocupado': bool(ocupado), 'epoca_confirmada': epoca})
+        return trabalhadores
+
+    def aguardar_drenagem(self, timeout: Optional[float] = None, ao_mudar=None) -> bool:
+        """Bloqueia até não haver pedidos em preparo; False se o timeout expirar
+
+        Acorda a cada conclusão pelo canal de notificação (sem FIFOs, consulta
+        em intervalos de RESOLUCAO_RODA) e devolve à fila, a cada passagem, os
+        pedidos de consumidores que pararam de bater. ``ao_mudar`` recebe a
+        contagem de em preparo sempre que ela muda.
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        try:
+            canal = self.assinar()
+        except (OSError, RuntimeError):
+            canal = None
+        try:
+            ultima = None
+            while True:
+                if canal is not None:
+                    canal.consumir()
+                self.recuperar_pedidos_expirados()
+                em_preparo = self.obter_pedidos_em_preparo()
+                if em_preparo != ultima and ao_mudar is not None:
+                    ao_mudar(em_preparo)
+                ultima = em_preparo
+                if em_preparo == 0:
+                    return True
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                # Acordar ao menos a cada tique da roda para recuperar leases vencidos
+                espera = RESOLUCAO_RODA if restante is None else min(restante, RESOLUCAO_RODA)
+                if canal is not None:
+                    canal.esperar(espera)
+                else:
+                    time.sleep(espera)
+        finally:
+            if canal is not None:
+                canal.cancelar()
+
+    def obter_pedido(self, pedido_id: int) -> Optional[Pedido]:
+        """Busca um pedido residente pelo id em O(1)"""
         try:
             with self.lock:
-                data = self._read_data_unsafe()
-                return [Pedido.from_dict(p) for p in data['pedidos']]
+                self._sincronizar_mapeamentos()
+                slot = self._localizar_unsafe(pedido_id)
+                return self._ler_slot(slot) if slot >= 0 else None
+        except:
+            return None
+
+    def atualizar_pedido(self, pedido_id: int, status: Optional[str] = None,
+                         consumidor_id: Optional[int] = None,
+                         timestamp: Optional[float] = None) -> bool:
+        """Atualiza status, consumidor e/ou timestamp do pedido no próprio slot (thread-safe)
+
+        Só grava os campos informados. Mudar o status move o slot entre os
+        índices: voltar para Pendente recoloca o pedido no fim da fila.
+        """
+        codigo = None if status is None else _STATUS_PARA_CODIGO[status]
+        try:
+            with self._escrita():
+                slot = self._localizar_unsafe(pedido_id)
+                if slot < 0:
+                    return False
+                requeue = codigo == _COD_PENDENTE and self._status_slot(slot) != _COD_PENDENTE
+                self._atualizar_slot_unsafe(slot, codigo, consumidor_id, timestamp)
+
+            if requeue:
+                self.nao_vazio.liberar()
+            return True
+        except:
+            return False
+
+    def _finalizar_unsafe(self, pedido_id: int, consumidor_id: Optional[int] = None) -> bool:
+        # Apenas pedidos já retirados podem ser finalizados
+        slot = self._localizar_unsafe(pedido_id)
+        if slot < 0 or self._status_slot(slot) == _COD_PENDENTE:
+            return False
+        # Lease perdido: o pedido voltou à fila e pode estar com outro consumidor
+        if consumidor_id is not None and self._ler_i32_slot(slot, _OFF_SLOT_CONSUMIDOR) != consumidor_id:
+            return False
+        self._atualizar_slot_unsafe(slot, _COD_CONCLUIDO)
+        return True
+
+    def finalizar_pedido(self, pedido_id: int, consumidor_id: Optional[int] = None) -> bool:
+        """Finaliza pedido (thread-safe); com consumidor_id, só se ele ainda detém o pedido"""
+        return self.finalizar_pedidos([pedido_id], consumidor_id) == 1
+
+    def finalizar_pedidos(self, pedido_ids: List[int], consumidor_id: Optional[int] = None) -> int:
+        """Finaliza vários pedidos em uma única seção crítica; retorna quantos finalizou"""
+        finalizados = 0
+        try:
+            with self._escrita():
+                for pedido_id in pedido_ids:
+                    if self._finalizar_unsafe(pedido_id, consumidor_id):
+                        finalizados += 1
+        except Exception as e:
+            print(f"Erro ao finalizar pedidos ({finalizados} de {len(pedido_ids)} finalizados): {e}")
+        return finalizados
+
+    def batimento(self, consumidor_id: int) -> bool:
+        """Registra que o consumidor está vivo, renovando os leases dos seus pedidos
+
+        Só a primeira chamada de cada consumidor usa o lock (para registrá-lo
+        na tabela); as demais gravam o instante na sua entrada, sem lock.
+        """
+        try:
+            indice = self._trabalhadores.get(consumidor_id)
+            if indice is None or _ENTRADA_TRABALHADOR.unpack_from(
+                    self.buf, self._offset_trabalhador(indice))[0] != consumidor_id:
+                with self.lock:
+                    indice = self._entrada_trabalhador_unsafe(consumidor_id)
+                if indice < 0:
+                    return False
+            _F64.pack_into(self.buf, self._offset_trabalhador(indice) + _OFF_TRABALHADOR_BATIMENTO, time.time())
+            return True
+        except Exception as e:
+            print(f"Erro ao registrar batimento: {e}")
+            return False
+
+    def manter_batimentos(self, consumidor_id: int, intervalo: Optional[float] = None):
+        """Envia batimentos do consumidor a cada ``intervalo`` segundos em uma thread, até close()"""
+        intervalo = intervalo or self.INTERVALO_BATIMENTO
+        parar = self._parar_batimentos
+
+        def bater():
+            while not parar.wait(intervalo):
+                if self.buf is None or not self.batimento(consumidor_id):
+                    break
+
+        self.batimento(consumidor_id)
+        thread = threading.Thread(target=bater, daemon=True)
+        thread.start()
+        self._threads_batimento.append(thread)
+
+    def recuperar_pedidos_expirados(self) -> int:
+        """Devolve à fila os pedidos cujo lease venceu sem batimento do consumidor
+
+        Chamado pelos próprios consumidores ao retirar pedidos; útil também
+        para quem espera pedidos em preparo terminarem sem haver consumidores.
+        """
+        try:
+            if not self._roda_atrasada():
+                return 0
+            with self._escrita():
+                recuperados = self._recuperar_expirados_unsafe()
+        except Exception as e:
+            print(f"Erro ao recuperar pedidos expirados: {e}")
+            return 0
+        self.nao_vazio.liberar(recuperados)
+        return recuperados
+
+    def obter_versao(self) -> int:
+        """Retorna o contador do seqlock (muda a cada mutação)"""
+        return self._ler_u64(_OFF_SEQ)
+
+    @staticmethod
+    def _mudancas_validas(desde: Optional[int], fim: int, base: int) -> bool:
+        return desde is not None and max(base, fim - CAPACIDADE_MUDANCAS) <= desde <= fim
+
+    def _ler_mudancas(self, desde: int, fim: int) -> List[Mudanca]:
+        mudancas = []
+        for seq in range(desde, fim):
+            campos = _ENTRADA_MUDANCA.unpack_from(
+                self.buf, _OFF_ANEL_MUDANCAS + (seq % CAPACIDADE_MUDANCAS) * _ENTRADA_MUDANCA.size)
+            _, pedido_id, timestamp, mesa, produtor_id, consumidor_id, status, anterior, item = campos
+            mudancas.append(Mudanca(seq, pedido_id, timestamp, mesa, item.rstrip(b'\0').decode('utf-8', 'ignore'),
+                                    _CODIGO_PARA_STATUS.get(status), _CODIGO_PARA_STATUS.get(anterior),
+                                    produtor_id, consumidor_id))
+        return mudancas
+
+    def obter_mudancas(self, desde: Optional[int] = None):
+        """Retorna (cursor, mudanças desde o cursor ``desde``), sem lock
+
+        O custo é proporcional ao número de mudanças, não ao de pedidos. As
+        mudanças vêm como None quando ``desde`` é None, anterior a um
+        ``limpar()`` ou mais antigo que as CAPACIDADE_MUDANCAS últimas
+        mudanças: aí é preciso ressincronizar com ``obter_instantaneo`` e
+        continuar a partir do cursor devolvido.
+        """
+        for _ in range(self.TENTATIVAS_LEITURA):
+            seq = _U64.unpack_from(self.buf, _OFF_SEQ)[0]
+            if seq & 1:
+                time.sleep(0)
+                continue
+            fim, base = _CABECALHO_MUDANCAS.unpack_from(self.buf, _OFF_MUDANCAS)
+            mudancas = self._ler_mudancas(desde, fim) if self._mudancas_validas(desde, fim, base) else None
+            if _U64.unpack_from(self.buf, _OFF_SEQ)[0] == seq:
+                return fim, mudancas
+
+        with self.lock:
+            fim, base = _CABECALHO_MUDANCAS.unpack_from(self.buf, _OFF_MUDANCAS)
+            return fim, self._ler_mudancas(desde, fim) if self._mudancas_validas(desde, fim, base) else None
+
+    def obter_instantaneo(self, recentes: Optional[int] = None):
+        """Retorna (estatísticas, pedidos) de uma mesma versão, sem lock
+
+        Os pedidos em andamento vêm da arena e os concluídos do arquivo em
+        disco; ``recentes`` limita quantos concluídos (os mais novos) entram.
+        """
+        cabecalho, blocos = self._copiar_consistente()
+        ativos = self._pedidos_de(cabecalho, blocos)
+        return self._estatisticas_de(cabecalho), self._mesclar_arquivados(ativos, recentes)
+
+    def obter_pedidos_ativos(self) -> List[Pedido]:
+        """Pedidos pendentes e em preparo, em ordem de chegada (sem lock)"""
+        cabecalho, blocos = self._copiar_consistente()
+        return self._pedidos_de(cabecalho, blocos)
+
+    def total_arquivados(self) -> int:
+        """Quantidade de pedidos concluídos no arquivo em disco"""
+        return len(self.arquivo)
+
+    def obter_pedidos_arquivados(self, inicio: int = 0, fim: Optional[int] = None) -> List[Pedido]:
+        """Pedidos concluídos [inicio, fim) do arquivo, em ordem de conclusão"""
+        try:
+            return [self._pedido_arquivado(registro) for registro in self.arquivo.ler(inicio, fim)]
+        except Exception as e:
+            print(f"Erro ao ler arquivo de pedidos: {e}")
+            return []
+
+    def _ativos_filtrados(self, cabecalho, blocos, status: Optional[str], filtros: dict,
+                          ordem: str) -> List[tuple]:
+        """(chave, id, slot) dos pendentes e em preparo de uma cópia da arena que casam com os filtros
+
+        Percorre as listas de status (a de pendentes do item, se filtrado por
+        item) e confere os campos no prefixo do slot, sem montar o Pedido.
+        """
+        codigos = [_COD_PENDENTE, _COD_EM_PREPARO] if status is None else \
+            [_STATUS_PARA_CODIGO[status]] if _STATUS_PARA_CODIGO[status] in _LISTAS_STATUS else []
+        dados_item = _codificar_item(filtros['item']) if 'item' in filtros else None
+        # Posição de cada campo em _SLOT_PREFIXO
+        conferir = [({'mesa': 1, 'produtor_id': 4, 'consumidor_id': 5}[campo], valor)
+                    for campo, valor in filtros.items() if campo != 'item']
+        posicao_chave = 2 if ordem == 'tempo' else 0
+        encontrados = []
+        for codigo in codigos:
+            off_cabeca, campo_prox = _LISTAS_STATUS[codigo][0], _OFF_SLOT_PROX
+            if codigo == _COD_PENDENTE and dados_item is not None:
+                # Pendentes de um item: a lista do próprio item
+                off_cabeca = None
+                for indice in range(MAX_ITENS):
+                    nome, cabeca = _ENTRADA_ITEM.unpack_from(cabecalho, self._offset_item(indice))[:2]
+                    if nome.rstrip(b'\0') == dados_item:
+                        slot, campo_prox = cabeca, _OFF_SLOT_IPROX
+                        break
+                else:
+                    continue
+            if off_cabeca is not None:
+                slot = _I32.unpack_from(cabecalho, off_cabeca)[0]
+            while slot != _NENHUM:
+                buf, offset = self._local(slot, blocos)
+                campos = _SLOT_PREFIXO.unpack_from(buf, offset)
+                if all(campos[posicao] == valor for posicao, valor in conferir) and \
+                        (dados_item is None or campos[6].rstrip(b'\0') == dados_item):
+                    encontrados.append((campos[posicao_chave], campos[0], slot))
+                slot = _I32.unpack_from(buf, offset + campo_prox)[0]
+        return encontrados
+
+    def consultar_pedidos(self, filtros: Optional[dict] = None, status: Optional[str] = None,
+                          ordem: str = 'tempo', decrescente: bool = True,
+                          inicio: int = 0, quantidade: int = 50):
+        """Janela [inicio, inicio + quantidade) dos pedidos que satisfazem os filtros
+
+        Retorna (total que satisfaz, pedidos da janela). ``filtros`` aceita
+        mesa, item, produtor_id e consumidor_id; ``ordem`` é 'tempo'
+        (criação) ou 'id'. Os concluídos vêm do arquivo pelos índices
+        secundários (``IndiceArquivo``); pendentes e em preparo, das listas de
+        status e de item de uma cópia da arena. Nenhum dos dois lados percorre
+        todos os pedidos: o custo depende dos que casam com os filtros e do
+        tamanho da janela, não da posição dela.
+        """
+        filtros = {campo: valor for campo, valor in (filtros or {}).items() if valor is not None}
+        for campo in filtros:
+            if campo not in CAMPOS_INDEXADOS:
+                raise ValueError(f"Campo sem índice: {campo}")
+        if ordem not in ORDENS:
+            raise ValueError(f"ordem deve ser uma de {ORDENS}")
+
+        # Um pedido arquivado depois do início da cópia aparece nos dois lados: vale o arquivo
+        arquivados_antes = len(self.arquivo)
+        cabecalho, blocos = self._copiar_consistente(incluir_histogramas=True)
+        ativos = self._ativos_filtrados(cabecalho, blocos, status, filtros, ordem)
+        with self._trava_indice:
+            if self._indice_arquivo is None:
+                self._indice_arquivo = IndiceArquivo(self.arquivo)
+            indice = self._indice_arquivo
+            if status in (None, PedidoStatus.CONCLUIDO.value):
+                posicoes = indice.consultar(filtros, ordem)
+            else:
+                posicoes = []
+            recentes = set(indice.ids[arquivados_antes:indice.total])
+            if recentes:
+                ativos = [ativo for ativo in ativos if ativo[1] not in recentes]
+            ativos.sort()
+
+            total = len(ativos) + len(posicoes)
+            inicio = max(0, inicio)
+            fim = min(total, inicio + quantidade)
+            if decrescente:
+                inicio, fim = total - fim, total - inicio
+            janela = _janela_mesclada([ativo[0] for ativo in ativos], posicoes,
+                                      indice.chave(ordem), inicio, fim)
+            registros = iter(self.arquivo.ler_posicoes([valor for ativo, valor in janela if not ativo]))
+        pedidos = [self._ler_slot(ativos[valor][2], blocos) if ativo else self._pedido_arquivado(next(registros))
+                   for ativo, valor in janela]
+        if decrescente:
+            pedidos.reverse()
+        return total, pedidos
+
+    def obter_itens(self) -> List[str]:
+        """Nomes de itens já vistos (na arena ou no arquivo), para filtros"""
+        cabecalho = self._copiar_consistente(incluir_slots=False, incluir_histogramas=True)[0]
+        nomes = [_ENTRADA_ITEM.unpack_from(cabecalho, self._offset_item(indice))[0].rstrip(b'\0')
+                 .decode('utf-8', 'ignore') for indice in range(MAX_ITENS)]
+        return sorted(set(nome for nome in nomes if nome) | set(self.arquivo.nomes_itens()))
+
+    def obter_todos_pedidos(self) -> List[Pedido]:
+        try:
+            return self.obter_instantaneo()[1]
         except:
             return []
 
     def obter_estatisticas(self) -> dict:
         try:
-            with self.lock:
-                data = self._read_data_unsafe()
-                return data['stats']
+            return self._estatisticas_de(self._copiar_consistente(incluir_slots=False)[0])
         except:
-            return {'total_criados': 0, 'total_processados': 0, 'em_fila': 0}
+            return {'total_criados': 0, 'total_processados': 0, 'em_fila': 0, 'em_preparo': 0,
+                    'prazos_perdidos': 0, 'concluidos_com_prazo': 0, 'pedidos_recuperados': 0,
+                    'falhas_arquivo': 0}
 
-    def cancelar_pedidos_pendentes(self):
-        """Cancela todos os pedidos pendentes"""
-        try:
-            with self.lock:
-                data = self._read_data_unsafe()
+    def obter_histogramas(self) -> dict:
+        """Histogramas de espera, preparo e total de uma mesma versão (em µs, sem lock)
 
-                # Contar pendentes antes
-                pendentes_antes = len([p for p in data['pedidos']
-                                       if p['status'] == PedidoStatus.PENDENTE.value])
+        Cada um é um dict com 'amostras', 'soma', 'maximo' e a lista 'baldes';
+        ``percentis_histograma`` converte em percentis.
+        """
+        cabecalho = self._copiar_consistente(incluir_slots=False, incluir_histogramas=True)[0]
+        histogramas = {}
+        for indice, nome in enumerate(HISTOGRAMAS):
+            base = _OFF_HISTOGRAMAS + indice * _TAMANHO_HISTOGRAMA
+            amostras, soma, maximo = _HISTOGRAMA.unpack_from(cabecalho, base)
+            baldes = list(_BALDES.unpack_from(cabecalho, base + _HISTOGRAMA.size))
+            histogramas[nome] = {'amostras': amostras, 'soma': soma, 'maximo': maximo, 'baldes': baldes}
+        return histogramas
 
-                # Remover pedidos pendentes
-                data['pedidos'] = [p for p in data['pedidos']
-                                   if p['status'] != PedidoStatus.PENDENTE.value]
+    def obter_percentis(self, pontos=(50, 95, 99)) -> dict:
+        """Percentis (em segundos) da espera na fila, do preparo e da latência total"""
+        try:
+            return {nome: percentis_histograma(histograma, pontos)
+                    for nome, histograma in self.obter_histogramas().items()}
+        except Exception as e:
+            print(f"Erro ao obter percentis: {e}")
+            return {nome: percentis_histograma({'amostras': 0}, pontos) for nome in HISTOGRAMAS}
 
-                # Atualizar estatística
-                data['stats']['em_fila'] = 0
+    def obter_ocupacao(self) -> dict:
+        """Retorna slots ocupados, capacidade atual e máxima da arena"""
+        cabecalho = self._copiar_consistente(incluir_slots=False)[0]
+        return {
+            'ocupados': _U64.unpack_from(cabecalho, _OFF_OCUPADOS)[0],
+            'capacidade': _U32.unpack_from(cabecalho, _OFF_NUM_SEGMENTOS)[0] * self.slots_por_segmento,
+            'capacidade_maxima': self.max_segmentos * self.slots_por_segmento
+        }
 
-                self._write_data_unsafe(data)
-                return pendentes_antes
+    def cancelar_pedidos_pendentes(self):
+        """Cancela todos os pedidos pendentes"""
+        try:
+            with self._escrita():
+                pendentes_antes = self._ler_u64(_OFF_EM_FILA)
+                slot = self._ler_i32(_OFF_PENDENTES_CABECA)
+                while slot != _NENHUM:
+                    self._transicionar_unsafe(slot, _STATUS_VAZIO)
+                    slot = self._ler_i32(_OFF_PENDENTES_CABECA)
+
+            # Descartar as fichas dos pedidos cancelados
+            self.nao_vazio.tentar_adquirir(pendentes_antes)
+            return pendentes_antes
         except:
             return 0
 
     def obter_pedidos_em_preparo(self):
         """Retorna quantidade de pedidos em preparo"""
         try:
-            with self.lock:
-                data = self._read_data_unsafe()
-                return len([p for p in data['pedidos']
-                            if p['status'] == PedidoStatus.EM_PREPARO.value])
+            return _U64.unpack_from(self._copiar_consistente(incluir_slots=False)[0], _OFF_EM_PREPARO)[0]
         except:
             return 0
 
     def limpar(self):
         """Limpa todos os pedidos da memória compartilhada"""
         try:
-            with self.lock:
-                self._write_data_unsafe({
-                    'pedidos': [],
-                    'stats': {
-                        'total_criados': 0,
-                        'total_processados': 0,
-                        'em_fila': 0
-                    }
-                })
+            with self._escrita():
+                # Os segmentos já criados continuam na arena, agora todos livres
+                for offset in (_OFF_TOTAL_CRIADOS, _OFF_TOTAL_PROCESSADOS, _OFF_EM_FILA,
+                               _OFF_EM_PREPARO, _OFF_OCUPADOS, _OFF_PRAZOS_PERDIDOS,
+                               _OFF_CONCLUIDOS_COM_PRAZO, _OFF_RECUPERADOS, _OFF_FALHAS_ARQUIVO):
+                    self._escrever_u64(offset, 0)
+                self._escrever_u32(_OFF_TAMANHO_HEAP, 0)
+                # Histogramas zerados; a tabela de batimentos continua (consumidores seguem vivos)
+                self.buf[_OFF_HISTOGRAMAS:_OFF_TRABALHADORES] = bytes(_OFF_TRABALHADORES - _OFF_HISTOGRAMAS)
+                self._esvaziar_roda_unsafe()
+                # Pular uma sequência invalida todos os cursores anteriores: quem
+                # acompanha o feed ressincroniza, mesmo sem mudanças depois da limpeza
+                base = self._ler_u64(_OFF_MUDANCAS_SEQ) + 1
+                _CABECALHO_MUDANCAS.pack_into(self.buf, _OFF_MUDANCAS, base, base)
+                # O bloco de controle (estado e época de drenagem) também continua
+                self.buf[_OFF_ITENS:_OFF_CONTROLE] = bytes(_OFF_CONTROLE - _OFF_ITENS)
+                self._itens.clear()
+                for offset in (_OFF_PENDENTES_CABECA, _OFF_PENDENTES_CAUDA, _OFF_PREPARO_CABECA,
+                               _OFF_PREPARO_CAUDA, _OFF_HISTORICO_CABECA, _OFF_HISTORICO_CAUDA):
+                    self._escrever_i32(offset, _NENHUM)
+                self._escrever_i32(_OFF_LIVRES_CABECA, _NENHUM)
+
+                # Zerar cada segmento com uma única cópia de fatia e refazer a pilha de livres
+                for indice in range(len(self._bufs) - 1, -1, -1):
+                    self._bufs[indice][:] = bytes(len(self._bufs[indice]))
+                    self._empilhar_livres_unsafe(indice)
+
+                self._buf_hash[:] = bytes(len(self._buf_hash))
+                self.arquivo.limpar()
             return True
         except Exception as e:
             print(f"Erro ao limpar memória: {e}")
             return False
 
     def close(self):
+        self._parar_batimentos.set()
+        # Sem batimento em andamento, que registraria a entrada de novo
+        for thread in self._threads_batimento:
+            thread.join(timeout=self.INTERVALO_BATIMENTO)
+        self._threads_batimento = []
+        if self._trabalhadores and self.buf is not None:
+            self._liberar_trabalhadores()
+        self.nao_vazio.close()
+        self.arquivo.close()
+        for fd in self._fds_assinantes.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._fds_assinantes = {}
+        if isinstance(self.lock, TravaSegmento):
+            self.lock.close()
+
+        # Os objetos continuam referenciados para que unlink() funcione após close()
+        self._buf_hash = None
+        self._bufs = []
+        for segmento in self._segmentos + [self._shm_hash]:
+            if segmento is not None:
+                try:
+                    segmento.close()
+                except:
+                    pass
+
         if self.shm:
             try:
+                # Liberar a memoryview antes de fechar o mapeamento
+                self.buf = None
                 self.shm.close()
             except:
                 pass
 
     def unlink(self):
+        # O arquivo de pedidos concluídos fica em disco até a próxima criação da arena
+        # Remover também os segmentos de slots e a tabela hash registrados no diretório
+        if self.shm and self.buf is not None:
+            try:
+                with self.lock:
+                    self._sincronizar_mapeamentos()
+            except:
+                pass
+        for segmento in self._segmentos:
+            try:
+                segmento.unlink()
+            except:
+                pass
+        if self._shm_hash is not None:
+            try:
+                self._shm_hash.unlink()
+            except:
+                pass
+
         if self.shm:
             try:
                 self.shm.unlink()
             except:
                 pass
+        self.nao_vazio.unlink()
+        if isinstance(self.lock, TravaSegmento):
+            self.lock.unlink()
@@ -0,0 +1,85 @@
+"""
+Partida dos processos de trabalho (produtores e consumidores)
+
+Os processos são criados todos de uma vez, a partir de um contexto que evita
+reimportar os módulos do sistema em cada processo: ``forkserver`` com esses
+módulos pré-carregados no servidor quando a plataforma oferece, senão
+``fork``, senão ``spawn``. Cada trabalhador recebe a mesma barreira de
+largada: anexa-se à memória compartilhada e espera nela. O supervisor é a
+última parte da barreira, então o relógio da execução só começa quando todos
+estão prontos.
+"""
+import multiprocessing
+import threading
+import time
+from typing import List, Optional
+
+# Módulos carregados uma única vez no forkserver e herdados pelos processos
+MODULOS_PRECARREGADOS = ['__main__', 'shared_memory_manager', 'sharded_memory_manager',
+                         'producer', 'consumer']
+
+
+def contexto_processos():
+    """Contexto multiprocessing mais rápido disponível para criar trabalhadores"""
+    metodos = multiprocessing.get_all_start_methods()
+    if 'forkserver' in metodos:
+        contexto = multiprocessing.get_context('forkserver')
+        contexto.set_forkserver_preload(MODULOS_PRECARREGADOS)
+        return contexto
+    return multiprocessing.get_context('fork' if 'fork' in metodos else 'spawn')
+
+
+def aguardar_largada(largada, timeout: Optional[float] = None) -> bool:
+    """Espera na barreira de largada (no trabalhador); False se ela foi rompida
+
+    Sem barreira (processo iniciado à mão) retorna imediatamente.
+    """
+    if largada is None:
+        return True
+    try:
+        largada.wait(timeout)
+        return True
+    except threading.BrokenBarrierError:
+        return False
+
+
+class Supervisor:
+    # Tempo máximo esperando todos os trabalhadores se anexarem
+    TIMEOUT_LARGADA = 10.0
+
+    def __init__(self, contexto=None):
+        self.contexto = contexto if contexto else contexto_processos()
+        self.inicio_execucao = None
+
+    def preparar(self):
+        """Sobe o forkserver antes da primeira partida (carregando os módulos uma vez)"""
+        if self.contexto.get_start_method() == 'forkserver':
+            from multiprocessing import forkserver
+            forkserver.ensure_running()
+
+    def iniciar(self, trabalhadores: List[tuple], timeout: Optional[float] = None) -> List:
+        """Inicia os trabalhadores em paralelo e espera todos ficarem prontos
+
+        ``trabalhadores`` é uma lista de (alvo, args, kwargs); cada alvo recebe
+        a barreira no argumento ``largada`` e deve chamar ``aguardar_largada``
+        depois de se anexar. Retorna os processos, na mesma ordem. Se algum
+        não ficar pronto no prazo, a barreira é rompida e os demais seguem.
+        """
+        if not trabalhadores:
+            return []
+
+        largada = self.contexto.Barrier(len(trabalhadores) + 1)
+        processos = []
+        for alvo, args, kwargs in trabalhadores:
+            processo = self.contexto.Process(target=alvo, args=args, kwargs=dict(kwargs, largada=largada))
+            processo.start()
+            processos.append(processo)
+
+        try:
+            largada.wait(self.TIMEOUT_LARGADA if timeout is None else timeout)
+        except threading.BrokenBarrierError:
+            largada.abort()
+            prontos = len(trabalhadores) - sum(1 for processo in processos if not processo.is_alive())
+            print(f"⚠️  Nem todos os processos ficaram prontos a tempo ({prontos}/{len(trabalhadores)} vivos)")
+        self.inicio_execucao = time.time()
+        return processos
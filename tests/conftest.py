@@ -0,0 +1,32 @@
+"""Fixtures dos testes (executar a partir da raiz do repositório: python -m pytest)"""
+import glob
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_memory_manager import SharedMemoryManager  # noqa: E402
+
+
+@pytest.fixture
+def criar_arena():
+    """Fábrica de arenas com nome único; fecha e remove tudo (segmentos, lock, arquivo) no fim"""
+    arenas = []
+
+    def criar(**kwargs):
+        nome = f"teste_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        arena = SharedMemoryManager(nome, create=True, **kwargs)
+        arenas.append(arena)
+        return arena
+
+    yield criar
+
+    for arena in arenas:
+        arena.close()
+        arena.unlink()
+        for caminho in glob.glob(os.path.join(tempfile.gettempdir(), f"{arena.name}.*")):
+            os.remove(caminho)
@@ -0,0 +1,260 @@
+"""Testes da arena de pedidos: fila, leases, índice hash, políticas, feed de mudanças e consultas"""
+import time
+
+import pytest
+
+from shared_memory_manager import RESOLUCAO_RODA, Pedido, PedidoStatus, PoliticaDespacho, SharedMemoryManager
+
+PENDENTE = PedidoStatus.PENDENTE.value
+EM_PREPARO = PedidoStatus.EM_PREPARO.value
+CONCLUIDO = PedidoStatus.CONCLUIDO.value
+
+
+def pedido(pedido_id, item='Pizza', timestamp=None, mesa=1, **kwargs):
+    return Pedido(pedido_id, mesa, item, time.time() if timestamp is None else timestamp, PENDENTE, 1, **kwargs)
+
+
+def ids(pedidos):
+    return [p.id for p in pedidos]
+
+
+# --- Fila: adicionar, retirar e finalizar ---
+
+def test_retirar_e_finalizar_em_ordem_de_chegada(criar_arena):
+    arena = criar_arena()
+    assert arena.adicionar_pedidos([pedido(i) for i in (1, 2, 3)]) == 3
+
+    retirados = arena.obter_proximos_pedidos(7, 2)
+    assert ids(retirados) == [1, 2]
+    assert all(p.status == EM_PREPARO and p.consumidor_id == 7 for p in retirados)
+
+    assert arena.finalizar_pedidos([1, 2], 7) == 2
+    stats = arena.obter_estatisticas()
+    assert (stats['total_criados'], stats['total_processados'], stats['em_fila'], stats['em_preparo']) == \
+        (3, 2, 1, 0)
+    # Concluídos saem da arena para o arquivo
+    assert arena.obter_pedido(1) is None
+    assert ids(arena.obter_pedidos_arquivados()) == [1, 2]
+    assert arena.obter_pedido(3).status == PENDENTE
+
+
+def test_finalizar_exige_pedido_retirado_pelo_mesmo_consumidor(criar_arena):
+    arena = criar_arena()
+    arena.adicionar_pedidos([pedido(1), pedido(2)])
+    arena.obter_proximo_pedido(7)
+
+    assert arena.finalizar_pedido(1, consumidor_id=8) is False
+    assert arena.finalizar_pedido(2, consumidor_id=7) is False
+    assert arena.finalizar_pedido(1, consumidor_id=7) is True
+    assert arena.finalizar_pedido(1, consumidor_id=7) is False
+
+
+def test_fila_vazia_nao_retira(criar_arena):
+    arena = criar_arena()
+    assert arena.obter_proximos_pedidos(1, 5) == []
+    assert arena.aguardar_pedidos(1, 5, timeout=0.05) == []
+
+
+# --- Leases: vencimento e recuperação ---
+
+def esperar_vencimento(arena, segundos):
+    """Espera o lease vencer e a roda avançar para a casa seguinte"""
+    time.sleep(segundos + 2 * RESOLUCAO_RODA)
+    return arena.recuperar_pedidos_expirados()
+
+
+def test_lease_vencido_volta_para_a_fila(criar_arena):
+    arena = criar_arena(duracao_lease=0.2)
+    arena.adicionar_pedidos([pedido(1)])
+    assert ids(arena.obter_proximos_pedidos(7, 1)) == [1]
+
+    assert esperar_vencimento(arena, 0.2) == 1
+    recuperado = arena.obter_pedido(1)
+    assert (recuperado.status, recuperado.consumidor_id) == (PENDENTE, -1)
+    assert arena.obter_estatisticas()['pedidos_recuperados'] == 1
+
+    # Outro consumidor assume; o antigo perdeu o lease e não finaliza mais
+    assert ids(arena.obter_proximos_pedidos(8, 1)) == [1]
+    assert arena.finalizar_pedido(1, consumidor_id=7) is False
+    assert arena.finalizar_pedido(1, consumidor_id=8) is True
+
+
+def test_batimentos_renovam_o_lease(criar_arena):
+    arena = criar_arena(duracao_lease=0.2)
+    arena.adicionar_pedidos([pedido(1)])
+    arena.obter_proximos_pedidos(7, 1)
+
+    limite = time.monotonic() + 1.0
+    while time.monotonic() < limite:
+        assert arena.batimento(7)
+        assert arena.recuperar_pedidos_expirados() == 0
+        time.sleep(0.05)
+    assert arena.obter_pedido(1).status == EM_PREPARO
+
+    # Sem batimentos, vence
+    assert esperar_vencimento(arena, 0.2) == 1
+
+
+def test_close_libera_a_entrada_do_consumidor(criar_arena):
+    arena = criar_arena()
+    consumidor = SharedMemoryManager(arena.name, create=False)
+    consumidor.manter_batimentos(7, intervalo=0.05)
+    assert [t['consumidor_id'] for t in arena.obter_trabalhadores()] == [7]
+    consumidor.close()
+    assert arena.obter_trabalhadores() == []
+
+
+# --- Índice hash id -> slot ---
+
+def test_hash_encontra_residentes_depois_de_remocoes(criar_arena):
+    # Arena pequena: a tabela hash fica com cadeias de sondagem longas
+    arena = criar_arena(capacidade_inicial=64, slots_por_segmento=64, capacidade_maxima=64)
+    total = 48
+    arena.adicionar_pedidos([pedido(i * 1024) for i in range(1, total + 1)])
+    arena.obter_proximos_pedidos(7, total)
+
+    removidos = {i * 1024 for i in range(1, total + 1) if i % 3 != 0}
+    assert arena.finalizar_pedidos(sorted(removidos), 7) == len(removidos)
+
+    for i in range(1, total + 1):
+        encontrado = arena.obter_pedido(i * 1024)
+        if i * 1024 in removidos:
+            assert encontrado is None
+        else:
+            assert encontrado is not None and encontrado.id == i * 1024
+    with arena.lock:
+        assert all(arena._hash_buscar(pedido_id) < 0 for pedido_id in removidos)
+
+
+def test_slots_liberados_sao_reaproveitados(criar_arena):
+    arena = criar_arena(capacidade_inicial=8, slots_por_segmento=8, capacidade_maxima=8)
+    for rodada in range(5):
+        base = rodada * 100
+        assert arena.adicionar_pedidos([pedido(base + i) for i in range(8)]) == 8
+        assert arena.adicionar_pedido(pedido(base + 99)) is False
+        arena.obter_proximos_pedidos(1, 8)
+        assert arena.finalizar_pedidos([base + i for i in range(8)], 1) == 8
+    assert len(arena.obter_pedidos_arquivados()) == 40
+
+
+# --- Políticas de despacho ---
+
+def test_prioridade_maior_primeiro_e_empate_pela_chegada(criar_arena):
+    arena = criar_arena(politica=PoliticaDespacho.PRIORIDADE)
+    agora = time.time()
+    arena.adicionar_pedidos([pedido(1, timestamp=agora, prioridade=1),
+                             pedido(2, timestamp=agora + 1, prioridade=5),
+                             pedido(3, timestamp=agora + 2, prioridade=3),
+                             pedido(4, timestamp=agora + 3, prioridade=5)])
+    assert [arena.obter_proximo_pedido(1).id for _ in range(4)] == [2, 4, 3, 1]
+
+
+def test_edf_prazo_mais_proximo_primeiro(criar_arena):
+    arena = criar_arena(politica=PoliticaDespacho.EDF)
+    agora = time.time()
+    arena.adicionar_pedidos([pedido(1, timestamp=agora, deadline=agora + 30),
+                             pedido(2, timestamp=agora + 1),
+                             pedido(3, timestamp=agora + 2, deadline=agora + 10),
+                             pedido(4, timestamp=agora + 3, deadline=agora - 1),
+                             pedido(5, timestamp=agora + 4, deadline=agora + 20)])
+    # Prazo já perdido vai junto com os sem prazo, pela chegada
+    assert [arena.obter_proximo_pedido(1).id for _ in range(5)] == [3, 5, 1, 2, 4]
+
+
+def test_trocar_politica_reordena_pendentes(criar_arena):
+    arena = criar_arena()
+    agora = time.time()
+    arena.adicionar_pedidos([pedido(1, timestamp=agora, prioridade=0),
+                             pedido(2, timestamp=agora + 1, prioridade=9)])
+    assert arena.definir_politica(PoliticaDespacho.PRIORIDADE)
+    assert arena.obter_proximo_pedido(1).id == 2
+
+
+# --- Lotes do mesmo item ---
+
+@pytest.mark.parametrize('espera_max, esperado', [(None, [2, 3, 4]), (60.0, [2, 3, 4]), (5.0, [1])])
+def test_lote_mesmo_item_respeita_espera_maxima(criar_arena, espera_max, esperado):
+    arena = criar_arena()
+    agora = time.time()
+    # O mais antigo (Sopa) tem 10 s; Pizza rende o maior lote
+    arena.adicionar_pedidos([pedido(1, 'Sopa', agora - 10)] +
+                            [pedido(i, 'Pizza', agora) for i in (2, 3, 4)])
+    assert ids(arena.obter_lote_mesmo_item(7, 5, espera_max)) == esperado
+
+
+def test_lote_mesmo_item_limita_tamanho(criar_arena):
+    arena = criar_arena()
+    arena.adicionar_pedidos([pedido(i, 'Pizza') for i in range(1, 6)])
+    assert ids(arena.obter_lote_mesmo_item(7, 2)) == [1, 2]
+    assert arena.obter_estatisticas()['em_fila'] == 3
+
+
+# --- Feed de mudanças ---
+
+def test_obter_mudancas_desde_o_cursor(criar_arena):
+    arena = criar_arena()
+    cursor, mudancas = arena.obter_mudancas()
+    assert mudancas is None
+
+    arena.adicionar_pedidos([pedido(1)])
+    arena.obter_proximo_pedido(7)
+    cursor, mudancas = arena.obter_mudancas(cursor)
+    assert [(m.pedido_id, m.anterior, m.status) for m in mudancas] == \
+        [(1, None, PENDENTE), (1, PENDENTE, EM_PREPARO)]
+    assert arena.obter_mudancas(cursor) == (cursor, [])
+
+
+def test_limpar_invalida_cursores(criar_arena):
+    arena = criar_arena()
+    arena.adicionar_pedidos([pedido(1)])
+    cursor, _ = arena.obter_mudancas()
+
+    assert arena.limpar()
+    # Mesmo sem mudanças depois da limpeza, quem tinha cursor precisa ressincronizar
+    novo, mudancas = arena.obter_mudancas(cursor)
+    assert mudancas is None
+    assert arena.obter_mudancas(novo) == (novo, [])
+
+    arena.adicionar_pedidos([pedido(2)])
+    assert [m.pedido_id for m in arena.obter_mudancas(novo)[1]] == [2]
+
+
+# --- Consultas com janela sobre arena e arquivo ---
+
+@pytest.fixture
+def arena_mista(criar_arena):
+    """10 pedidos por ordem de criação: pares concluídos (arquivo), ímpares em preparo ou pendentes"""
+    arena = criar_arena()
+    agora = time.time()
+    arena.adicionar_pedidos([pedido(i, timestamp=agora + i, mesa=i % 2 + 1) for i in range(10)])
+    arena.obter_proximos_pedidos(7, 8)
+    arena.finalizar_pedidos([0, 2, 4, 6], 7)
+    arena.obter_proximos_pedidos(7, 2)
+    arena.finalizar_pedidos([8], 7)
+    return arena
+
+
+def test_consultar_janela_crescente_mistura_arena_e_arquivo(arena_mista):
+    total, pedidos = arena_mista.consultar_pedidos(decrescente=False, inicio=2, quantidade=5)
+    assert total == 10
+    assert ids(pedidos) == [2, 3, 4, 5, 6]
+    assert [p.status for p in pedidos] == [CONCLUIDO, EM_PREPARO, CONCLUIDO, EM_PREPARO, CONCLUIDO]
+
+
+def test_consultar_janela_decrescente(arena_mista):
+    total, pedidos = arena_mista.consultar_pedidos(inicio=0, quantidade=3)
+    assert total == 10
+    assert ids(pedidos) == [9, 8, 7]
+    assert ids(arena_mista.consultar_pedidos(inicio=8, quantidade=5)[1]) == [1, 0]
+
+
+def test_consultar_por_status_e_filtro(arena_mista):
+    total, pedidos = arena_mista.consultar_pedidos(status=CONCLUIDO, decrescente=False, quantidade=50)
+    assert (total, ids(pedidos)) == (5, [0, 2, 4, 6, 8])
+
+    # Mesa 2: ímpares, todos ainda na arena
+    total, pedidos = arena_mista.consultar_pedidos({'mesa': 2}, ordem='id', decrescente=False)
+    assert (total, ids(pedidos)) == (5, [1, 3, 5, 7, 9])
+
+    with pytest.raises(ValueError):
+        arena_mista.consultar_pedidos({'status': CONCLUIDO})